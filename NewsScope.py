@@ -1,48 +1,58 @@
 import os
 import json
-import requests
+import time
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, session
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from flask_session import Session
 from sqlalchemy import text
-import google.generativeai as genai
 from dotenv import load_dotenv
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
-try:
-    import razorpay
-    RAZORPAY_IMPORT_ERROR = None
-except Exception as razorpay_import_error:
-    razorpay = None
-    RAZORPAY_IMPORT_ERROR = razorpay_import_error
 
 # Import database models and auth
-from models import db, User, AnalysisHistory, CreditTransaction, PaymentOrder
-from auth import auth_bp, login_required
+from models import db, User, AnalysisHistory, CreditTransaction, PaymentOrder, PurgeJob
+from auth import auth_bp, login_required, admin_required, current_user_id
+from governor import governor, estimate_tokens, priority_for_user, QuotaWaitTimeout
+from singleflight import singleflight, article_hash, url_key
+from gemini_parser import ANALYSIS_SCHEMA, parse_analysis
+import analysis_cache
+import apikeys
+import archive
+import compression
+import ledger
+import retention
+import response_cache
+import rollups
+import trends
+from search import search_history, SearchError
+from export import stream_history, EXPORT_FORMATS, ExportError
+from history import history_values, save_analyses
+from fetcher import fetch_article, FetchError
+from payments import settle_order, verify_webhook, webhook_payment, PaymentError
+from request_limits import max_body, ANALYZE_MAX_CONTENT_LENGTH
+from serializers import JSONProvider, analysis_rows, transaction_rows, order_rows
+import metrics
+import migrate
+import pools
+import replicas
+import request_limits
+from replicas import read_replica
 
 # Load environment variables
 load_dotenv()
 
 # Initialize Flask app
 app = Flask(__name__)
+app.json = JSONProvider(app)
 
 # Configuration
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-# SQLAlchemy engine options for better connection handling
-app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-    'connect_args': {
-        'connect_timeout': 10,
-        'sslmode': 'require',
-    },
-    'pool_size': 10,
-    'pool_recycle': 3600,  # Recycle connections after 1 hour
-    'pool_pre_ping': True,  # Test connections before using them
-    'pool_timeout': 30,
-}
+# Pool sizes come from the service-wide connection budget (pools.py); reads
+# from @read_replica routes go to the DATABASE_REPLICA_URLS binds
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = pools.engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+app.config['SQLALCHEMY_BINDS'] = replicas.binds()
 
 app.config['SESSION_TYPE'] = 'filesystem'
 app.config['SESSION_PERMANENT'] = True
@@ -61,8 +71,13 @@ else:
 app.config['SESSION_COOKIE_DOMAIN'] = None  # Allow cross-domain cookies
 
 # Initialize extensions
+# First, so its after_request hook runs last, on the final response
+compression.init_app(app)
+request_limits.init_app(app)
 db.init_app(app)
+replicas.init_app(app, db)
 Session(app)
+apikeys.init_app(app)
 
 # Configure Gemini API - moved here for early initialization
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
@@ -72,6 +87,7 @@ print("[NewsScope] Initializing application...")
 print(f"[NewsScope] DATABASE_URL configured: {bool(os.getenv('DATABASE_URL'))}")
 print(f"[NewsScope] GEMINI_API_KEY configured: {bool(GEMINI_API_KEY)}")
 print(f"[NewsScope] Environment: {os.getenv('FLASK_ENV', 'development')}")
+print(f"[NewsScope] Database pool: {pools.describe(app.config['SQLALCHEMY_ENGINE_OPTIONS'])}")
 
 # Enable CORS with credentials
 CORS(app, 
@@ -100,19 +116,21 @@ def initialize_genai():
         raise ValueError("GEMINI_API_KEY not found in environment variables")
     if model is None:
         try:
+            # The SDK takes about half a second to import, so workers load it on first analysis
+            import google.generativeai as genai
             genai.configure(api_key=GEMINI_API_KEY)
-            model = genai.GenerativeModel('gemini-2.5-flash')
+            # Ask for schema-constrained JSON so answers rarely need repair
+            model = genai.GenerativeModel(
+                'gemini-2.5-flash',
+                generation_config={
+                    'response_mime_type': 'application/json',
+                    'response_schema': ANALYSIS_SCHEMA
+                }
+            )
         except Exception as e:
             print(f"Error initializing Gemini API: {e}")
             raise
 
-# Try to initialize on startup, but don't fail
-try:
-    if GEMINI_API_KEY:
-        initialize_genai()
-except Exception as e:
-    print(f"Warning: Gemini API initialization deferred - {e}")
-
 # Configure SendGrid API
 SENDGRID_API_KEY = os.getenv('SENDGRID_API_KEY')
 SENDGRID_FROM_EMAIL = os.getenv('SENDGRID_FROM_EMAIL', 'noreply@newsscope.com')
@@ -122,10 +140,21 @@ SENDGRID_TO_EMAIL = os.getenv('SENDGRID_TO_EMAIL', 'rohillamanas06@gmail.com')
 RAZORPAY_KEY_ID = os.getenv('RAZORPAY_KEY_ID')
 RAZORPAY_KEY_SECRET = os.getenv('RAZORPAY_KEY_SECRET')
 razorpay_client = None
-if razorpay and RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET:
-    razorpay_client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
-elif RAZORPAY_IMPORT_ERROR:
-    print(f"Razorpay import unavailable: {RAZORPAY_IMPORT_ERROR}")
+RAZORPAY_IMPORT_ERROR = None
+
+
+def get_razorpay_client():
+    """Razorpay client, created on first use; None if not configured"""
+    global razorpay_client, RAZORPAY_IMPORT_ERROR
+    if razorpay_client is None and RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET and not RAZORPAY_IMPORT_ERROR:
+        try:
+            import razorpay
+        except Exception as e:
+            RAZORPAY_IMPORT_ERROR = e
+            print(f"Razorpay import unavailable: {e}")
+            return None
+        razorpay_client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
+    return razorpay_client
 
 # Credit packages - Same as ResuAI
 CREDIT_PACKAGES = {
@@ -151,34 +180,11 @@ def get_user_credits(user_id):
 def deduct_credits(user_id, amount, description):
     """Deduct credits from user account and log transaction"""
     try:
-        user = User.query.get(user_id)
-        if not user:
-            return False
-        
-        # Check if user has enough credits
-        if user.credits < amount:
+        # The ledger refuses the deduction if the balance is too low
+        if ledger.post(user_id, 'deduct', amount, description) is None:
+            db.session.rollback()
             return False
-        
-        current_credits = user.credits
-        credits_used = user.credits_used or 0
-        
-        user.credits = current_credits - amount
-        user.credits_used = credits_used + amount
-        
-        # Log transaction
-        transaction = CreditTransaction(
-            user_id=user_id,
-            transaction_type='deduct',
-            credits_amount=amount,
-            credits_before=current_credits,
-            credits_after=user.credits,
-            description=description,
-            created_at=datetime.utcnow()
-        )
-        
-        db.session.add(transaction)
         db.session.commit()
-        
         return True
     except Exception as e:
         print(f"Error deducting credits: {str(e)}")
@@ -186,33 +192,15 @@ def deduct_credits(user_id, amount, description):
         return False
 
 
-def add_credits(user_id, amount, description, payment_id=None, order_id=None, amount_paid=None):
+def add_credits(user_id, amount, description, payment_id=None, order_id=None, amount_paid=None,
+                transaction_type='purchase'):
     """Add credits to user account and log transaction"""
     try:
-        user = User.query.get(user_id)
-        if not user:
+        if ledger.post(user_id, transaction_type, amount, description, payment_id=payment_id,
+                       order_id=order_id, amount_paid=amount_paid) is None:
+            db.session.rollback()
             return False
-        
-        current_credits = user.credits
-        user.credits = current_credits + amount
-        
-        # Log transaction
-        transaction = CreditTransaction(
-            user_id=user_id,
-            transaction_type='purchase',
-            credits_amount=amount,
-            credits_before=current_credits,
-            credits_after=user.credits,
-            description=description,
-            payment_id=payment_id,
-            order_id=order_id,
-            amount_paid=amount_paid,
-            created_at=datetime.utcnow()
-        )
-        
-        db.session.add(transaction)
         db.session.commit()
-        
         return True
     except Exception as e:
         print(f"Error adding credits: {str(e)}")
@@ -353,7 +341,7 @@ class NewsAnalyzer:
             {"name": "PolitiFact", "url": "https://politifact.com", "credibility": "high", "checked": True, "type": "fact-check"}
         ]
     
-    def analyze_with_gemini(self, news_text, headline=""):
+    def analyze_with_gemini(self, news_text, headline="", user_id=None, priority=None):
         """Use Gemini AI to analyze the news for authenticity"""
         try:
             # Ensure Gemini is initialized
@@ -400,52 +388,68 @@ Format your response as JSON with the following structure:
 }}
 """
             
+            # Wait for a slot in the shared RPM/TPM budget
+            estimated_tokens = estimate_tokens(prompt)
+            if priority is None:
+                priority = priority_for_user(user_id)
+            queue_wait = governor.acquire(user_id, estimated_tokens, priority)
+            admitted_at = datetime.utcnow()
+            
             response = model.generate_content(prompt)
+            governor.record_usage(estimated_tokens, self._total_tokens(response), admitted_at)
             response_text = response.text.strip()
             
-            # Try to extract JSON from the response
-            if "```json" in response_text:
-                json_start = response_text.find("```json") + 7
-                json_end = response_text.find("```", json_start)
-                response_text = response_text[json_start:json_end].strip()
-            elif "```" in response_text:
-                json_start = response_text.find("```") + 3
-                json_end = response_text.find("```", json_start)
-                response_text = response_text[json_start:json_end].strip()
-            
-            try:
-                analysis_result = json.loads(response_text)
-            except json.JSONDecodeError:
-                analysis_result = {
-                    "verdict": self._extract_verdict(response_text),
-                    "confidence": 70,
-                    "summary": "AI analysis completed",
-                    "detailed_analysis": response_text,
-                    "red_flags": [],
-                    "verification_suggestions": [],
-                    "key_claims": []
-                }
+            # Tolerates fences, trailing commas and truncated output
+            parse_started = time.perf_counter()
+            analysis_result, parsed = parse_analysis(response_text)
+            metrics.observe('gemini.parse', time.perf_counter() - parse_started)
+            if not parsed:
+                metrics.increment('gemini.parse_failed')
             
+            analysis_result["queue_wait_ms"] = int(queue_wait * 1000)
             return analysis_result
             
+        except QuotaWaitTimeout:
+            raise
         except Exception as e:
             raise Exception(f"Gemini AI analysis failed: {str(e)}")
     
-    def _extract_verdict(self, text):
-        """Extract verdict from unstructured text"""
-        text_upper = text.upper()
-        if "FAKE" in text_upper:
-            return "FAKE"
-        elif "MISLEADING" in text_upper:
-            return "MISLEADING"
-        elif "REAL" in text_upper or "AUTHENTIC" in text_upper or "LEGITIMATE" in text_upper:
-            return "REAL"
-        return "UNCERTAIN"
+    def _total_tokens(self, response):
+        """Read total token usage from a Gemini response when the SDK reports it"""
+        try:
+            usage = getattr(response, 'usage_metadata', None)
+            return getattr(usage, 'total_token_count', None) if usage else None
+        except Exception:
+            return None
     
-    def generate_report(self, news_text, headline="", user_id=None):
+    def generate_report(self, news_text, headline="", user_id=None, save=True, priority=None,
+                        cache_keys=None, cache_source='user', source_url=None):
         """Generate a comprehensive fake news detection report"""
         sources = self.search_news_sources(news_text, headline)
-        ai_analysis = self.analyze_with_gemini(news_text, headline)
+        keys = [article_hash(news_text, headline)]
+        if source_url:
+            # Submissions of the same canonical URL share one analysis
+            keys.insert(0, url_key(source_url))
+        # Articles already analyzed (by a user or the feed watcher) skip Gemini
+        ai_analysis = None
+        for key in keys:
+            ai_analysis = analysis_cache.get(key)
+            if ai_analysis is not None:
+                break
+        cached = ai_analysis is not None
+        coalesced = False
+        if cached:
+            metrics.increment('analysis_cache.hit')
+        else:
+            metrics.increment('analysis_cache.miss')
+            # Identical articles submitted concurrently share one Gemini call;
+            # every caller still gets its own history row below
+            ai_analysis, coalesced = singleflight.do(
+                keys[0],
+                lambda: self.analyze_with_gemini(news_text, headline, user_id, priority)
+            )
+            if not coalesced:
+                analysis_cache.put(keys + list(cache_keys or []), ai_analysis, source=cache_source)
         
         report = {
             "timestamp": datetime.now().isoformat(),
@@ -460,26 +464,17 @@ Format your response as JSON with the following structure:
             "key_claims": ai_analysis.get("key_claims", []),
             "sources_checked": sources,
             "total_sources_checked": len(sources),
-            "ai_model": "Google gemini-2.5-flash"
+            "ai_model": "Google gemini-2.5-flash",
+            "queue_wait_ms": ai_analysis.get("queue_wait_ms", 0),
+            "coalesced": coalesced,
+            "cached": cached,
+            "source_url": source_url
         }
         
         # Save to database if user is logged in
-        if user_id:
+        if user_id and save:
             try:
-                analysis_record = AnalysisHistory(
-                    user_id=user_id,
-                    headline=headline,
-                    news_text=news_text,
-                    verdict=report['verdict'],
-                    confidence=report['confidence'],
-                    summary=report['summary'],
-                    detailed_analysis=report['detailed_analysis'],
-                    red_flags=report['red_flags'],
-                    key_claims=report['key_claims'],
-                    sources_checked=sources
-                )
-                db.session.add(analysis_record)
-                db.session.commit()
+                save_analyses([history_values(user_id, news_text, headline, report)])
             except Exception as e:
                 print(f"Error saving analysis: {str(e)}")
                 db.session.rollback()
@@ -493,6 +488,7 @@ analyzer = NewsAnalyzer()
 
 # API Routes
 @app.route('/', methods=['GET'])
+@response_cache.cached_response()
 def home():
     """Home endpoint"""
     return jsonify({
@@ -506,11 +502,17 @@ def home():
             "/api/auth/login": "User login",
             "/api/auth/logout": "User logout",
             "/api/auth/me": "Get current user",
+            "/api/auth/api-keys": "List or create API keys; DELETE /api/auth/api-keys/<id> revokes one",
             "/api/auth/forgot-password": "Request password reset",
             "/api/auth/reset-password": "Reset password",
-            "/api/analyze": "Analyze news (requires authentication)",
+            "/api/analyze": "Analyze news text or a 'url' (requires authentication: session or 'Authorization: Bearer <API key>')",
             "/api/history": "Get analysis history (requires authentication)",
-            "/api/dashboard": "Get dashboard statistics (requires authentication)"
+            "/api/history/search": "Search analysis history (requires authentication)",
+            "/api/history/export": "Export analysis history (requires authentication)",
+            "/api/dashboard": "Get dashboard statistics (requires authentication)",
+            "/api/admin/trends": "Platform-wide red flag, claim and category trends (admin only)",
+            "/api/dashboard/timeseries": "Daily verdict, confidence and credit totals, e.g. ?range=90d (requires authentication)",
+            "/api/metrics": "Worker metrics (Gemini queue and quota, admin only)"
         }
     })
 
@@ -538,7 +540,33 @@ def health_check():
     })
 
 
+@app.route('/api/metrics', methods=['GET'])
+@admin_required
+def get_metrics():
+    """Metrics for the worker serving this request (admin only)"""
+    try:
+        requests_used, tokens_used = governor.current_usage()
+    except Exception as e:
+        print(f"Error reading Gemini usage: {str(e)}")
+        requests_used, tokens_used = None, None
+    
+    return jsonify({
+        "success": True,
+        "pid": os.getpid(),
+        "gemini_quota": {
+            "rpm_limit": governor.rpm,
+            "tpm_limit": governor.tpm,
+            "requests_this_minute": requests_used,
+            "tokens_this_minute": tokens_used
+        },
+        "db_pools": pools.status(db.engines),
+        "replicas": replicas.status(),
+        **metrics.snapshot()
+    })
+
+
 @app.route('/api/analyze', methods=['POST'])
+@max_body(ANALYZE_MAX_CONTENT_LENGTH)
 @login_required
 def analyze_news():
     """Main endpoint to analyze news for authenticity (requires authentication)"""
@@ -553,15 +581,16 @@ def analyze_news():
         
         news_text = data.get('text', '')
         headline = data.get('headline', '')
+        url = (data.get('url') or '').strip()
         
-        if not news_text or len(news_text.strip()) < 10:
+        if not url and (not news_text or len(news_text.strip()) < 10):
             return jsonify({
                 "error": "Invalid input",
-                "message": "News text must be at least 10 characters long"
+                "message": "News text must be at least 10 characters long, or send a 'url'"
             }), 400
         
-        # Get user_id from session
-        user_id = session.get('user_id')
+        # Session user, or the owner of the API key
+        user_id = current_user_id()
         
         # Check if user has enough credits (1 credit per analysis)
         user = User.query.get(user_id)
@@ -578,6 +607,18 @@ def analyze_news():
                 "credits": user.credits
             }), 402  # Payment Required
         
+        # URL submissions: fetch (through the HTTP cache) before charging
+        source_url = None
+        if url:
+            try:
+                fetched_headline, news_text, source_url = fetch_article(url)
+            except FetchError as e:
+                return jsonify({
+                    "error": "Could not read article",
+                    "message": str(e)
+                }), 422
+            headline = headline or fetched_headline
+        
         # Deduct 1 credit
         if not deduct_credits(user_id, 1, "News analysis"):
             return jsonify({
@@ -586,7 +627,24 @@ def analyze_news():
             }), 500
         
         # Generate analysis report
-        report = analyzer.generate_report(news_text, headline, user_id)
+        try:
+            report = analyzer.generate_report(news_text, headline, user_id, source_url=source_url)
+        except QuotaWaitTimeout as e:
+            # Nothing was analyzed, so give the credit back
+            add_credits(user_id, 1, "Refund: analysis queue timeout", transaction_type='refund')
+            response = jsonify({
+                "success": False,
+                "error": "Service busy",
+                "message": "Too many analyses are in progress. Please try again shortly.",
+                "queue_wait_ms": int(e.waited * 1000)
+            })
+            response.headers['Retry-After'] = '30'
+            return response, 429
+        except Exception:
+            # Any other failure also leaves the user without an analysis
+            db.session.rollback()
+            add_credits(user_id, 1, "Refund: analysis failed", transaction_type='refund')
+            raise
         
         # Get updated credit balance
         user = User.query.get(user_id)
@@ -606,25 +664,34 @@ def analyze_news():
 
 
 @app.route('/api/history', methods=['GET'])
+@read_replica
 @login_required
 def get_history():
     """Get user's analysis history"""
     try:
-        user_id = session.get('user_id')
-        page = request.args.get('page', 1, type=int)
+        user_id = current_user_id()
+        page = max(request.args.get('page', 1, type=int), 1)
         per_page = request.args.get('per_page', 10, type=int)
+        if per_page < 1:
+            per_page = 10
         
-        # Query with pagination
-        pagination = AnalysisHistory.query.filter_by(user_id=user_id)\
-            .order_by(AnalysisHistory.timestamp.desc())\
-            .paginate(page=page, per_page=per_page, error_out=False)
+        total = db.session.query(db.func.count(AnalysisHistory.id))\
+            .filter(AnalysisHistory.user_id == user_id)\
+            .scalar()
+        rows = db.session.execute(
+            analysis_rows.select()
+            .where(AnalysisHistory.user_id == user_id)
+            .order_by(AnalysisHistory.timestamp.desc(), AnalysisHistory.id.desc())
+            .limit(per_page)
+            .offset((page - 1) * per_page)
+        ).all()
         
         return jsonify({
             "success": True,
-            "history": [item.to_dict() for item in pagination.items],
-            "total": pagination.total,
+            "history": analysis_rows(rows),
+            "total": total,
             "page": page,
-            "pages": pagination.pages,
+            "pages": -(-total // per_page),
             "per_page": per_page
         }), 200
         
@@ -636,18 +703,88 @@ def get_history():
         }), 500
 
 
+@app.route('/api/history/search', methods=['GET'])
+@login_required
+def search_analyses():
+    """Full-text search over the user's analysis history"""
+    try:
+        user_id = current_user_id()
+        results, next_cursor = search_history(user_id, request.args)
+        
+        history = []
+        for analysis, score in results:
+            item = analysis.to_dict()
+            item['rank'] = score
+            history.append(item)
+        
+        return jsonify({
+            "success": True,
+            "history": history,
+            "next_cursor": next_cursor
+        }), 200
+        
+    except SearchError as e:
+        return jsonify({
+            "success": False,
+            "error": "Invalid search",
+            "message": str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": "Search failed",
+            "message": str(e)
+        }), 500
+
+
+@app.route('/api/history/export', methods=['GET'])
+@login_required
+def export_history():
+    """Stream the user's full analysis history as NDJSON, CSV or Parquet"""
+    try:
+        user_id = current_user_id()
+        fmt = request.args.get('format', 'ndjson').lower()
+        use_gzip = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+        
+        chunks = stream_history(user_id, fmt, gzip=use_gzip)
+        
+        filename = f"newsscope-history-{datetime.utcnow():%Y%m%d}.{EXPORT_FORMATS[fmt]['extension']}"
+        headers = {'Content-Disposition': f'attachment; filename="{filename}{".gz" if use_gzip else ""}"'}
+        mimetype = 'application/gzip' if use_gzip else EXPORT_FORMATS[fmt]['mimetype']
+        
+        return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+        
+    except ExportError as e:
+        return jsonify({
+            "success": False,
+            "error": "Invalid export",
+            "message": str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": "Export failed",
+            "message": str(e)
+        }), 500
+
+
 @app.route('/api/dashboard', methods=['GET'])
+@read_replica
 @login_required
+@response_cache.cached_response(per_user=True, fresh_version=True)
 def get_dashboard():
     """Get dashboard statistics"""
     try:
-        user_id = session.get('user_id')
+        user_id = current_user_id()
         
-        # Get all analyses for the user
-        analyses = AnalysisHistory.query.filter_by(user_id=user_id).all()
+        # Count verdicts in the database instead of loading every analysis
+        verdict_rows = db.session.query(AnalysisHistory.verdict, db.func.count())\
+            .filter(AnalysisHistory.user_id == user_id)\
+            .group_by(AnalysisHistory.verdict)\
+            .all()
         
         # Calculate statistics
-        total_analyses = len(analyses)
+        total_analyses = sum(count for _, count in verdict_rows)
         
         verdict_counts = {
             'REAL': 0,
@@ -656,28 +793,27 @@ def get_dashboard():
             'UNCERTAIN': 0
         }
         
-        for analysis in analyses:
-            verdict = analysis.verdict.upper()
+        for verdict, count in verdict_rows:
+            verdict = verdict.upper()
             if verdict in verdict_counts:
-                verdict_counts[verdict] += 1
+                verdict_counts[verdict] += count
         
         # Get recent analyses
-        recent_analyses = AnalysisHistory.query.filter_by(user_id=user_id)\
-            .order_by(AnalysisHistory.timestamp.desc())\
-            .limit(5)\
-            .all()
-        
-        # Get last analysis timestamp
-        last_analysis = recent_analyses[0] if recent_analyses else None
+        recent_analyses = analysis_rows(db.session.execute(
+            analysis_rows.select()
+            .where(AnalysisHistory.user_id == user_id)
+            .order_by(AnalysisHistory.timestamp.desc(), AnalysisHistory.id.desc())
+            .limit(5)
+        ).all())
         
         return jsonify({
             "success": True,
             "statistics": {
                 "total_analyses": total_analyses,
                 "verdict_distribution": verdict_counts,
-                "last_analysis": last_analysis.timestamp.isoformat() + 'Z' if last_analysis else None
+                "last_analysis": recent_analyses[0]['timestamp'] if recent_analyses else None
             },
-            "recent_analyses": [item.to_dict() for item in recent_analyses]
+            "recent_analyses": recent_analyses
         }), 200
         
     except Exception as e:
@@ -688,7 +824,75 @@ def get_dashboard():
         }), 500
 
 
+@app.route('/api/dashboard/timeseries', methods=['GET'])
+@login_required
+@response_cache.cached_response(per_user=True, daily=True, fresh_version=True)
+def get_dashboard_timeseries():
+    """Get daily analysis and credit totals for a range such as ?range=90d"""
+    try:
+        user_id = current_user_id()
+        range_param = request.args.get('range', '30d')
+        
+        try:
+            days = int(range_param[:-1] if range_param.endswith('d') else range_param)
+        except ValueError:
+            days = 0
+        if not 1 <= days <= rollups.MAX_RANGE_DAYS:
+            return jsonify({
+                "success": False,
+                "error": "Invalid range",
+                "message": f"range must be between 1d and {rollups.MAX_RANGE_DAYS}d"
+            }), 400
+        
+        return jsonify({
+            "success": True,
+            "range": f"{days}d",
+            "series": rollups.timeseries(user_id, days)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": "Failed to fetch dashboard time series",
+            "message": str(e)
+        }), 500
+
+
+@app.route('/api/admin/trends', methods=['GET'])
+@admin_required
+def get_trends():
+    """Get platform-wide top red flags, claims and source categories (admin only)"""
+    try:
+        hours = min(max(request.args.get('hours', 24, type=int), 1), trends.TRENDS_RETENTION_HOURS // 2)
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+        dimension = request.args.get('dimension')
+        if dimension and dimension not in trends.DIMENSIONS:
+            return jsonify({
+                "success": False,
+                "error": "Invalid dimension",
+                "message": f"dimension must be one of: {', '.join(trends.DIMENSIONS)}"
+            }), 400
+        
+        # Folding is the cron job's; only top up a little if it has fallen behind
+        trends.catch_up()
+        
+        return jsonify({
+            "success": True,
+            "hours": hours,
+            "trends": trends.top_trends(hours, limit, [dimension] if dimension else trends.DIMENSIONS)
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            "success": False,
+            "error": "Failed to fetch trends",
+            "message": str(e)
+        }), 500
+
+
 @app.route('/api/sources', methods=['GET'])
+@response_cache.cached_response()
 def get_sources():
     """Get list of sources that are checked"""
     sources = analyzer.search_news_sources("", "")
@@ -699,12 +903,45 @@ def get_sources():
     })
 
 
+@app.route('/api/history/<int:analysis_id>', methods=['GET'])
+@login_required
+def get_analysis(analysis_id):
+    """Get a single analysis with its full text"""
+    try:
+        user_id = current_user_id()
+        analysis = AnalysisHistory.query.filter_by(id=analysis_id, user_id=user_id).first()
+        
+        if not analysis:
+            return jsonify({
+                'success': False,
+                'error': 'Analysis not found',
+                'message': 'The analysis you are looking for does not exist'
+            }), 404
+        
+        # Archived analyses are decompressed only here, not in list views
+        result = analysis.to_dict()
+        result['news_text'], result['detailed_analysis'] = archive.full_text(analysis)
+        
+        return jsonify({
+            'success': True,
+            'analysis': result
+        }), 200
+        
+    except Exception as e:
+        print(f"Get analysis error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to fetch analysis',
+            'message': str(e)
+        }), 500
+
+
 @app.route('/api/history/<int:analysis_id>', methods=['DELETE'])
 @login_required
 def delete_analysis(analysis_id):
     """Delete a specific analysis"""
     try:
-        user_id = session.get('user_id')
+        user_id = current_user_id()
         
         # Find the analysis belonging to the user
         analysis = AnalysisHistory.query.filter_by(id=analysis_id, user_id=user_id).first()
@@ -717,6 +954,8 @@ def delete_analysis(analysis_id):
             }), 404
         
         # Delete the analysis
+        rollups.remove_analysis(analysis)
+        response_cache.bump(user_id)
         db.session.delete(analysis)
         db.session.commit()
         
@@ -740,17 +979,16 @@ def delete_analysis(analysis_id):
 def delete_all_analyses():
     """Delete all analyses for the user"""
     try:
-        user_id = session.get('user_id')
+        user_id = current_user_id()
         
-        # Delete all analyses for the user
-        deleted_count = AnalysisHistory.query.filter_by(user_id=user_id).count()
-        AnalysisHistory.query.filter_by(user_id=user_id).delete()
-        db.session.commit()
+        # Deleting happens in batches in the background; poll the job for progress
+        job = retention.start_user_purge(app, user_id)
         
         return jsonify({
             'success': True,
-            'message': f'Successfully deleted {deleted_count} analyses'
-        }), 200
+            'message': 'Deleting your analyses',
+            'job': job.to_dict()
+        }), 202
         
     except Exception as e:
         db.session.rollback()
@@ -762,6 +1000,35 @@ def delete_all_analyses():
         }), 500
 
 
+@app.route('/api/history/purge/<int:job_id>', methods=['GET'])
+@login_required
+def get_purge_job(job_id):
+    """Get progress of a "delete all analyses" job"""
+    try:
+        user_id = current_user_id()
+        job = PurgeJob.query.filter_by(id=job_id, user_id=user_id).first()
+        
+        if not job:
+            return jsonify({
+                'success': False,
+                'error': 'Job not found',
+                'message': 'The delete job you are looking for does not exist'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'job': job.to_dict()
+        }), 200
+        
+    except Exception as e:
+        print(f"Get purge job error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to fetch job',
+            'message': str(e)
+        }), 500
+
+
 @app.route('/api/feedback', methods=['POST', 'OPTIONS'])
 def send_feedback():
     """Send feedback via SendGrid email"""
@@ -807,6 +1074,9 @@ def send_feedback():
         </html>
         """
         
+        from sendgrid import SendGridAPIClient
+        from sendgrid.helpers.mail import Mail
+
         mail_message = Mail(
             from_email=SENDGRID_FROM_EMAIL,
             to_emails=SENDGRID_TO_EMAIL,
@@ -834,6 +1104,7 @@ def send_feedback():
 # ===== CREDITS AND PAYMENT ENDPOINTS =====
 
 @app.route('/api/credits/packages', methods=['GET'])
+@response_cache.cached_response()
 def get_credit_packages():
     """Get available credit packages"""
     return jsonify({
@@ -861,17 +1132,19 @@ def get_credit_packages():
 
 @app.route('/api/credits/balance', methods=['GET'])
 @login_required
+@response_cache.cached_response(per_user=True, fresh_version=True)
 def get_credit_balance():
     """Get user's credit balance"""
     try:
-        user_id = session.get('user_id')
+        user_id = current_user_id()
         user = User.query.get(user_id)
         
         if not user:
             return jsonify({'error': 'User not found.'}), 404
         
+        # Balance of record from the ledger snapshot; users.credits is only a cache
         return jsonify({
-            'credits': user.credits,
+            'credits': ledger.balance(user_id),
             'credits_used': user.credits_used or 0
         }), 200
     except Exception as e:
@@ -880,35 +1153,63 @@ def get_credit_balance():
 
 
 @app.route('/api/credits/transactions', methods=['GET'])
+@read_replica
 @login_required
 def get_credit_transactions():
     """Get user's credit transaction history"""
     try:
-        user_id = session.get('user_id')
+        user_id = current_user_id()
         limit = request.args.get('limit', 50, type=int)
         
-        transactions = CreditTransaction.query.filter_by(user_id=user_id)\
-            .order_by(CreditTransaction.created_at.desc())\
-            .limit(limit)\
-            .all()
+        transactions = db.session.execute(
+            transaction_rows.select()
+            .where(CreditTransaction.user_id == user_id)
+            .order_by(CreditTransaction.created_at.desc())
+            .limit(limit)
+        ).all()
         
         return jsonify({
-            'transactions': [trans.to_dict() for trans in transactions]
+            'transactions': transaction_rows(transactions)
         }), 200
     except Exception as e:
         print(f'Get transactions error: {e}')
         return jsonify({'error': 'Internal server error.'}), 500
 
 
+@app.route('/api/payment/orders', methods=['GET'])
+@read_replica
+@login_required
+def get_payment_orders():
+    """Get user's payment orders, newest first"""
+    try:
+        user_id = current_user_id()
+        limit = request.args.get('limit', 50, type=int)
+        
+        orders = db.session.execute(
+            order_rows.select()
+            .where(PaymentOrder.user_id == user_id)
+            .order_by(PaymentOrder.created_at.desc())
+            .limit(limit)
+        ).all()
+        
+        return jsonify({
+            'orders': order_rows(orders)
+        }), 200
+    except Exception as e:
+        print(f'Get orders error: {e}')
+        return jsonify({'error': 'Internal server error.'}), 500
+
+
 @app.route('/api/payment/create-order', methods=['POST'])
 @login_required
 def create_payment_order():
     """Create Razorpay order for credit purchase"""
     try:
+        razorpay_client = get_razorpay_client()
         if not razorpay_client:
             return jsonify({'error': 'Payment service not configured.'}), 503
 
-        user_id = session.get('user_id')
+        user_id = current_user_id()
         data = request.get_json()
         package_id = data.get('package_id')
 
@@ -979,10 +1280,11 @@ def create_payment_order():
 def verify_payment():
     """Verify Razorpay payment and add credits"""
     try:
+        razorpay_client = get_razorpay_client()
         if not razorpay_client:
             return jsonify({'error': 'Payment service not configured.'}), 503
 
-        user_id = session.get('user_id')
+        user_id = current_user_id()
         data = request.get_json()
         
         razorpay_order_id = data.get('razorpay_order_id')
@@ -1004,47 +1306,18 @@ def verify_payment():
             print(f'Payment verification failed: {e}')
             return jsonify({'error': 'Payment verification failed.'}), 400
 
-        # Get order details from database
-        order = PaymentOrder.query.filter_by(order_id=razorpay_order_id, user_id=user_id).first()
-
-        if not order:
-            return jsonify({'error': 'Order not found.'}), 404
-
-        if order.status == 'paid':
-            return jsonify({'error': 'Order already processed.'}), 400
-
-        # Update order status
-        order.status = 'paid'
-        order.payment_id = razorpay_payment_id
-        order.payment_signature = razorpay_signature
-        order.updated_at = datetime.utcnow()
-        
-        db.session.commit()
-
-        # Add credits to user account
-        credits_amount = order.credits_amount
-        amount_paid = float(order.amount)
-        
-        success = add_credits(
-            user_id,
-            credits_amount,
-            f"Purchased {credits_amount} credits",
-            payment_id=razorpay_payment_id,
-            order_id=razorpay_order_id,
-            amount_paid=amount_paid
-        )
-
-        if not success:
-            return jsonify({'error': 'Failed to add credits.'}), 500
+        # Mark the order paid and add the credits in one transaction
+        try:
+            result = settle_order(razorpay_order_id, razorpay_payment_id, razorpay_signature, user_id=user_id)
+        except PaymentError as e:
+            return jsonify({'error': str(e)}), e.status_code
 
-        # Get updated credits
-        user = User.query.get(user_id)
-        
         return jsonify({
             'success': True,
-            'message': 'Payment successful! Credits added to your account.',
-            'credits_added': credits_amount,
-            'total_credits': user.credits
+            'message': 'Payment already processed.' if result['already_settled']
+                       else 'Payment successful! Credits added to your account.',
+            'credits_added': result['credits_added'],
+            'total_credits': result['total_credits']
         }), 200
 
     except Exception as e:
@@ -1055,6 +1328,35 @@ def verify_payment():
         return jsonify({'error': 'Payment verification failed.'}), 500
 
 
+@app.route('/api/payment/webhook', methods=['POST'])
+def payment_webhook():
+    """Razorpay webhook; settles paid orders through the same path as verify"""
+    body = request.get_data()
+    if not verify_webhook(body, request.headers.get('X-Razorpay-Signature')):
+        return jsonify({'error': 'Invalid webhook signature.'}), 400
+
+    try:
+        event = json.loads(body)
+    except ValueError:
+        return jsonify({'error': 'Invalid webhook payload.'}), 400
+
+    payment = webhook_payment(event)
+    if not payment:
+        return jsonify({'success': True, 'message': 'Event ignored.'}), 200
+
+    try:
+        result = settle_order(*payment, source='webhook')
+    except PaymentError as e:
+        # Not ours or already settled by another payment; retrying won't change that
+        print(f'Webhook for {payment[0]} not applied: {e}')
+        return jsonify({'success': True, 'message': str(e)}), 200
+    except Exception as e:
+        print(f'Payment webhook error: {e}')
+        return jsonify({'error': 'Failed to settle payment.'}), 500
+
+    return jsonify({'success': True, 'already_settled': result['already_settled']}), 200
+
+
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
@@ -1064,6 +1366,14 @@ def not_found(error):
     }), 404
 
 
+@app.errorhandler(413)
+def request_too_large(error):
+    return jsonify({
+        "error": "Request too large",
+        "message": f"Request bodies for this endpoint are limited to {request.max_content_length} bytes"
+    }), 413
+
+
 @app.errorhandler(500)
 def internal_error(error):
     return jsonify({
@@ -1073,11 +1383,17 @@ def internal_error(error):
 
 
 # Startup event handler for database initialization
+@app.cli.command('init-db')
+def init_db_command():
+    """Apply pending schema migrations (run once per deploy)"""
+    initialize_app()
+
+
 def initialize_app():
-    """Initialize database tables on app startup"""
+    """Bring the database schema up to date"""
     try:
-        db.create_all()
-        print("✓ Database tables created successfully!")
+        applied = migrate.upgrade()
+        print(f"✓ Database schema up to date ({len(applied)} migrations applied)")
     except Exception as e:
         print(f"⚠ Warning: Database initialization failed: {str(e)}")
         print("  The app will attempt to use existing tables.")
@@ -1103,11 +1419,3 @@ if __name__ == '__main__':
         port=port,
         debug=os.getenv('FLASK_ENV') != 'production'
     )
-
-
-# For Gunicorn/production: Initialize database on first app context
-with app.app_context():
-    try:
-        initialize_app()
-    except Exception as e:
-        print(f"Warning during app initialization: {e}")
\ No newline at end of file
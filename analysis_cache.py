@@ -0,0 +1,63 @@
+"""
+Shared cache of Gemini analysis results
+Keyed by article_hash() of the submitted text (and by normalized URL for
+feed items), so an article analyzed once, by a user or by the feed watcher,
+is answered without another Gemini call until the entry expires.
+"""
+
+import os
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+
+from models import db, AnalysisCache
+
+ANALYSIS_CACHE_TTL = int(os.getenv('ANALYSIS_CACHE_TTL', 6 * 3600))
+
+# Per-request values that must not be replayed from the cache
+_VOLATILE_FIELDS = ('queue_wait_ms',)
+
+
+def get(key):
+    """Return the cached analysis for key, or None"""
+    try:
+        entry = db.session.get(AnalysisCache, key)
+        if entry is None or entry.expires_at <= datetime.utcnow():
+            return None
+        return dict(entry.result)
+    except Exception as e:
+        print(f"Error reading analysis cache: {str(e)}")
+        db.session.rollback()
+        return None
+
+
+def put(keys, result, source='user', ttl=ANALYSIS_CACHE_TTL):
+    """Store an analysis under one or more keys"""
+    result = {k: v for k, v in result.items() if k not in _VOLATILE_FIELDS}
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl)
+    try:
+        for key in keys:
+            entry = db.session.get(AnalysisCache, key)
+            if entry is None:
+                db.session.add(AnalysisCache(key=key, result=result, source=source,
+                                             created_at=now, expires_at=expires_at))
+            else:
+                entry.result = result
+                entry.source = source
+                entry.created_at = now
+                entry.expires_at = expires_at
+        db.session.commit()
+    except IntegrityError:
+        # Another worker cached the same article at the same moment
+        db.session.rollback()
+    except Exception as e:
+        print(f"Error writing analysis cache: {str(e)}")
+        db.session.rollback()
+
+
+def prune():
+    """Delete expired entries; returns rows removed"""
+    removed = AnalysisCache.query.filter(AnalysisCache.expires_at <= datetime.utcnow())\
+        .delete(synchronize_session=False)
+    db.session.commit()
+    return removed
@@ -0,0 +1,190 @@
+"""
+API keys for machine clients
+Integrations send "Authorization: Bearer <key>" instead of a session cookie.
+Keys are random (API_KEY_BYTES of entropy), so the database stores their
+SHA-256 rather than a slow password hash, and a key is looked up by that
+digest.
+
+On the hot path a request does no disk or database I/O:
+- Bearer requests get no Flask session, so the filesystem session store is
+  neither read nor written.
+- Verified keys (and unknown or revoked ones) are cached in each worker for
+  API_KEY_CACHE_TTL seconds. Revoking a key drops it from the revoking
+  worker's cache at once; other workers stop accepting it within the TTL.
+- Usage (request_count, last_used_at) is counted in memory and written to
+  api_keys in one batch per worker every API_KEY_USAGE_FLUSH_INTERVAL
+  seconds, by the request that finds the flush due, and at worker exit.
+  A worker that crashes loses at most one interval of counts.
+
+Configuration:
+    API_KEY_CACHE_TTL               Seconds a verified key is trusted without a lookup (default 60)
+    API_KEY_CACHE_SIZE              Keys cached per worker (default 10000)
+    API_KEY_USAGE_FLUSH_INTERVAL    Seconds between usage writes (default 30)
+    API_KEYS_PER_USER               Active keys a user may hold (default 10)
+"""
+
+import atexit
+import hashlib
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from flask.sessions import SessionInterface
+from sqlalchemy import select, text
+
+import metrics
+from models import db, ApiKey, User
+
+API_KEY_CACHE_TTL = float(os.getenv('API_KEY_CACHE_TTL', 60))
+API_KEY_CACHE_SIZE = int(os.getenv('API_KEY_CACHE_SIZE', 10000))
+API_KEY_USAGE_FLUSH_INTERVAL = float(os.getenv('API_KEY_USAGE_FLUSH_INTERVAL', 30))
+API_KEYS_PER_USER = int(os.getenv('API_KEYS_PER_USER', 10))
+API_KEY_PREFIX = 'nsk_'
+API_KEY_BYTES = 32
+
+_cache = OrderedDict()  # key_hash -> (expires_at, (key_id, user_id) or None)
+_cache_lock = threading.Lock()
+_usage = {}  # key_id -> [requests, last used]
+_usage_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_flushed_at = time.monotonic()
+_app = None
+
+
+def bearer_token(request):
+    """The API key from the Authorization header, or None"""
+    header = request.headers.get('Authorization', '')
+    if header[:7].lower() == 'bearer ' and header[7:].strip():
+        return header[7:].strip()
+    return None
+
+
+def _digest(key):
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def generate():
+    """(key, prefix, key_hash) for a new key; the key itself is shown to the user once"""
+    key = API_KEY_PREFIX + secrets.token_urlsafe(API_KEY_BYTES)
+    return key, key[:12], _digest(key)
+
+
+def _lookup(key_hash):
+    # Always the primary: a replica may not have a key created a moment ago,
+    # and the miss would then be cached for API_KEY_CACHE_TTL
+    row = db.session.execute(
+        select(ApiKey.id, ApiKey.user_id)
+        .join(User, User.id == ApiKey.user_id)
+        .where(ApiKey.key_hash == key_hash, ApiKey.revoked_at.is_(None), User.is_active.is_(True)),
+        bind_arguments={'bind': db.engine}
+    ).first()
+    return (row.id, row.user_id) if row else None
+
+
+def authenticate(key):
+    """(key_id, user_id) for a valid key, or None"""
+    key_hash = _digest(key)
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(key_hash)
+        if entry is not None and entry[0] > now:
+            _cache.move_to_end(key_hash)
+            found = entry[1]
+        else:
+            entry = None
+    if entry is None:
+        metrics.increment('apikeys.cache_miss')
+        found = _lookup(key_hash)
+        with _cache_lock:
+            _cache[key_hash] = (now + API_KEY_CACHE_TTL, found)
+            _cache.move_to_end(key_hash)
+            while len(_cache) > API_KEY_CACHE_SIZE:
+                _cache.popitem(last=False)
+    else:
+        metrics.increment('apikeys.cache_hit')
+
+    if found is None:
+        metrics.increment('apikeys.rejected')
+        return None
+    _record_use(found[0])
+    return found
+
+
+def forget(key_hash):
+    """Drop a key from this worker's cache (after revoking it)"""
+    with _cache_lock:
+        _cache.pop(key_hash, None)
+
+
+def _record_use(key_id):
+    with _usage_lock:
+        usage = _usage.setdefault(key_id, [0, None])
+        usage[0] += 1
+        usage[1] = datetime.utcnow()
+    if time.monotonic() - _flushed_at >= API_KEY_USAGE_FLUSH_INTERVAL:
+        flush_usage()
+
+
+def flush_usage():
+    """Write the counted usage to api_keys in one batch; needs an app context"""
+    global _usage, _flushed_at
+    # One request per worker flushes; the others keep counting
+    if not _flush_lock.acquire(blocking=False):
+        return
+    try:
+        with _usage_lock:
+            pending, _usage = _usage, {}
+            _flushed_at = time.monotonic()
+        if not pending:
+            return
+        try:
+            # Its own connection and transaction, separate from the request's session
+            with db.engine.begin() as conn:
+                conn.execute(
+                    text("UPDATE api_keys SET request_count = request_count + :requests, "
+                         "last_used_at = :last_used WHERE id = :id"),
+                    [{'id': key_id, 'requests': requests, 'last_used': last_used}
+                     for key_id, (requests, last_used) in pending.items()]
+                )
+            metrics.increment('apikeys.usage_flushes')
+        except Exception as e:
+            print(f"[API keys] Usage flush failed, retrying next interval: {str(e)}")
+            with _usage_lock:
+                for key_id, (requests, last_used) in pending.items():
+                    usage = _usage.setdefault(key_id, [0, last_used])
+                    usage[0] += requests
+    finally:
+        _flush_lock.release()
+
+
+def _flush_at_exit():
+    if _app is not None and _usage:
+        with _app.app_context():
+            flush_usage()
+
+
+class BearerSessionInterface(SessionInterface):
+    """Wraps the app's session interface; requests with an API key get no session"""
+
+    def __init__(self, sessions):
+        self.sessions = sessions
+
+    def open_session(self, app, request):
+        if bearer_token(request) is not None:
+            # None makes Flask use a NullSession, which is never saved
+            return None
+        return self.sessions.open_session(app, request)
+
+    def save_session(self, app, session, response):
+        return self.sessions.save_session(app, session, response)
+
+
+def init_app(app):
+    """Skip sessions for bearer requests and flush usage at exit; call after Session(app)"""
+    global _app
+    _app = app
+    app.session_interface = BearerSessionInterface(app.session_interface)
+    atexit.register(_flush_at_exit)
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Cold storage for AnalysisHistory text columns
+Analyses older than ARCHIVE_AFTER_DAYS have news_text and detailed_analysis
+compressed into archive_blob with a dictionary trained on past analyses
+(zstd when the zstandard package is installed, zlib preset dictionaries
+otherwise). The list views only need the 200 character preview, so the full
+text is decompressed only when a single analysis is opened.
+
+Usage:
+    python archive.py train            Train a new compression dictionary
+    python archive.py run [--days 30]  Archive old rows in resumable batches
+    python archive.py stats            Show archived row counts and table size
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from sqlalchemy.orm import lazyload
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+import response_cache
+from models import db, AnalysisHistory, CompressionDictionary
+
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 30))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', 500))
+DICTIONARY_SIZE = 64 * 1024
+ZLIB_DICTIONARY_SIZE = 32 * 1024  # zlib only uses the last 32KB of a preset dictionary
+PREVIEW_LENGTH = 200
+
+_dictionaries = {}
+_dictionaries_lock = threading.Lock()
+
+
+def _payload(news_text, detailed_analysis):
+    return json.dumps({
+        'news_text': news_text,
+        'detailed_analysis': detailed_analysis
+    }, ensure_ascii=False).encode('utf-8')
+
+
+def train_dictionary(sample_limit=2000):
+    """Train and store a dictionary from the most recent analyses"""
+    rows = db.session.query(AnalysisHistory.news_text, AnalysisHistory.detailed_analysis)\
+        .filter(AnalysisHistory.archived_at.is_(None))\
+        .order_by(AnalysisHistory.id.desc())\
+        .limit(sample_limit)\
+        .all()
+    samples = [_payload(row.news_text, row.detailed_analysis) for row in rows]
+    if not samples:
+        raise ValueError("No analyses available to train a dictionary")
+
+    if zstandard:
+        codec = 'zstd'
+        try:
+            data = zstandard.train_dictionary(DICTIONARY_SIZE, samples).as_bytes()
+        except zstandard.ZstdError:
+            # Too few samples to train; zstd also accepts raw content dictionaries
+            data = b''.join(samples)[-DICTIONARY_SIZE:]
+    else:
+        # zlib has no trainer; recent samples make a reasonable preset dictionary
+        codec = 'zlib'
+        data = b''.join(samples)[-ZLIB_DICTIONARY_SIZE:]
+
+    dictionary = CompressionDictionary(codec=codec, data=data, sample_count=len(samples))
+    db.session.add(dictionary)
+    db.session.commit()
+    return dictionary
+
+
+def latest_dictionary():
+    """Most recently trained dictionary usable with the installed codecs"""
+    query = CompressionDictionary.query
+    if not zstandard:
+        query = query.filter_by(codec='zlib')
+    return query.order_by(CompressionDictionary.id.desc()).first()
+
+
+def _codec(dictionary_id):
+    """Return (codec, dictionary bytes) for a dictionary id, cached per process"""
+    with _dictionaries_lock:
+        cached = _dictionaries.get(dictionary_id)
+    if cached:
+        return cached
+
+    dictionary = db.session.get(CompressionDictionary, dictionary_id)
+    if dictionary is None:
+        raise ValueError(f"Compression dictionary {dictionary_id} not found")
+    if dictionary.codec == 'zstd':
+        if not zstandard:
+            raise RuntimeError("zstandard is required to read archived analyses")
+        cached = ('zstd', zstandard.ZstdCompressionDict(dictionary.data))
+    else:
+        cached = ('zlib', dictionary.data)
+
+    with _dictionaries_lock:
+        _dictionaries[dictionary_id] = cached
+    return cached
+
+
+def compress(news_text, detailed_analysis, dictionary_id):
+    codec, dictionary = _codec(dictionary_id)
+    data = _payload(news_text, detailed_analysis)
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=9, dict_data=dictionary).compress(data)
+    compressor = zlib.compressobj(9, zdict=dictionary)
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress(blob, dictionary_id):
+    codec, dictionary = _codec(dictionary_id)
+    if codec == 'zstd':
+        data = zstandard.ZstdDecompressor(dict_data=dictionary).decompress(blob)
+    else:
+        decompressor = zlib.decompressobj(zdict=dictionary)
+        data = decompressor.decompress(blob) + decompressor.flush()
+    return json.loads(data.decode('utf-8'))
+
+
+def full_text(analysis):
+    """Return (news_text, detailed_analysis) for an analysis, decompressing if archived"""
+    if analysis.archived_at is None:
+        return analysis.news_text, analysis.detailed_analysis
+    payload = decompress(analysis.archive_blob, analysis.archive_dictionary_id)
+    return payload['news_text'], payload['detailed_analysis']
+
+
+def _preview(news_text):
+    return news_text[:PREVIEW_LENGTH] + '...' if len(news_text) > PREVIEW_LENGTH else news_text
+
+
+def archive_batch(cutoff, dictionary_id, batch_size=ARCHIVE_BATCH_SIZE):
+    """Archive one batch of old rows; returns (rows, raw bytes, compressed bytes)"""
+    rows = AnalysisHistory.query\
+        .filter(AnalysisHistory.archived_at.is_(None), AnalysisHistory.timestamp < cutoff)\
+        .order_by(AnalysisHistory.id)\
+        .options(lazyload('*'))\
+        .limit(batch_size)\
+        .all()
+
+    raw_bytes = compressed_bytes = 0
+    now = datetime.utcnow()
+    for row in rows:
+        blob = compress(row.news_text, row.detailed_analysis, dictionary_id)
+        raw_bytes += len((row.news_text or '').encode('utf-8')) + len((row.detailed_analysis or '').encode('utf-8'))
+        compressed_bytes += len(blob)
+
+        row.archive_blob = blob
+        row.archive_dictionary_id = dictionary_id
+        row.archived_at = now
+        row.news_text = _preview(row.news_text)
+        row.detailed_analysis = None
+
+    response_cache.bump(*{row.user_id for row in rows})
+    db.session.commit()
+    return len(rows), raw_bytes, compressed_bytes
+
+
+def table_size():
+    """On-disk size of analysis_history in bytes, or None if the database can't tell"""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        return db.session.execute(text("SELECT pg_total_relation_size('analysis_history')")).scalar()
+    if dialect == 'sqlite':
+        try:
+            return db.session.execute(text(
+                "SELECT SUM(pgsize) FROM dbstat WHERE name = 'analysis_history'"
+            )).scalar()
+        except Exception:
+            db.session.rollback()
+    return None
+
+
+def run(days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE, pause=0.0):
+    """Archive every row older than `days`. Safe to interrupt and rerun."""
+    dictionary = latest_dictionary() or train_dictionary()
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    size_before = table_size()
+
+    total_rows = total_raw = total_compressed = 0
+    started = time.monotonic()
+    while True:
+        rows, raw_bytes, compressed_bytes = archive_batch(cutoff, dictionary.id, batch_size)
+        if not rows:
+            break
+        total_rows += rows
+        total_raw += raw_bytes
+        total_compressed += compressed_bytes
+        print(f"  archived {total_rows} rows ({total_raw:,} -> {total_compressed:,} bytes)")
+        if pause:
+            time.sleep(pause)
+
+    if total_rows:
+        # Release the space held by the old text versions so the size report is meaningful.
+        # On Postgres plain VACUUM makes the space reusable without the exclusive lock of
+        # VACUUM FULL, so the relation size only shrinks as new rows fill the free space.
+        vacuum = 'VACUUM ANALYZE analysis_history' if db.engine.dialect.name == 'postgresql' else 'VACUUM'
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text(vacuum))
+    size_after = table_size()
+
+    print("\n📊 Archive Summary:")
+    print(f"   • Rows archived: {total_rows} in {time.monotonic() - started:.1f}s")
+    print(f"   • Dictionary: #{dictionary.id} ({dictionary.codec}, {len(dictionary.data):,} bytes)")
+    if total_raw:
+        print(f"   • Text bytes: {total_raw:,} -> {total_compressed:,} "
+              f"({100 * (1 - total_compressed / total_raw):.1f}% smaller)")
+    if size_before and size_after is not None:
+        print(f"   • Table size: {size_before:,} -> {size_after:,} bytes "
+              f"({100 * (1 - size_after / size_before):.1f}% smaller)")
+    return total_rows
+
+
+def stats():
+    total = AnalysisHistory.query.count()
+    archived = AnalysisHistory.query.filter(AnalysisHistory.archived_at.isnot(None)).count()
+    size = table_size()
+    print(f"Analyses: {total} ({archived} archived)")
+    print(f"Table size: {f'{size:,} bytes' if size is not None else 'unknown'}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="NewsScope analysis cold storage")
+    parser.add_argument('command', choices=['train', 'run', 'stats'])
+    parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS, help='Archive analyses older than this')
+    parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches')
+    args = parser.parse_args()
+
+    from NewsScope import app
+
+    with app.app_context():
+        if args.command == 'train':
+            dictionary = train_dictionary()
+            print(f"✅ Trained {dictionary.codec} dictionary #{dictionary.id} "
+                  f"from {dictionary.sample_count} analyses ({len(dictionary.data):,} bytes)")
+        elif args.command == 'run':
+            run(args.days, args.batch_size, args.pause)
+        else:
+            stats()
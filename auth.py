@@ -1,9 +1,11 @@
 from datetime import datetime, timedelta
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, g, request, jsonify, session
 from functools import wraps
-from models import db, User, AnalysisHistory
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
+from models import db, User, AnalysisHistory, ApiKey
+from passwords import HashingBusy
+import apikeys
+from replicas import read_replica
+from request_limits import max_body, AUTH_MAX_CONTENT_LENGTH
 import os
 
 auth_bp = Blueprint('auth', __name__)
@@ -12,21 +14,76 @@ auth_bp = Blueprint('auth', __name__)
 SENDGRID_API_KEY = os.getenv('SENDGRID_API_KEY')
 SENDGRID_FROM_EMAIL = os.getenv('SENDGRID_FROM_EMAIL')
 FRONTEND_URL = os.getenv('FRONTEND_URL', 'http://localhost:5173')
+ADMIN_EMAILS = {email.strip().lower() for email in os.getenv('ADMIN_EMAILS', '').split(',') if email.strip()}
+
+def current_user_id():
+    """The signed-in user: the API key's owner for bearer requests, else the session user"""
+    return g.get('user_id') or session.get('user_id')
 
 def login_required(f):
-    """Decorator to require authentication"""
+    """Decorator to require authentication (session or API key)"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
         # Handle OPTIONS requests for CORS preflight
         if request.method == 'OPTIONS':
             return '', 200
         
+        api_key = apikeys.bearer_token(request)
+        if api_key is not None:
+            found = apikeys.authenticate(api_key)
+            if found is None:
+                return jsonify({
+                    'success': False,
+                    'error': 'Invalid API key',
+                    'message': 'The API key is unknown or has been revoked'
+                }), 401
+            g.api_key_id, g.user_id = found
+        elif 'user_id' not in session:
+            return jsonify({
+                'success': False,
+                'error': 'Authentication required',
+                'message': 'Please log in to access this resource'
+            }), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+def session_required(f):
+    """Decorator to require a signed-in session; API keys are not accepted"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if request.method == 'OPTIONS':
+            return '', 200
+        
+        if 'user_id' not in session:
+            return jsonify({
+                'success': False,
+                'error': 'Authentication required',
+                'message': 'Please log in to access this resource'
+            }), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+def admin_required(f):
+    """Decorator to require an operator account listed in ADMIN_EMAILS"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if request.method == 'OPTIONS':
+            return '', 200
+        
         if 'user_id' not in session:
             return jsonify({
                 'success': False,
                 'error': 'Authentication required',
                 'message': 'Please log in to access this resource'
             }), 401
+        
+        user = User.query.get(session['user_id'])
+        if not user or user.email.lower() not in ADMIN_EMAILS:
+            return jsonify({
+                'success': False,
+                'error': 'Forbidden',
+                'message': 'Administrator access required'
+            }), 403
         return f(*args, **kwargs)
     return decorated_function
 
@@ -69,6 +126,10 @@ def send_reset_email(email, reset_token):
     """
     
     try:
+        # Imported here so workers don't load the SDK at boot
+        from sendgrid import SendGridAPIClient
+        from sendgrid.helpers.mail import Mail
+
         message = Mail(
             from_email=SENDGRID_FROM_EMAIL,
             to_emails=email,
@@ -83,7 +144,19 @@ def send_reset_email(email, reset_token):
         print(f"Error sending reset email: {str(e)}")
         return False
 
+def hashing_busy_response(error):
+    """503 for requests turned away by the password hashing limit"""
+    response = jsonify({
+        'success': False,
+        'error': 'Busy',
+        'message': 'Too many sign-in attempts right now. Please try again in a moment.'
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
 @auth_bp.route('/signup', methods=['POST'])
+@max_body(AUTH_MAX_CONTENT_LENGTH)
 def signup():
     """User registration endpoint"""
     try:
@@ -143,6 +216,10 @@ def signup():
             'user': new_user.to_dict()
         }), 201
         
+    except HashingBusy as e:
+        db.session.rollback()
+        return hashing_busy_response(e)
+    
     except Exception as e:
         db.session.rollback()
         print(f"Signup error: {str(e)}")
@@ -153,6 +230,7 @@ def signup():
         }), 500
 
 @auth_bp.route('/login', methods=['POST'])
+@max_body(AUTH_MAX_CONTENT_LENGTH)
 def login():
     """User login endpoint"""
     try:
@@ -199,6 +277,9 @@ def login():
             'user': user.to_dict()
         }), 200
         
+    except HashingBusy as e:
+        return hashing_busy_response(e)
+    
     except Exception as e:
         print(f"Login error: {str(e)}")
         return jsonify({
@@ -218,11 +299,12 @@ def logout():
     }), 200
 
 @auth_bp.route('/me', methods=['GET'])
+@read_replica
 @login_required
 def get_current_user():
     """Get current user information"""
     try:
-        user = User.query.get(session['user_id'])
+        user = User.query.get(current_user_id())
         if not user:
             return jsonify({
                 'success': False,
@@ -241,7 +323,101 @@ def get_current_user():
             'error': 'Server error'
         }), 500
 
+@auth_bp.route('/api-keys', methods=['GET'])
+@session_required
+def list_api_keys():
+    """List the user's active API keys (usage counts lag by up to API_KEY_USAGE_FLUSH_INTERVAL)"""
+    try:
+        keys = ApiKey.query.filter_by(user_id=session['user_id'], revoked_at=None) \
+            .order_by(ApiKey.created_at.desc()).all()
+        return jsonify({
+            'success': True,
+            'api_keys': [key.to_dict() for key in keys]
+        }), 200
+
+    except Exception as e:
+        print(f"List API keys error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Server error'
+        }), 500
+
+@auth_bp.route('/api-keys', methods=['POST'])
+@max_body(AUTH_MAX_CONTENT_LENGTH)
+@session_required
+def create_api_key():
+    """Create an API key; the key is returned only in this response"""
+    try:
+        data = request.get_json(silent=True) or {}
+        name = (data.get('name') or '').strip()
+        if not name or len(name) > 100:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid name',
+                'message': 'Please provide a name of up to 100 characters for the key'
+            }), 400
+
+        user_id = session['user_id']
+        if ApiKey.query.filter_by(user_id=user_id, revoked_at=None).count() >= apikeys.API_KEYS_PER_USER:
+            return jsonify({
+                'success': False,
+                'error': 'Too many keys',
+                'message': f'You can have up to {apikeys.API_KEYS_PER_USER} API keys. Revoke one first.'
+            }), 409
+
+        key, prefix, key_hash = apikeys.generate()
+        api_key = ApiKey(user_id=user_id, name=name, prefix=prefix, key_hash=key_hash)
+        db.session.add(api_key)
+        db.session.commit()
+
+        return jsonify({
+            'success': True,
+            'message': 'API key created. Copy it now; it will not be shown again.',
+            'api_key': key,
+            'key': api_key.to_dict()
+        }), 201
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"Create API key error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Server error',
+            'message': 'An error occurred while creating the API key'
+        }), 500
+
+@auth_bp.route('/api-keys/<int:key_id>', methods=['DELETE'])
+@session_required
+def revoke_api_key(key_id):
+    """Revoke an API key (other workers stop accepting it within API_KEY_CACHE_TTL)"""
+    try:
+        api_key = ApiKey.query.filter_by(id=key_id, user_id=session['user_id'], revoked_at=None).first()
+        if not api_key:
+            return jsonify({
+                'success': False,
+                'error': 'Not found',
+                'message': 'API key not found'
+            }), 404
+
+        api_key.revoked_at = datetime.utcnow()
+        db.session.commit()
+        apikeys.forget(api_key.key_hash)
+
+        return jsonify({
+            'success': True,
+            'message': 'API key revoked'
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"Revoke API key error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Server error'
+        }), 500
+
 @auth_bp.route('/forgot-password', methods=['POST'])
+@max_body(AUTH_MAX_CONTENT_LENGTH)
 def forgot_password():
     """Request password reset"""
     try:
@@ -295,6 +471,7 @@ def forgot_password():
         }), 500
 
 @auth_bp.route('/reset-password', methods=['POST'])
+@max_body(AUTH_MAX_CONTENT_LENGTH)
 def reset_password():
     """Reset password with token"""
     try:
@@ -338,6 +515,10 @@ def reset_password():
             'message': 'Password reset successful'
         }), 200
         
+    except HashingBusy as e:
+        db.session.rollback()
+        return hashing_busy_response(e)
+    
     except Exception as e:
         db.session.rollback()
         print(f"Reset password error: {str(e)}")
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Many concurrent deductors against one account
+Runs --threads workers that each deduct one credit --deductions times from
+the same user, first with the previous read-modify-write deduction (load the
+User, assign credits, commit) and then with ledger.post. Reports throughput,
+failed deductions, lost updates (cached balance vs start minus successful
+deductions) and the ledger checker's verdict for each.
+
+Uses a temporary SQLite database unless --database-url points at Postgres,
+which is where row-lock contention shows up in production.
+
+Usage: python benchmarks/bench_credit_contention.py [--threads 16] [--deductions 50]
+       [--database-url postgresql://...]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--deductions', type=int, default=50, help='Deductions per thread')
+    parser.add_argument('--database-url', help='Defaults to a temporary SQLite database')
+    return parser.parse_args()
+
+
+args = parse_args()
+DB_PATH = None
+if args.database_url:
+    os.environ['DATABASE_URL'] = args.database_url
+else:
+    DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench_credit_contention.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+
+import NewsScope  # noqa: E402
+import ledger  # noqa: E402
+import response_cache  # noqa: E402
+import rollups  # noqa: E402
+from models import db, User, CreditTransaction  # noqa: E402
+
+
+def legacy_deduct(user_id, amount, description):
+    """The deduction before the ledger: read the balance, write it back"""
+    try:
+        user = db.session.get(User, user_id)
+        if not user or user.credits < amount:
+            return False
+        current_credits = user.credits
+        user.credits = current_credits - amount
+        user.credits_used = (user.credits_used or 0) + amount
+        transaction = CreditTransaction(
+            user_id=user_id, transaction_type='deduct', credits_amount=amount, credits_before=current_credits,
+            credits_after=user.credits, description=description, created_at=datetime.utcnow()
+        )
+        db.session.add(transaction)
+        rollups.record_transaction(user_id, 'deduct', amount, transaction.created_at)
+        response_cache.bump(user_id)
+        db.session.commit()
+        return True
+    except Exception:
+        db.session.rollback()
+        return False
+
+
+def create_user(app, credits):
+    with app.app_context():
+        user = User(email=f'bench-{time.time_ns()}@newsscope.test', name='Bench', credits=credits)
+        user.set_password('benchmark')
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def run(app, deduct, threads, deductions):
+    start_credits = threads * deductions
+    user_id = create_user(app, start_credits)
+    successes = [0] * threads
+    barrier = threading.Barrier(threads)
+
+    def worker(index):
+        with app.app_context():
+            barrier.wait()
+            for _ in range(deductions):
+                if deduct(user_id, 1, 'Contention benchmark'):
+                    successes[index] += 1
+            db.session.remove()
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        succeeded = sum(successes)
+        cached = db.session.get(User, user_id).credits
+        entries = CreditTransaction.query.filter_by(user_id=user_id).order_by(CreditTransaction.id).all()
+        chain_breaks = sum(1 for before, after in zip(entries, entries[1:])
+                           if after.credits_before != before.credits_after)
+        derived = ledger.balance(user_id)
+    return {
+        'rate': succeeded / elapsed,
+        'failed': threads * deductions - succeeded,
+        'lost': cached - (start_credits - succeeded),
+        'chain_breaks': chain_breaks,
+        'ledger_matches': derived == cached and derived == start_credits - succeeded
+    }
+
+
+def main():
+    app = NewsScope.app
+    with app.app_context():
+        NewsScope.initialize_app()
+        backend = db.engine.url.get_backend_name()
+
+    print(f"{args.threads} threads x {args.deductions} deductions on {backend}")
+    print(f"{'path':<10}{'deducts/s':>12}{'failed':>9}{'lost updates':>14}{'chain breaks':>14}{'consistent':>12}")
+    for name, deduct in (('legacy', legacy_deduct), ('ledger', NewsScope.deduct_credits)):
+        result = run(app, deduct, args.threads, args.deductions)
+        print(f"{name:<10}{result['rate']:>12,.0f}{result['failed']:>9}{result['lost']:>14}"
+              f"{result['chain_breaks']:>14}{'yes' if result['ledger_matches'] else 'no':>12}")
+
+    if DB_PATH:
+        os.remove(DB_PATH)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Memory profile of the streaming history export
+Seeds a SQLite database with one user's history, then drains
+export.stream_history and samples the process RSS as rows go out. A flat RSS
+curve means memory does not depend on history size.
+
+Usage: python benchmarks/bench_export.py [--rows 1000000] [--format ndjson] [--gzip]
+"""
+
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import insert
+
+from models import db, User, AnalysisHistory
+import export
+
+
+def rss_mb():
+    """Current resident set size in MB (peak RSS where /proc is unavailable)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def seed(rows):
+    user = User(email='bench@newsscope.test', name='Bench')
+    user.set_password('benchmark')
+    db.session.add(user)
+    db.session.commit()
+
+    text = "Officials confirmed the report on Tuesday, citing figures from the national bureau. " * 20
+    batch = []
+    for i in range(rows):
+        batch.append({
+            'user_id': user.id,
+            'timestamp': datetime.utcnow(),
+            'headline': f"Headline {i}",
+            'news_text': text,
+            'verdict': ('REAL', 'FAKE', 'MISLEADING')[i % 3],
+            'confidence': i % 101,
+            'summary': "Summary of the analysis",
+            'detailed_analysis': text,
+            'red_flags': ["Unnamed sources"],
+            'key_claims': ["Figures rose 4%"],
+            'sources_checked': [{"name": "Reuters", "url": "https://reuters.com"}]
+        })
+        if len(batch) == 10000:
+            db.session.execute(insert(AnalysisHistory), batch)
+            db.session.commit()
+            batch = []
+    if batch:
+        db.session.execute(insert(AnalysisHistory), batch)
+        db.session.commit()
+    return user.id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--format', default='ndjson', choices=list(export.EXPORT_FORMATS))
+    parser.add_argument('--gzip', action='store_true')
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench_export.db')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        user_id = seed(args.rows)
+        print(f"Seeded {args.rows:,} rows in {time.perf_counter() - started:.1f}s")
+        db.session.expunge_all()
+
+        baseline = rss_mb()
+        print(f"RSS before export: {baseline:.1f} MB")
+        print(f"{'rows out':>12}{'bytes out':>16}{'RSS MB':>10}")
+
+        total_bytes = 0
+        rows_out = 0
+        next_report = max(args.rows // 10, 1)
+        started = time.perf_counter()
+        for chunk in export.stream_history(user_id, args.format, gzip=args.gzip):
+            total_bytes += len(chunk)
+            rows_out = min(rows_out + export.EXPORT_BATCH_SIZE, args.rows)
+            if rows_out >= next_report:
+                print(f"{rows_out:>12,}{total_bytes:>16,}{rss_mb():>10.1f}")
+                next_report += max(args.rows // 10, 1)
+        elapsed = time.perf_counter() - started
+
+        print(f"Exported {args.rows:,} rows, {total_bytes:,} bytes in {elapsed:.1f}s "
+              f"({args.rows / elapsed:,.0f} rows/s)")
+        print(f"RSS growth during export: {rss_mb() - baseline:+.1f} MB")
+
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
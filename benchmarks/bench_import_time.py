@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Cold-start import cost of the NewsScope app module
+Imports NewsScope in fresh interpreters with `python -X importtime`, reports
+the median cumulative time and the slowest top-level imports, and exits
+non-zero when the median exceeds the budget or an SDK that should load on
+first use (Gemini, SendGrid, Razorpay, pyarrow) is imported at startup. Run
+it in CI to keep worker boot fast.
+
+Usage: python benchmarks/bench_import_time.py [--runs 5] [--budget-ms 800]
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_TIME_BUDGET_MS = float(os.getenv('IMPORT_TIME_BUDGET_MS', 800))
+LAZY_MODULES = ('google.generativeai', 'sendgrid', 'razorpay', 'pyarrow')
+
+_line = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def measure():
+    """[(self_us, cumulative_us, depth, module)] for one cold import of NewsScope"""
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.gettempdir(), 'bench_import_time.db')}")
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import NewsScope'],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    entries = []
+    for line in result.stderr.splitlines():
+        match = _line.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            entries.append((int(self_us), int(cumulative_us), (len(indent) - 1) // 2, module))
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=IMPORT_TIME_BUDGET_MS)
+    parser.add_argument('--top', type=int, default=10, help='Slowest top-level imports to list')
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.runs)]
+    totals = [next(cumulative for _, cumulative, _, module in entries if module == 'NewsScope') / 1000
+              for entries in runs]
+    median = statistics.median(totals)
+
+    # Direct imports of NewsScope from the last run
+    last = runs[-1]
+    direct = sorted((entry for entry in last if entry[2] == 1), key=lambda entry: entry[1], reverse=True)
+    print(f"{'module':<40}{'cumulative ms':>15}")
+    for _, cumulative, _, module in direct[:args.top]:
+        print(f"{module:<40}{cumulative / 1000:>15.1f}")
+
+    print(f"\nimport NewsScope: median {median:.0f} ms over {args.runs} runs "
+          f"(min {min(totals):.0f}, max {max(totals):.0f}); budget {args.budget_ms:.0f} ms")
+
+    failed = False
+    eager = sorted({lazy for _, _, _, module in last for lazy in LAZY_MODULES
+                    if module == lazy or module.startswith(lazy + '.')})
+    if eager:
+        print(f"✗ Imported at startup, should load on first use: {', '.join(eager)}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"✗ Over budget by {median - args.budget_ms:.0f} ms")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("✓ Within budget")
+
+
+if __name__ == '__main__':
+    main()
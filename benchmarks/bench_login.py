@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Login throughput under a credential-stuffing style burst
+Runs --threads clients posting /api/auth/login as fast as they can for
+--seconds, while one more client polls /api/health to stand in for the rest
+of the API. Done twice: hashing inline in the request thread, as before, and
+through the passwords hashing service with its admission limit. Reports
+successful logins/s, 503s/s, login latency, and the health endpoint's
+latency during the burst.
+
+Both runs share one process, so the admission limit here is what a single
+host would see.
+
+Usage: python benchmarks/bench_login.py [--threads 16] [--seconds 5]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench_login.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+
+import NewsScope  # noqa: E402
+import passwords  # noqa: E402
+from models import db, User  # noqa: E402
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    return sorted(samples)[min(int(len(samples) * fraction), len(samples) - 1)]
+
+
+def seed(app):
+    with app.app_context():
+        NewsScope.initialize_app()
+        password_hash = passwords._hash('benchmark', passwords.TARGET_METHOD)
+        db.session.add_all([User(email=f'login-{i}@newsscope.test', name='Bench', password_hash=password_hash)
+                            for i in range(100)])
+        db.session.commit()
+
+
+def run(app, threads, seconds):
+    deadline = time.monotonic() + seconds
+    logins, rejected, latencies, health = [], [], [], []
+
+    def client(index):
+        http = app.test_client()
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            response = http.post('/api/auth/login', json={'email': f'login-{index % 100}@newsscope.test',
+                                                          'password': 'benchmark'})
+            elapsed = time.perf_counter() - started
+            (logins if response.status_code == 200 else rejected).append(elapsed)
+            if response.status_code == 200:
+                latencies.append(elapsed)
+
+    def poll_health():
+        http = app.test_client()
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            http.get('/api/health')
+            health.append(time.perf_counter() - started)
+            time.sleep(0.02)
+
+    workers = [threading.Thread(target=client, args=(i,)) for i in range(threads)]
+    workers.append(threading.Thread(target=poll_health))
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return {
+        'logins': len(logins) / seconds,
+        'rejected': len(rejected) / seconds,
+        'login_p50': statistics.median(latencies) * 1000 if latencies else 0.0,
+        'login_p95': percentile(latencies, 0.95) * 1000,
+        'health_p50': statistics.median(health) * 1000 if health else 0.0,
+        'health_p95': percentile(health, 0.95) * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args()
+
+    app = NewsScope.app
+    seed(app)
+
+    print(f"{args.threads} login clients for {args.seconds:.0f}s, {passwords.TARGET_METHOD}, "
+          f"{os.cpu_count()} CPUs, hash concurrency {passwords.PASSWORD_HASH_CONCURRENCY}, "
+          f"queue {passwords.PASSWORD_HASH_QUEUE_LIMIT}")
+    print(f"{'mode':<10}{'logins/s':>10}{'503/s':>8}{'login p50':>11}{'login p95':>11}"
+          f"{'health p50':>12}{'health p95':>12}")
+    for mode, offload in (('inline', False), ('service', True)):
+        passwords.PASSWORD_HASH_OFFLOAD = offload
+        result = run(app, args.threads, args.seconds)
+        print(f"{mode:<10}{result['logins']:>10.1f}{result['rejected']:>8.1f}{result['login_p50']:>9.0f}ms"
+              f"{result['login_p95']:>9.0f}ms{result['health_p50']:>10.0f}ms{result['health_p95']:>10.0f}ms")
+
+    os.remove(DB_PATH)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Parse success rate and parse time for Gemini analysis responses
+Replays the recorded outputs in gemini_outputs.jsonl plus fuzzed variants
+(truncation, trailing commas, fences, surrounding prose) through
+gemini_parser.parse_analysis and through the previous fence-slicing parser.
+
+Usage: python benchmarks/bench_parser.py [--mutations 200] [--seed 1]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gemini_parser import parse_analysis
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gemini_outputs.jsonl')
+
+
+def legacy_parse(response_text):
+    """The fence-slicing parser analyze_with_gemini used before gemini_parser"""
+    if "```json" in response_text:
+        json_start = response_text.find("```json") + 7
+        json_end = response_text.find("```", json_start)
+        response_text = response_text[json_start:json_end].strip()
+    elif "```" in response_text:
+        json_start = response_text.find("```") + 3
+        json_end = response_text.find("```", json_start)
+        response_text = response_text[json_start:json_end].strip()
+    try:
+        return json.loads(response_text), True
+    except json.JSONDecodeError:
+        upper = response_text.upper()
+        if "FAKE" in upper:
+            verdict = "FAKE"
+        elif "MISLEADING" in upper:
+            verdict = "MISLEADING"
+        elif "REAL" in upper:
+            verdict = "REAL"
+        else:
+            verdict = "UNCERTAIN"
+        return {"verdict": verdict, "confidence": 70}, False
+
+
+def mutate(output, rng):
+    """Return a damaged copy of a model output"""
+    kind = rng.choice(['truncate', 'trailing_comma', 'fence', 'prose'])
+    if kind == 'truncate':
+        start = output.find('{')
+        if start == -1:
+            return output
+        # Cut somewhere after the verdict so the expected answer is still present
+        verdict_at = output.find('"verdict"')
+        low = max(start, verdict_at + 25 if verdict_at != -1 else start)
+        return output[:rng.randint(min(low, len(output)), len(output))]
+    if kind == 'trailing_comma':
+        positions = [i for i, c in enumerate(output) if c in ']}']
+        if not positions:
+            return output
+        i = rng.choice(positions)
+        return output[:i] + ',' + output[i:]
+    if kind == 'fence':
+        return "```json\n" + output + "\n```"
+    return "Sure! Here is the analysis you asked for.\n" + output + "\nHope this helps."
+
+
+def run(parse, samples):
+    parsed = correct = 0
+    started = time.perf_counter()
+    for expected, text in samples:
+        result, ok = parse(text)
+        parsed += ok
+        verdict = str(result.get('verdict', '')).upper() if isinstance(result, dict) else ''
+        correct += verdict == expected
+    elapsed = time.perf_counter() - started
+    return parsed, correct, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mutations', type=int, default=200, help='Fuzzed variants per recorded output')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with open(CORPUS) as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+
+    samples = [(row['expected_verdict'], row['output']) for row in corpus]
+    for row in corpus:
+        for _ in range(args.mutations):
+            samples.append((row['expected_verdict'], mutate(row['output'], rng)))
+
+    # Arbitrary garbage must never raise
+    for _ in range(args.mutations * 10):
+        garbage = ''.join(rng.choice('{}[]",:\\ abn1-.e\n') for _ in range(rng.randint(0, 60)))
+        parse_analysis(garbage)
+
+    print(f"{len(corpus)} recorded outputs, {len(samples)} samples with fuzzing")
+    print(f"{'parser':<10}{'parsed':>10}{'verdict ok':>12}{'us/parse':>10}")
+    for name, parse in (('legacy', legacy_parse), ('current', parse_analysis)):
+        parsed, correct, elapsed = run(parse, samples)
+        print(f"{name:<10}{parsed / len(samples):>10.1%}{correct / len(samples):>12.1%}"
+              f"{elapsed / len(samples) * 1e6:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Query-plan check for the hot per-user endpoints
+Seeds a database with many users' history, transactions and payment orders,
+runs each endpoint (and the payment settle/reconcile paths) once while
+recording the SQL it issues, then EXPLAINs every statement. Exits non-zero
+when a plan reads a large table in full or sorts rows ahead of a LIMIT,
+i.e. when a page query isn't served in order by an index. Run it in CI
+after schema or query changes.
+
+Uses a temporary SQLite database unless --database-url points at Postgres.
+The seeded tables are analyzed first so the planner sees realistic sizes.
+
+Usage: python benchmarks/bench_query_plans.py [--users 200] [--rows 100] [--verbose]
+       [--database-url postgresql://...]
+"""
+
+import argparse
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--rows', type=int, default=100, help='Analyses, transactions and orders per user')
+    parser.add_argument('--verbose', action='store_true', help='Print every plan, not just failures')
+    parser.add_argument('--database-url', help='Defaults to a temporary SQLite database')
+    return parser.parse_args()
+
+
+args = parse_args()
+DB_PATH = None
+if args.database_url:
+    os.environ['DATABASE_URL'] = args.database_url
+else:
+    DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench_query_plans.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+
+from sqlalchemy import event, insert  # noqa: E402
+
+import NewsScope  # noqa: E402
+import payments  # noqa: E402
+import response_cache  # noqa: E402
+from models import (db, User, AnalysisHistory, AnalysisRedFlag, AnalysisClaim, CreditTransaction,  # noqa: E402
+                    PaymentOrder)
+
+# Tables that grow with usage; a full scan of one of these fails the check
+LARGE_TABLES = {'users', 'analysis_history', 'analysis_red_flags', 'analysis_claims', 'analysis_sources',
+                'credit_transactions', 'payment_orders'}
+
+
+def seed(users, rows):
+    """Bulk-insert users with rows of each kind; returns the id of a user in the middle"""
+    now = datetime.utcnow()
+    db.session.execute(insert(User), [{
+        'email': f'plan-{i}@newsscope.test', 'name': f'User {i}', 'password_hash': 'x', 'credits': rows,
+        'credits_used': 0, 'data_version': 0, 'created_at': now
+    } for i in range(users)])
+    user_ids = db.session.execute(db.select(User.id).order_by(User.id)).scalars().all()
+
+    text = "Officials confirmed the report on Tuesday, citing figures from the national bureau. " * 3
+    db.session.execute(insert(AnalysisHistory), [{
+        'user_id': user_id, 'timestamp': now - timedelta(minutes=i), 'headline': f"Headline {i}",
+        'news_text': text, 'verdict': ('REAL', 'FAKE', 'MISLEADING')[i % 3], 'confidence': i % 101,
+        'summary': "Summary", 'key_claims': ["Figures rose 4%"]
+    } for user_id in user_ids for i in range(rows)])
+    analysis_ids = db.session.execute(db.select(AnalysisHistory.id)).scalars().all()
+    db.session.execute(insert(AnalysisRedFlag), [
+        {'analysis_id': analysis_id, 'position': 0, 'text': "Unnamed sources", 'text_key': "unnamed sources"}
+        for analysis_id in analysis_ids
+    ])
+    db.session.execute(insert(AnalysisClaim), [
+        {'analysis_id': analysis_id, 'position': 0, 'text': "Figures rose 4%", 'text_key': "figures rose 4%"}
+        for analysis_id in analysis_ids
+    ])
+
+    db.session.execute(insert(CreditTransaction), [{
+        'user_id': user_id, 'transaction_type': 'deduct', 'credits_amount': 1, 'credits_before': rows - i,
+        'credits_after': rows - i - 1, 'description': 'News analysis', 'created_at': now - timedelta(minutes=i)
+    } for user_id in user_ids for i in range(rows)])
+    # A few recent unsettled orders among many settled ones
+    db.session.execute(insert(PaymentOrder), [{
+        'user_id': user_id, 'order_id': f'order_{user_id}_{i}', 'amount': 99.0, 'currency': 'INR',
+        'credits_amount': 10, 'status': 'created' if i == 0 and user_id % 10 == 0 else 'paid',
+        'payment_id': f'pay_{user_id}_{i}', 'created_at': now - timedelta(minutes=30 + i)
+    } for user_id in user_ids for i in range(rows)])
+    db.session.commit()
+
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql('ANALYZE')
+    return user_ids[len(user_ids) // 2]
+
+
+class _NoCapturedPayments:
+    """Stands in for the Razorpay client: no order has a captured payment"""
+
+    class order:
+        @staticmethod
+        def payments(order_id):
+            return {'items': []}
+
+
+def cases(client, user_id):
+    """(name, callable) for every code path checked"""
+    def get(path):
+        def run():
+            response = client.get(path)
+            assert response.status_code == 200, (path, response.status_code)
+        return run
+
+    def reset_password():
+        client.post('/api/auth/reset-password', json={'token': 'not-a-token', 'password': 'secret123'})
+
+    def settle_again():
+        # Already paid: the conditional UPDATE misses and the order is looked up
+        order_id = f'order_{user_id}_1'
+        payments.settle_order(order_id, f'pay_{user_id}_1', user_id=user_id)
+        db.session.rollback()
+
+    def reconcile():
+        payments.reconcile(_NoCapturedPayments())
+
+    return [
+        ('GET /api/history', get('/api/history?page=2&per_page=20')),
+        ('GET /api/dashboard', get('/api/dashboard')),
+        ('GET /api/credits/transactions', get('/api/credits/transactions')),
+        ('GET /api/payment/orders', get('/api/payment/orders')),
+        ('POST /api/auth/reset-password', reset_password),
+        ('payments.settle_order', settle_again),
+        ('payments.reconcile', reconcile),
+    ]
+
+
+def capture(run):
+    """Statements (with parameters) issued by run()"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and re.match(r'\s*(SELECT|UPDATE|DELETE|WITH)\b', statement, re.I):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        run()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return statements
+
+
+def _has_limit(statement):
+    return re.search(r'\bLIMIT\b', statement, re.I) is not None
+
+
+def sqlite_plan(conn, statement, parameters):
+    """(plan lines, problems) from EXPLAIN QUERY PLAN"""
+    lines = [row[3] for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)]
+    problems = []
+    for line in lines:
+        scan = re.match(r'SCAN (\w+)', line)
+        if scan and scan.group(1) in LARGE_TABLES:
+            problems.append(f"full scan of {scan.group(1)}")
+        if 'TEMP B-TREE FOR' in line and 'ORDER BY' in line and _has_limit(statement):
+            problems.append("sort before LIMIT")
+    return lines, problems
+
+
+def _postgres_nodes(node, depth=0):
+    yield node, depth
+    for child in node.get('Plans', []):
+        yield from _postgres_nodes(child, depth + 1)
+
+
+def postgres_plan(conn, statement, parameters):
+    """(plan lines, problems) from EXPLAIN (FORMAT JSON)"""
+    plan = conn.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {statement}', parameters).scalar()[0]['Plan']
+    lines, problems = [], []
+    for node, depth in _postgres_nodes(plan):
+        relation = node.get('Relation Name')
+        line = '  ' * depth + node['Node Type']
+        if relation:
+            line += f" on {relation}"
+        if node.get('Index Name'):
+            line += f" using {node['Index Name']}"
+        lines.append(line)
+        if node['Node Type'] == 'Seq Scan' and relation in LARGE_TABLES:
+            problems.append(f"full scan of {relation}")
+        if node['Node Type'] == 'Limit' and any(child['Node Type'] in ('Sort', 'Incremental Sort')
+                                                for child, _ in _postgres_nodes(node)):
+            problems.append("sort before LIMIT")
+    return lines, problems
+
+
+def main():
+    app = NewsScope.app
+    with app.app_context():
+        NewsScope.initialize_app()
+        user_id = seed(args.users, args.rows)
+        dialect = db.engine.dialect.name
+    explain = postgres_plan if dialect == 'postgresql' else sqlite_plan
+    response_cache.RESPONSE_CACHE_ENABLED = False
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+
+    print(f"{args.users} users x {args.rows} rows on {dialect}\n")
+    failures = 0
+    with app.app_context():
+        for name, run in cases(client, user_id):
+            statements = capture(run)
+            bad = []
+            with db.engine.connect() as conn:
+                for statement, parameters in statements:
+                    lines, problems = explain(conn, statement, parameters)
+                    if problems or args.verbose:
+                        bad.append((statement, lines, problems))
+                    failures += bool(problems)
+            failed = any(problems for _, _, problems in bad)
+            print(f"{'✗' if failed else '✓'} {name} ({len(statements)} queries)")
+            for statement, lines, problems in bad:
+                print(f"    {' '.join(statement.split())[:160]}")
+                for line in lines:
+                    print(f"      {line}")
+                for problem in problems:
+                    print(f"      ✗ {problem}")
+
+    if DB_PATH:
+        os.remove(DB_PATH)
+    if failures:
+        print(f"\n✗ {failures} queries with full scans or sorts on large tables")
+        sys.exit(1)
+    print("\n✓ Every query is served by an index")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Requests per second for the cached read-mostly endpoints
+Runs the real app on a temporary SQLite database through Flask's test client
+and measures each route three ways: with the response cache disabled, as a
+cache hit, and as a 304 revalidation with If-None-Match.
+
+Usage: python benchmarks/bench_response_cache.py [--seconds 2] [--analyses 500]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench_response_cache.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+
+import NewsScope  # noqa: E402
+import response_cache  # noqa: E402
+from history import save_analyses  # noqa: E402
+from models import db, User  # noqa: E402
+
+ROUTES = [
+    ('/', False),
+    ('/api/sources', False),
+    ('/api/credits/packages', False),
+    ('/api/credits/balance', True),
+    ('/api/dashboard', True),
+    ('/api/dashboard/timeseries?range=90d', True),
+]
+
+
+def seed(analyses):
+    user = User(email='bench@newsscope.test', name='Bench')
+    user.set_password('benchmark')
+    db.session.add(user)
+    db.session.commit()
+    now = datetime.utcnow()
+    save_analyses([{
+        'user_id': user.id,
+        'timestamp': now - timedelta(hours=i),
+        'headline': f"Headline {i}",
+        'news_text': "Officials confirmed the report on Tuesday. " * 10,
+        'verdict': ('REAL', 'FAKE', 'MISLEADING')[i % 3],
+        'confidence': i % 101,
+        'summary': "Summary of the analysis",
+        'detailed_analysis': "Detailed analysis text. " * 20,
+        'red_flags': ["Unnamed sources"],
+        'key_claims': ["Figures rose 4%"],
+        'sources_checked': [{"name": "Reuters", "url": "https://reuters.com", "credibility": "high",
+                             "checked": True, "type": "news"}]
+    } for i in range(analyses)])
+    return user.id
+
+
+def rps(client, path, seconds, headers=None, expect=200):
+    count = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        response = client.get(path, headers=headers)
+        assert response.status_code == expect, (path, response.status_code)
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=2.0, help='Duration of each measurement')
+    parser.add_argument('--analyses', type=int, default=500, help='History rows seeded for the user')
+    args = parser.parse_args()
+
+    app = NewsScope.app
+    with app.app_context():
+        NewsScope.initialize_app()
+        user_id = seed(args.analyses)
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+
+    print(f"{'route':<40}{'uncached':>12}{'cached':>12}{'304':>12}{'speedup':>10}")
+    for path, _ in ROUTES:
+        response_cache.RESPONSE_CACHE_ENABLED = False
+        uncached = rps(client, path, args.seconds)
+
+        response_cache.RESPONSE_CACHE_ENABLED = True
+        response_cache.clear()
+        etag = client.get(path).headers['ETag']
+        cached = rps(client, path, args.seconds)
+        not_modified = rps(client, path, args.seconds, headers={'If-None-Match': etag}, expect=304)
+
+        print(f"{path:<40}{uncached:>12,.0f}{cached:>12,.0f}{not_modified:>12,.0f}{cached / uncached:>9.1f}x")
+
+    os.remove(DB_PATH)
+
+
+if __name__ == '__main__':
+    main()
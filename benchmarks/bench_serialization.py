@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Serialization cost of 1,000-row API payloads
+Seeds a SQLite database with analyses, credit transactions and payment
+orders, then times building the JSON response two ways: ORM objects through
+to_dict() and Flask's stdlib provider (the old path), and Core rows through
+the slotted row serializers and serializers.JSONProvider (orjson when
+installed). Query time is included, since skipping ORM object construction
+is part of the gain.
+
+Usage: python benchmarks/bench_serialization.py [--rows 1000] [--repeat 20]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import insert
+
+from models import db, User, AnalysisHistory, CreditTransaction, PaymentOrder
+from history import save_analyses
+import serializers
+
+
+def seed(rows):
+    user = User(email='bench@newsscope.test', name='Bench')
+    user.set_password('benchmark')
+    db.session.add(user)
+    db.session.commit()
+
+    now = datetime.utcnow()
+    text = "Officials confirmed the report on Tuesday, citing figures from the national bureau. " * 5
+    save_analyses([{
+        'user_id': user.id,
+        'timestamp': now - timedelta(minutes=i),
+        'headline': f"Headline {i}",
+        'news_text': text,
+        'verdict': ('REAL', 'FAKE', 'MISLEADING')[i % 3],
+        'confidence': i % 101,
+        'summary': "Summary of the analysis",
+        'detailed_analysis': text,
+        'red_flags': ["Unnamed sources", "Emotional language"],
+        'key_claims': ["Figures rose 4%"],
+        'sources_checked': [{"name": f"Source {i % 20}", "url": "https://example.com", "credibility": "high",
+                             "checked": True, "type": "news"}]
+    } for i in range(rows)])
+    db.session.execute(insert(CreditTransaction), [{
+        'user_id': user.id, 'transaction_type': 'deduct', 'credits_amount': 1, 'credits_before': rows - i,
+        'credits_after': rows - i - 1, 'description': 'News analysis', 'created_at': now - timedelta(minutes=i)
+    } for i in range(rows)])
+    db.session.execute(insert(PaymentOrder), [{
+        'user_id': user.id, 'order_id': f"order_{i}", 'amount': 99.0, 'currency': 'INR', 'credits_amount': 10,
+        'status': 'paid', 'payment_id': f"pay_{i}", 'created_at': now - timedelta(minutes=i),
+        'updated_at': now - timedelta(minutes=i)
+    } for i in range(rows)])
+    db.session.commit()
+    return user.id
+
+
+def best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        started = time.perf_counter()
+        body = fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench_serialization.db')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    stdlib = DefaultJSONProvider(app)
+    fast = serializers.JSONProvider(app)
+
+    payloads = [
+        ('analyses', AnalysisHistory, AnalysisHistory.timestamp, serializers.analysis_rows),
+        ('transactions', CreditTransaction, CreditTransaction.created_at, serializers.transaction_rows),
+        ('orders', PaymentOrder, PaymentOrder.created_at, serializers.order_rows),
+    ]
+
+    with app.app_context():
+        db.create_all()
+        user_id = seed(args.rows)
+        print(f"JSON encoder: {'orjson' if serializers.orjson else 'stdlib json'}")
+        print(f"{'payload':<14}{'to_dict+json ms':>17}{'rows+provider ms':>18}{'speedup':>10}{'bytes':>12}")
+
+        for name, model, order, serializer in payloads:
+            def old_path():
+                items = model.query.filter_by(user_id=user_id).order_by(order.desc()).limit(args.rows).all()
+                return stdlib.response({name: [item.to_dict() for item in items]}).get_data()
+
+            def new_path():
+                rows = db.session.execute(
+                    serializer.select().where(model.user_id == user_id).order_by(order.desc()).limit(args.rows)
+                ).all()
+                return fast.response({name: serializer(rows)}).get_data()
+
+            old_ms, old_bytes = best_of(args.repeat, old_path)
+            new_ms, new_bytes = best_of(args.repeat, new_path)
+            print(f"{name:<14}{old_ms:>17.1f}{new_ms:>18.1f}{old_ms / new_ms:>9.1f}x{new_bytes:>12,}")
+
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Bytes on the wire for typical dashboard, history and export responses
+Runs the real app on a temporary SQLite database through Flask's test client
+and fetches each route with Accept-Encoding identity, gzip and br (when the
+Brotli package is installed). Reports the body size for each encoding and
+the time per request, uncached (compressed per request) and as a response
+cache hit (compressed body served from the cache).
+
+Usage: python benchmarks/bench_wire_bytes.py [--analyses 500] [--requests 50]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench_wire_bytes.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'
+
+import NewsScope  # noqa: E402
+import compression  # noqa: E402
+import response_cache  # noqa: E402
+from history import save_analyses  # noqa: E402
+from models import db, User  # noqa: E402
+
+ROUTES = [
+    '/',
+    '/api/dashboard',
+    '/api/dashboard/timeseries?range=90d',
+    '/api/history?per_page=20',
+    '/api/history?per_page=100',
+    '/api/history/export?format=ndjson',
+]
+
+
+def seed(analyses):
+    user = User(email='bench@newsscope.test', name='Bench')
+    user.set_password('benchmark')
+    db.session.add(user)
+    db.session.commit()
+    now = datetime.utcnow()
+    save_analyses([{
+        'user_id': user.id,
+        'timestamp': now - timedelta(hours=i),
+        'headline': f"Headline {i}",
+        'news_text': "Officials confirmed the report on Tuesday. " * 10,
+        'verdict': ('REAL', 'FAKE', 'MISLEADING')[i % 3],
+        'confidence': i % 101,
+        'summary': "Summary of the analysis",
+        'detailed_analysis': "Detailed analysis text. " * 20,
+        'red_flags': ["Unnamed sources"],
+        'key_claims': ["Figures rose 4%"],
+        'sources_checked': [{"name": "Reuters", "url": "https://reuters.com", "credibility": "high",
+                             "checked": True, "type": "news"}]
+    } for i in range(analyses)])
+    return user.id
+
+
+def fetch(client, path, encoding, requests):
+    """(bytes on the wire, ms per request)"""
+    headers = {'Accept-Encoding': encoding}
+    response = client.get(path, headers=headers)
+    assert response.status_code == 200, (path, response.status_code)
+    size = len(response.get_data())
+    assert response.headers.get('Content-Encoding', 'identity') == encoding or size < compression.COMPRESS_MIN_SIZE
+    started = time.perf_counter()
+    for _ in range(requests):
+        client.get(path, headers=headers).get_data()
+    return size, (time.perf_counter() - started) * 1000 / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--analyses', type=int, default=500, help='History rows seeded for the user')
+    parser.add_argument('--requests', type=int, default=50, help='Requests timed per route and encoding')
+    args = parser.parse_args()
+
+    app = NewsScope.app
+    with app.app_context():
+        NewsScope.initialize_app()
+        user_id = seed(args.analyses)
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+
+    encodings = ['identity', 'gzip'] + (['br'] if compression.brotli is not None else [])
+    if compression.brotli is None:
+        print("Brotli is not installed; measuring identity and gzip only")
+
+    print(f"{'route':<38}{'encoding':>9}{'bytes':>11}{'ratio':>8}{'uncached':>11}{'cached':>10}")
+    for path in ROUTES:
+        plain = None
+        for encoding in encodings:
+            response_cache.RESPONSE_CACHE_ENABLED = False
+            size, uncached_ms = fetch(client, path, encoding, args.requests)
+            response_cache.RESPONSE_CACHE_ENABLED = True
+            response_cache.clear()
+            _, cached_ms = fetch(client, path, encoding, args.requests)
+            plain = plain or size
+            print(f"{path:<38}{encoding:>9}{size:>11,}{plain / size:>7.1f}x"
+                  f"{uncached_ms:>9.2f}ms{cached_ms:>8.2f}ms")
+
+    os.remove(DB_PATH)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Response compression
+JSON and text responses of COMPRESS_MIN_SIZE bytes or more are compressed
+for clients that accept it: brotli when the Brotli package is installed and
+the client lists it, gzip otherwise. Streamed responses (the history export
+as NDJSON or CSV) are compressed chunk by chunk as they are produced.
+Already-compressed downloads (?gzip=1, Parquet) are left alone.
+
+Views cached by response_cache.py store their compressed body next to the
+plain one, at a higher level, so a cache hit is served without compressing
+again. Compressed responses carry a weak ETag; If-None-Match compares
+weakly, so one ETag covers every encoding of a body.
+
+Configuration:
+    COMPRESS_ENABLED        Set to false to send everything uncompressed (default true)
+    COMPRESS_MIN_SIZE       Smaller bodies are sent as they are (default 1024)
+    COMPRESS_GZIP_LEVEL     gzip level for responses compressed per request (default 6)
+    COMPRESS_BROTLI_QUALITY brotli quality for responses compressed per request (default 5)
+"""
+
+import os
+import zlib
+
+from flask import request
+
+import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_ENABLED = os.getenv('COMPRESS_ENABLED', 'true').lower() == 'true'
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+COMPRESS_GZIP_LEVEL = int(os.getenv('COMPRESS_GZIP_LEVEL', 6))
+COMPRESS_BROTLI_QUALITY = int(os.getenv('COMPRESS_BROTLI_QUALITY', 5))
+
+# Cached bodies are compressed once and served many times, so spend more CPU on them
+_CACHED_GZIP_LEVEL = 9
+_CACHED_BROTLI_QUALITY = 9
+
+_COMPRESSIBLE = {'application/json', 'application/x-ndjson', 'application/javascript', 'image/svg+xml'}
+
+
+def compressible(mimetype):
+    return bool(mimetype) and (mimetype.startswith('text/') or mimetype in _COMPRESSIBLE)
+
+
+def negotiate(accept_encodings):
+    """'br', 'gzip' or None for a request's Accept-Encoding"""
+    if not COMPRESS_ENABLED:
+        return None
+    if brotli is not None and accept_encodings['br'] > 0:
+        return 'br'
+    if accept_encodings['gzip'] > 0:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding, cached=False):
+    """Compress a whole body with 'br' or 'gzip'"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=_CACHED_BROTLI_QUALITY if cached else COMPRESS_BROTLI_QUALITY)
+    # wbits=31 writes a gzip container
+    compressor = zlib.compressobj(_CACHED_GZIP_LEVEL if cached else COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _compress_stream(chunks, encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+        compress_chunk, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)
+        compress_chunk, finish = compressor.compress, compressor.flush
+    try:
+        for chunk in chunks:
+            data = compress_chunk(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+            if data:
+                yield data
+        yield finish()
+    finally:
+        # Closing the wrapped generator ends stream_with_context's request context
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def _mark_encoded(response, encoding):
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+
+def _compress_response(response):
+    if (request.method == 'HEAD' or response.status_code < 200 or response.status_code in (204, 304)
+            or response.direct_passthrough or 'Content-Encoding' in response.headers
+            or not compressible(response.mimetype)):
+        return response
+
+    if response.is_streamed:
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate(request.accept_encodings)
+        if encoding:
+            response.response = _compress_stream(response.response, encoding)
+            response.headers.pop('Content-Length', None)
+            _mark_encoded(response, encoding)
+            metrics.increment(f'compression.streamed.{encoding}')
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(request.accept_encodings)
+    if encoding:
+        compressed = compress(data, encoding)
+        response.set_data(compressed)
+        _mark_encoded(response, encoding)
+        metrics.increment(f'compression.{encoding}')
+        metrics.increment('compression.bytes_saved', len(data) - len(compressed))
+    return response
+
+
+def init_app(app):
+    """Compress responses after every other after_request hook has run; call first"""
+    app.after_request(_compress_response)
@@ -0,0 +1,186 @@
+"""
+Streaming export of a user's analysis history
+Rows are read through a server-side cursor in EXPORT_BATCH_SIZE chunks and
+encoded straight into the response, so memory use does not grow with the
+size of the history. Output can be NDJSON, CSV or Parquet (when pyarrow is
+installed) and optionally gzip-compressed on the fly.
+"""
+
+import csv
+import io
+import json
+import os
+import zlib
+from sqlalchemy import select
+
+import archive
+from history import load_details
+from models import db, AnalysisHistory
+
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+
+EXPORT_FORMATS = {
+    'ndjson': {'mimetype': 'application/x-ndjson', 'extension': 'ndjson'},
+    'csv': {'mimetype': 'text/csv', 'extension': 'csv'},
+    'parquet': {'mimetype': 'application/vnd.apache.parquet', 'extension': 'parquet'}
+}
+
+EXPORT_FIELDS = [
+    'id', 'timestamp', 'headline', 'news_text', 'verdict', 'confidence', 'summary',
+    'detailed_analysis', 'red_flags', 'key_claims', 'sources_checked', 'source_url'
+]
+LIST_FIELDS = ('red_flags', 'key_claims', 'sources_checked')
+
+_columns = [
+    AnalysisHistory.id, AnalysisHistory.timestamp, AnalysisHistory.headline, AnalysisHistory.news_text,
+    AnalysisHistory.verdict, AnalysisHistory.confidence, AnalysisHistory.summary,
+    AnalysisHistory.detailed_analysis, AnalysisHistory.red_flags, AnalysisHistory.key_claims,
+    AnalysisHistory.sources_checked, AnalysisHistory.source_url, AnalysisHistory.archived_at, AnalysisHistory.archive_blob,
+    AnalysisHistory.archive_dictionary_id
+]
+
+
+class ExportError(ValueError):
+    """Unsupported export request"""
+
+
+def _records(user_id):
+    """Yield export dicts for a user's analyses, oldest first, in constant memory"""
+    result = db.session.execute(
+        select(*_columns)
+        .where(AnalysisHistory.user_id == user_id)
+        .order_by(AnalysisHistory.id)
+        .execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)
+    )
+    for rows in result.partitions():
+        details = load_details(rows)
+        for row in rows:
+            news_text, detailed_analysis = row.news_text, row.detailed_analysis
+            if row.archived_at is not None:
+                payload = archive.decompress(row.archive_blob, row.archive_dictionary_id)
+                news_text, detailed_analysis = payload['news_text'], payload['detailed_analysis']
+            yield {
+                'id': row.id,
+                'timestamp': row.timestamp.isoformat() + 'Z' if row.timestamp else None,
+                'headline': row.headline,
+                'news_text': news_text,
+                'verdict': row.verdict,
+                'confidence': row.confidence,
+                'summary': row.summary,
+                'detailed_analysis': detailed_analysis,
+                **details[row.id],
+                'source_url': row.source_url
+            }
+
+
+def _batches(records):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _ndjson(records):
+    for batch in _batches(records):
+        yield ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in batch).encode('utf-8')
+
+
+def _csv(records):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for batch in _batches(records):
+        for record in batch:
+            for field in LIST_FIELDS:
+                record[field] = json.dumps(record[field], ensure_ascii=False) if record[field] is not None else ''
+            writer.writerow(record)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands written bytes back to the generator"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _pyarrow():
+    """pyarrow, imported on first Parquet export since it is slow to load; None if missing"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def _parquet(records):
+    pyarrow = _pyarrow()
+    # List columns are stored as JSON strings to keep the schema flat
+    schema = pyarrow.schema([
+        ('id', pyarrow.int64()),
+        ('timestamp', pyarrow.string()),
+        ('headline', pyarrow.string()),
+        ('news_text', pyarrow.string()),
+        ('verdict', pyarrow.string()),
+        ('confidence', pyarrow.int32()),
+        ('summary', pyarrow.string()),
+        ('detailed_analysis', pyarrow.string()),
+        ('red_flags', pyarrow.string()),
+        ('key_claims', pyarrow.string()),
+        ('sources_checked', pyarrow.string()),
+        ('source_url', pyarrow.string())
+    ])
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema, compression='zstd')
+    for batch in _batches(records):
+        columns = {field: [record[field] for record in batch] for field in EXPORT_FIELDS}
+        for field in LIST_FIELDS:
+            columns[field] = [json.dumps(value, ensure_ascii=False) if value is not None else None
+                              for value in columns[field]]
+        # One row group per batch keeps only a single batch in memory
+        writer.write_table(pyarrow.table(columns, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_history(user_id, fmt='ndjson', gzip=False):
+    """Return a generator of encoded export bytes for a user's history"""
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f"Unsupported format '{fmt}'. Use one of: {', '.join(EXPORT_FORMATS)}")
+    if fmt == 'parquet' and _pyarrow() is None:
+        raise ExportError("Parquet export requires pyarrow to be installed")
+
+    encoder = {'ndjson': _ndjson, 'csv': _csv, 'parquet': _parquet}[fmt]
+    chunks = encoder(_records(user_id))
+    return _gzip(chunks) if gzip else chunks
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+RSS/Atom feed watcher
+Polls the configured feeds with conditional GET (ETag / Last-Modified), stores
+new entries deduplicated by normalized URL and content hash, and pre-analyzes
+them into the analysis cache during off-peak quota windows. When a user later
+submits the same story, generate_report answers from the cache.
+
+Feeds may be http(s) URLs, file:// URLs or plain paths, so the watcher can be
+exercised against feed fixtures on disk.
+
+Configuration:
+    FEED_URLS                  Comma-separated feed URLs
+    FEED_OFFPEAK_HOURS         UTC hours when pre-analysis may run, e.g. "0-6,22-23"
+                               (empty: any hour)
+    FEED_MAX_QUOTA_SHARE       Only pre-analyze while the current quota window is
+                               below this share of GEMINI_RPM (default 0.5)
+    FEED_MAX_ANALYSES          Pre-analyses per poll (default 20)
+    FEED_MAX_BYTES             Larger feeds are rejected unparsed (default 5 MB)
+
+Usage:
+    python feeds.py poll [--feed URL ...] [--no-analyze] [--force]
+    python feeds.py watch [--interval 300]
+"""
+
+import argparse
+import email.utils
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from html.parser import HTMLParser
+from urllib.parse import urlsplit, unquote
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+import analysis_cache
+from fetcher import FetchError, normalize_url, session
+from governor import governor, PRIORITY_BACKGROUND
+from models import db, FeedSource, FeedEntry
+from singleflight import article_hash, url_key
+
+FEED_URLS = [url.strip() for url in os.getenv('FEED_URLS', '').split(',') if url.strip()]
+FEED_OFFPEAK_HOURS = os.getenv('FEED_OFFPEAK_HOURS', '')
+FEED_MAX_QUOTA_SHARE = float(os.getenv('FEED_MAX_QUOTA_SHARE', 0.5))
+FEED_MAX_ANALYSES = int(os.getenv('FEED_MAX_ANALYSES', 20))
+FEED_MAX_BYTES = int(os.getenv('FEED_MAX_BYTES', 5 * 1024 * 1024))
+FEED_POLL_INTERVAL = int(os.getenv('FEED_POLL_INTERVAL', 300))
+FEED_TIMEOUT = 15
+MIN_TEXT_LENGTH = 10
+
+class _TextExtractor(HTMLParser):
+    """Collects the text content of an HTML fragment"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('script', 'style'):
+            self._skip += 1
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style') and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def html_to_text(html):
+    parser = _TextExtractor()
+    parser.feed(html or '')
+    parser.close()
+    return re.sub(r'\s+', ' ', ''.join(parser.parts)).strip()
+
+
+def _local_path(url):
+    if url.startswith('file://'):
+        return unquote(urlsplit(url).path)
+    if '://' not in url:
+        return url
+    return None
+
+
+def fetch_feed(source):
+    """Conditionally fetch a feed; returns the body, or None when unchanged"""
+    path = _local_path(source.url)
+    if path is not None:
+        # Local fixtures use the file's mtime as their Last-Modified
+        last_modified = email.utils.formatdate(os.path.getmtime(path), usegmt=True)
+        if last_modified == source.last_modified:
+            return None
+        with open(path, 'rb') as f:
+            body = f.read(FEED_MAX_BYTES + 1)
+        if len(body) > FEED_MAX_BYTES:
+            raise FetchError("Feed is too large")
+        source.last_modified = last_modified
+        return body
+
+    headers = {}
+    if source.etag:
+        headers['If-None-Match'] = source.etag
+    if source.last_modified:
+        headers['If-Modified-Since'] = source.last_modified
+    with session.get(source.url, headers=headers, timeout=FEED_TIMEOUT, stream=True) as response:
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        # Read at most FEED_MAX_BYTES so a huge or endless feed can't fill memory
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(64 * 1024):
+            size += len(chunk)
+            if size > FEED_MAX_BYTES:
+                raise FetchError("Feed is too large")
+            chunks.append(chunk)
+        source.etag = response.headers.get('ETag')
+        source.last_modified = response.headers.get('Last-Modified')
+    return b''.join(chunks)
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _child(element, *names):
+    for child in element:
+        if _local_name(child.tag) in names:
+            return child
+    return None
+
+
+def _child_text(element, *names):
+    for name in names:
+        child = _child(element, name)
+        if child is not None and (child.text or '').strip():
+            return child.text.strip()
+    return ''
+
+
+def _parse_date(value):
+    if not value:
+        return None
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _atom_link(entry):
+    for child in entry:
+        if _local_name(child.tag) == 'link' and child.get('rel', 'alternate') == 'alternate':
+            return child.get('href', '')
+    return ''
+
+
+def parse_feed(body):
+    """Return entry dicts (title, link, text, published_at) from RSS 2.0 or Atom XML"""
+    root = ET.fromstring(body)
+    entries = []
+    for element in root.iter():
+        name = _local_name(element.tag)
+        if name == 'item':
+            link = _child_text(element, 'link')
+            guid = _child_text(element, 'guid')
+            if not link and guid.startswith('http'):
+                link = guid
+            entries.append({
+                'title': html_to_text(_child_text(element, 'title')),
+                'link': link,
+                'text': html_to_text(_child_text(element, 'encoded', 'description')),
+                'published_at': _parse_date(_child_text(element, 'pubDate', 'date'))
+            })
+        elif name == 'entry':
+            entries.append({
+                'title': html_to_text(_child_text(element, 'title')),
+                'link': _atom_link(element),
+                'text': html_to_text(_child_text(element, 'content', 'summary')),
+                'published_at': _parse_date(_child_text(element, 'published', 'updated'))
+            })
+    return entries
+
+
+def store_entries(source, entries):
+    """Insert entries not seen before (by URL or content); returns the new FeedEntry rows"""
+    new_entries = []
+    for item in entries:
+        if len(item['text']) < MIN_TEXT_LENGTH:
+            continue
+        normalized = normalize_url(item['link']) if item['link'] else None
+        content_hash = article_hash(item['text'], item['title'])
+
+        criteria = [FeedEntry.content_hash == content_hash]
+        if normalized:
+            criteria.append(FeedEntry.normalized_url == normalized)
+        duplicate = FeedEntry.query.filter(or_(*criteria)).first()
+        if duplicate:
+            continue
+
+        entry = FeedEntry(
+            feed_id=source.id,
+            normalized_url=normalized,
+            content_hash=content_hash,
+            title=item['title'],
+            news_text=item['text'],
+            published_at=item['published_at']
+        )
+        try:
+            db.session.add(entry)
+            db.session.commit()
+        except IntegrityError:
+            # Same story arrived through another feed or worker
+            db.session.rollback()
+            continue
+        new_entries.append(entry)
+    return new_entries
+
+
+def _in_offpeak_hours(hour):
+    if not FEED_OFFPEAK_HOURS.strip():
+        return True
+    for part in FEED_OFFPEAK_HOURS.split(','):
+        start, _, end = part.strip().partition('-')
+        if int(start) <= hour <= int(end or start):
+            return True
+    return False
+
+
+def is_offpeak():
+    """True when pre-analysis won't compete with users for Gemini quota"""
+    if not _in_offpeak_hours(datetime.utcnow().hour):
+        return False
+    requests_used, _ = governor.current_usage()
+    return requests_used < governor.rpm * FEED_MAX_QUOTA_SHARE
+
+
+def analyze_pending(limit=FEED_MAX_ANALYSES, force=False):
+    """Pre-analyze the newest unanalyzed entries into the cache; returns count analyzed"""
+    from NewsScope import analyzer
+
+    analyzed = 0
+    entries = FeedEntry.query.filter(FeedEntry.analyzed_at.is_(None))\
+        .order_by(FeedEntry.published_at.desc(), FeedEntry.id.desc()).limit(limit).all()
+    for entry in entries:
+        if not force and not is_offpeak():
+            print("  ⏸  Quota busy or outside off-peak hours; leaving the rest for the next poll")
+            break
+        cache_keys = [article_hash(entry.news_text)]
+        if entry.normalized_url:
+            cache_keys.append(url_key(entry.normalized_url))
+        try:
+            analyzer.generate_report(entry.news_text, entry.title or '', save=False,
+                                     priority=PRIORITY_BACKGROUND, cache_keys=cache_keys,
+                                     cache_source='feed')
+        except Exception as e:
+            print(f"  ❌ {entry.title or entry.normalized_url}: {str(e)}")
+            db.session.rollback()
+            continue
+        entry.analyzed_at = datetime.utcnow()
+        db.session.commit()
+        analyzed += 1
+    return analyzed
+
+
+def poll(feed_urls, analyze=True, force=False):
+    """Fetch every feed once, store new entries and pre-analyze them"""
+    fetched = unchanged = new = failed = 0
+    for url in feed_urls:
+        source = FeedSource.query.filter_by(url=url).first()
+        if source is None:
+            source = FeedSource(url=url)
+            db.session.add(source)
+            db.session.commit()
+
+        try:
+            body = fetch_feed(source)
+            if body is None:
+                unchanged += 1
+                source.last_status = 'not modified'
+            else:
+                fetched += 1
+                added = store_entries(source, parse_feed(body))
+                new += len(added)
+                source.last_status = f"{len(added)} new"
+                print(f"  ✓ {url}: {len(added)} new entries")
+        except Exception as e:
+            failed += 1
+            db.session.rollback()
+            source.last_status = f"error: {str(e)[:40]}"
+            print(f"  ❌ {url}: {str(e)}")
+        source.last_polled_at = datetime.utcnow()
+        db.session.commit()
+
+    analyzed = analyze_pending(force=force) if analyze else 0
+    analysis_cache.prune()
+
+    print("\n📊 Feed Poll Summary:")
+    print(f"   • Feeds fetched: {fetched} ({unchanged} not modified, {failed} failed)")
+    print(f"   • New entries: {new}")
+    print(f"   • Pre-analyzed: {analyzed}")
+    return new, analyzed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Poll RSS/Atom feeds and pre-analyze new articles")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name in ('poll', 'watch'):
+        sub = subparsers.add_parser(name)
+        sub.add_argument('--feed', action='append', help='Feed URL or path (default: FEED_URLS)')
+        sub.add_argument('--no-analyze', action='store_true', help='Only store new entries')
+        sub.add_argument('--force', action='store_true', help='Pre-analyze even at peak times')
+    subparsers.choices['watch'].add_argument('--interval', type=int, default=FEED_POLL_INTERVAL)
+    args = parser.parse_args()
+
+    feed_urls = args.feed or FEED_URLS
+    if not feed_urls:
+        parser.error("no feeds configured; pass --feed or set FEED_URLS")
+
+    from NewsScope import app
+
+    with app.app_context():
+        if args.command == 'poll':
+            poll(feed_urls, analyze=not args.no_analyze, force=args.force)
+        else:
+            while True:
+                poll(feed_urls, analyze=not args.no_analyze, force=args.force)
+                time.sleep(args.interval)
@@ -0,0 +1,465 @@
+"""
+Fetching and extracting articles submitted by URL
+Pages are downloaded through one pooled requests.Session and kept in an
+on-disk HTTP cache that honors Cache-Control, Expires, ETag and Last-Modified,
+so resubmitting a URL doesn't refetch it. The cache is trimmed to a size cap,
+evicting least recently used pages first. Headline and body are pulled out of
+the HTML with a single html.parser pass that skips navigation, headers,
+footers, asides and scripts.
+"""
+
+import codecs
+import email.utils
+import hashlib
+import ipaddress
+import json
+import os
+import re
+import socket
+import threading
+import time
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError
+
+import metrics
+
+FETCH_TIMEOUT = float(os.getenv('FETCH_TIMEOUT', 10))
+FETCH_MAX_BYTES = int(os.getenv('FETCH_MAX_BYTES', 5 * 1024 * 1024))
+FETCH_POOL_SIZE = int(os.getenv('FETCH_POOL_SIZE', 10))
+FETCH_CACHE_DIR = os.getenv('FETCH_CACHE_DIR', './fetch_cache')
+FETCH_CACHE_MAX_BYTES = int(os.getenv('FETCH_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+# Other workers write to the same directory, so the running total is resynced this often
+FETCH_CACHE_RESCAN_SECONDS = 300
+# Loopback and private addresses are refused unless explicitly allowed (local fixtures)
+FETCH_ALLOW_PRIVATE = os.getenv('FETCH_ALLOW_PRIVATE', 'false').lower() == 'true'
+MAX_REDIRECTS = 5
+USER_AGENT = 'NewsScope/2.0 (+https://newsscope.app)'
+
+# Query parameters that identify a campaign, not an article
+_TRACKING_PARAMS = re.compile(r'^(utm_.*|fbclid|gclid|mc_cid|mc_eid|ref|cmpid)$', re.IGNORECASE)
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+class FetchError(Exception):
+    """The URL could not be fetched or has no readable article"""
+
+
+def normalize_url(url):
+    """Canonical form of an article URL for deduplication"""
+    parts = urlsplit((url or '').strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    path = parts.path.rstrip('/') or '/'
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not _TRACKING_PARAMS.match(key)
+    ))
+    return urlunsplit((scheme, host, path, query, ''))
+
+
+def _resolve(host, port):
+    """Addresses to connect to for host, refusing non-public ones"""
+    try:
+        addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror:
+        raise FetchError(f"Could not resolve {host}")
+    ips = [address[4][0] for address in addresses]
+    if not FETCH_ALLOW_PRIVATE and any(not ipaddress.ip_address(ip).is_global for ip in ips):
+        raise FetchError("URL points to a private network address")
+    return ips
+
+
+class _CheckedConnection:
+    """Connects to the addresses _resolve() validated, so a second DNS answer can't differ
+
+    TLS still verifies and sends SNI for the hostname; only the socket is pinned.
+    """
+
+    def _new_conn(self):
+        host = self._dns_host
+        error = FetchError(f"Could not resolve {host}")
+        for ip in _resolve(host, self.port):
+            self._dns_host = ip
+            try:
+                return super()._new_conn()
+            except NewConnectionError as e:
+                error = e
+            finally:
+                self._dns_host = host
+        raise error
+
+
+class _CheckedHTTPConnection(_CheckedConnection, HTTPConnection):
+    pass
+
+
+class _CheckedHTTPSConnection(_CheckedConnection, HTTPSConnection):
+    pass
+
+
+class _CheckedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _CheckedHTTPConnection
+
+
+class _CheckedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _CheckedHTTPSConnection
+
+
+class _CheckedAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CheckedHTTPConnectionPool,
+            'https': _CheckedHTTPSConnectionPool,
+        }
+
+
+def _build_session():
+    http = requests.Session()
+    # Proxies from the environment would connect on our behalf, past the address check
+    http.trust_env = False
+    adapter = _CheckedAdapter(pool_connections=FETCH_POOL_SIZE, pool_maxsize=FETCH_POOL_SIZE)
+    http.mount('http://', adapter)
+    http.mount('https://', adapter)
+    http.headers['User-Agent'] = USER_AGENT
+    return http
+
+
+# Shared by every request thread so connections to the same host are reused
+session = _build_session()
+
+
+class HttpCache:
+    """On-disk response cache: one JSON metadata file and one body file per URL"""
+
+    def __init__(self, directory=FETCH_CACHE_DIR, max_bytes=FETCH_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Running byte total so put() only walks the directory when it may be over the cap
+        self._total = None
+        self._scanned_at = 0
+        self._lock = threading.Lock()
+
+    def _paths(self, url):
+        name = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.directory, name[:2], name)
+        return base + '.json', base + '.body'
+
+    def get(self, url):
+        """Return (meta, body) for a cached URL, or (None, None)"""
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None, None
+        # mtime doubles as the last-used time for LRU eviction
+        try:
+            os.utime(meta_path)
+        except OSError:
+            pass
+        return meta, body
+
+    def put(self, url, meta, body=None):
+        """Store a response; body=None refreshes only the metadata (after a 304)"""
+        meta_path, body_path = self._paths(url)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        data = json.dumps(meta).encode('utf-8')
+        replaced = self._size(meta_path, body_path if body is not None else None)
+        if body is not None:
+            self._write(body_path, body)
+        self._write(meta_path, data)
+
+        with self._lock:
+            if self._total is not None:
+                self._total += len(data) + (len(body) if body is not None else 0) - replaced
+            if (self._total is None or self._total > self.max_bytes
+                    or time.monotonic() - self._scanned_at > FETCH_CACHE_RESCAN_SECONDS):
+                self._evict()
+
+    def _size(self, *paths):
+        size = 0
+        for path in paths:
+            if path is None:
+                continue
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+        return size
+
+    def _write(self, path, data):
+        # Write-then-rename so concurrent workers never read a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _evict(self):
+        """Walk the cache, resync the running total and trim it if over max_bytes"""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                meta_path = os.path.join(root, name)
+                body_path = meta_path[:-5] + '.body'
+                try:
+                    size = os.path.getsize(meta_path) + os.path.getsize(body_path)
+                    entries.append((os.path.getmtime(meta_path), size, meta_path, body_path))
+                except OSError:
+                    continue
+                total += size
+        self._scanned_at = time.monotonic()
+        self._total = total
+        if total <= self.max_bytes:
+            return
+
+        for _, size, meta_path, body_path in sorted(entries):
+            for path in (meta_path, body_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            metrics.increment('fetch.cache_evicted')
+            total -= size
+            # Trim below the cap so the next few puts don't each walk again
+            if total <= self.max_bytes * 0.9:
+                break
+        self._total = total
+
+
+http_cache = HttpCache()
+
+
+def _freshness(headers, now):
+    """Return (storable, expires_at) from a response's caching headers"""
+    directives = {}
+    for part in headers.get('Cache-Control', '').split(','):
+        name, _, value = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = value.strip('"')
+
+    if 'no-store' in directives:
+        return False, now
+    if 'no-cache' in directives:
+        return True, now
+    for name in ('s-maxage', 'max-age'):
+        if name in directives:
+            try:
+                return True, now + int(directives[name])
+            except ValueError:
+                return True, now
+    if headers.get('Expires'):
+        try:
+            return True, email.utils.parsedate_to_datetime(headers['Expires']).timestamp()
+        except (TypeError, ValueError):
+            return True, now
+    return True, now
+
+
+def _charset(content_type):
+    match = re.search(r'charset=["\']?([\w.:-]+)', content_type, re.IGNORECASE)
+    if match:
+        try:
+            return codecs.lookup(match.group(1)).name
+        except LookupError:
+            pass
+    return 'utf-8'
+
+
+def _check_url(url):
+    # The address itself is checked when the connection is made (_CheckedConnection)
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise FetchError("Only http and https URLs can be analyzed")
+
+
+def _download(url, headers):
+    """GET url following redirects by hand so every hop is checked; returns (response, body, final_url)"""
+    for _ in range(MAX_REDIRECTS + 1):
+        _check_url(url)
+        response = session.get(url, headers=headers, timeout=FETCH_TIMEOUT, stream=True,
+                               allow_redirects=False)
+        if response.is_redirect:
+            url = urljoin(url, response.headers['Location'])
+            response.close()
+            continue
+
+        if response.status_code == 304:
+            response.close()
+            return response, None, url
+        if response.status_code >= 400:
+            response.close()
+            raise FetchError(f"Page returned HTTP {response.status_code}")
+
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(64 * 1024):
+            size += len(chunk)
+            if size > FETCH_MAX_BYTES:
+                response.close()
+                raise FetchError("Page is too large to analyze")
+            chunks.append(chunk)
+        return response, b''.join(chunks), url
+    raise FetchError("Too many redirects")
+
+
+def fetch(url):
+    """Return (html, final_url) for url, from the HTTP cache when still fresh"""
+    now = time.time()
+    meta, body = http_cache.get(url)
+    if meta is not None and meta['expires_at'] > now:
+        metrics.increment('fetch.cache_fresh')
+        return body.decode(meta['encoding'], errors='replace'), meta['final_url']
+
+    headers = {}
+    if meta is not None:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    started = time.perf_counter()
+    try:
+        response, new_body, final_url = _download(url, headers)
+    except requests.RequestException as e:
+        raise FetchError(f"Could not fetch page: {str(e)}")
+    metrics.observe('fetch.download', time.perf_counter() - started)
+
+    storable, expires_at = _freshness(response.headers, now)
+    if new_body is None:
+        if meta is None:
+            raise FetchError("Page returned HTTP 304 without a cached copy")
+        # 304: our copy is still good; only its freshness changes
+        metrics.increment('fetch.cache_revalidated')
+        meta['expires_at'] = expires_at
+        http_cache.put(url, meta)
+        return body.decode(meta['encoding'], errors='replace'), meta['final_url']
+
+    metrics.increment('fetch.cache_miss')
+    meta = {
+        'final_url': final_url,
+        'encoding': _charset(response.headers.get('Content-Type', '')),
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'expires_at': expires_at
+    }
+    if storable:
+        http_cache.put(url, meta, new_body)
+    return new_body.decode(meta['encoding'], errors='replace'), final_url
+
+
+class _ArticleExtractor(HTMLParser):
+    """Single pass over a page collecting title candidates and paragraph text"""
+
+    BOILERPLATE = {'nav', 'header', 'footer', 'aside', 'form', 'script', 'style', 'noscript',
+                   'figure', 'button', 'svg', 'iframe'}
+    BLOCKS = {'p', 'h2', 'h3', 'li', 'blockquote'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.meta = {}
+        self.canonical = None
+        self.title = []
+        self.h1 = []
+        self.paragraphs = []
+        self.article_paragraphs = []
+        self._skip = 0
+        self._in_title = False
+        self._in_h1 = False
+        self._article = 0
+        self._block = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag in self.BOILERPLATE:
+            self._skip += 1
+        elif tag == 'meta':
+            key = (attrs.get('property') or attrs.get('name') or '').lower()
+            if key in ('og:title', 'og:url', 'twitter:title') and attrs.get('content'):
+                self.meta.setdefault(key, attrs['content'].strip())
+        elif tag == 'link' and 'canonical' in (attrs.get('rel') or '').lower().split():
+            self.canonical = attrs.get('href')
+        elif tag == 'title':
+            self._in_title = True
+        elif tag == 'h1' and not self._skip:
+            self._in_h1 = True
+        elif tag == 'article':
+            self._article += 1
+        elif tag in self.BLOCKS and not self._skip and self._block is None:
+            self._block = []
+
+    def handle_endtag(self, tag):
+        if tag in self.BOILERPLATE:
+            self._skip = max(self._skip - 1, 0)
+        elif tag == 'title':
+            self._in_title = False
+        elif tag == 'h1':
+            self._in_h1 = False
+        elif tag == 'article':
+            self._article = max(self._article - 1, 0)
+        elif tag in self.BLOCKS and self._block is not None:
+            text = re.sub(r'\s+', ' ', ''.join(self._block)).strip()
+            # Short fragments are mostly bylines, captions and share buttons
+            if len(text) >= 40:
+                self.paragraphs.append(text)
+                if self._article:
+                    self.article_paragraphs.append(text)
+            self._block = None
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title.append(data)
+        if self._skip:
+            return
+        if self._in_h1:
+            self.h1.append(data)
+        if self._block is not None:
+            self._block.append(data)
+
+
+def extract_article(html, url):
+    """Return (headline, text, canonical_url) from an article page"""
+    parser = _ArticleExtractor()
+    parser.feed(html)
+    parser.close()
+
+    headline = (
+        parser.meta.get('og:title') or
+        re.sub(r'\s+', ' ', ''.join(parser.h1)).strip() or
+        parser.meta.get('twitter:title') or
+        re.sub(r'\s+', ' ', ''.join(parser.title)).strip()
+    )
+    text = '\n\n'.join(parser.article_paragraphs or parser.paragraphs)
+    canonical_url = normalize_url(url)
+    canonical = parser.canonical or parser.meta.get('og:url')
+    if canonical:
+        declared = normalize_url(urljoin(url, canonical))
+        # A page may only claim a canonical URL on its own host; otherwise any
+        # page could plant its analysis under another site's article
+        if urlsplit(declared).netloc == urlsplit(canonical_url).netloc:
+            canonical_url = declared
+    return headline, text, canonical_url
+
+
+def fetch_article(url):
+    """Fetch and extract an article; returns (headline, text, canonical_url)"""
+    html, final_url = fetch(url)
+    headline, text, canonical_url = extract_article(html, final_url)
+    if len(text) < 10:
+        raise FetchError("No article text found at this URL")
+    return headline, text, canonical_url
@@ -0,0 +1,280 @@
+"""
+Parsing and validation of Gemini analysis responses
+The model is asked for schema-constrained JSON (ANALYSIS_SCHEMA), but answers
+can still arrive wrapped in markdown fences, with trailing commas, or cut off
+at the output token limit. repair_json fixes those in a single pass over the
+text, and validate_analysis coerces the result into the shape the API returns.
+"""
+
+import json
+import math
+import re
+
+VERDICTS = ('REAL', 'FAKE', 'MISLEADING')
+UNCERTAIN = 'UNCERTAIN'
+
+LIST_FIELDS = ('red_flags', 'verification_suggestions', 'key_claims')
+
+# Passed to Gemini as response_schema together with response_mime_type=application/json
+ANALYSIS_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'verdict': {'type': 'STRING', 'enum': list(VERDICTS)},
+        'confidence': {'type': 'INTEGER'},
+        'summary': {'type': 'STRING'},
+        'detailed_analysis': {'type': 'STRING'},
+        'red_flags': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+        'verification_suggestions': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+        'key_claims': {'type': 'ARRAY', 'items': {'type': 'STRING'}}
+    },
+    'required': ['verdict', 'confidence', 'summary', 'detailed_analysis',
+                 'red_flags', 'verification_suggestions', 'key_claims']
+}
+
+# Only trust an explicitly labelled verdict when the answer is not JSON;
+# a bare "FAKE" anywhere in the prose ("this is not fake") is not a verdict
+_labelled_verdict = re.compile(r'verdict\W{0,5}(REAL|FAKE|MISLEADING)\b', re.IGNORECASE)
+_number = re.compile(r'-?\d+(?:\.\d+)?')
+_escapes = {'\n': '\\n', '\r': '\\r', '\t': '\\t'}
+_string_run = re.compile(r'[^"\\\x00-\x1f]+')
+_partial_unicode_escape = re.compile(r'(?<!\\)(?:\\\\)*(\\u[0-9a-fA-F]{0,3})$')
+
+
+class _Frame:
+    __slots__ = ('kind', 'state')
+
+    def __init__(self, kind):
+        self.kind = kind
+        # Objects: key -> colon -> value -> after; arrays: value -> after
+        self.state = 'key' if kind == '{' else 'value'
+
+
+def _strip_trailing_comma(out):
+    while out and out[-1] in ' \t\r\n':
+        out.pop()
+    if out and out[-1] == ',':
+        out.pop()
+
+
+def _close_frame(out, frame):
+    _strip_trailing_comma(out)
+    if frame.kind == '{':
+        if frame.state == 'colon':
+            out.append(':null')
+        elif frame.state == 'value':
+            out.append('null')
+        out.append('}')
+    else:
+        out.append(']')
+
+
+def _value_done(stack):
+    if stack:
+        stack[-1].state = 'after'
+
+
+def repair_json(text):
+    """Return the first JSON object in text, repaired so json.loads accepts it"""
+    start = text.find('{')
+    if start == -1:
+        raise ValueError("No JSON object found")
+
+    out = []
+    stack = []
+    in_string = False
+    string_is_key = False
+    escape = False
+    literal_start = None
+    i = start
+    n = len(text)
+
+    while i < n:
+        c = text[i]
+
+        if in_string:
+            if escape:
+                out.append(c)
+                escape = False
+            elif c == '\\':
+                out.append(c)
+                escape = True
+            elif c == '"':
+                out.append(c)
+                in_string = False
+                if string_is_key:
+                    stack[-1].state = 'colon'
+                else:
+                    _value_done(stack)
+            elif c < ' ':
+                out.append(_escapes.get(c, ' '))
+            else:
+                # Copy the plain run of the string in one step
+                match = _string_run.match(text, i)
+                out.append(match.group())
+                i = match.end()
+                continue
+            i += 1
+            continue
+
+        if literal_start is not None and (c in ',:]}' or c in ' \t\r\n"{['):
+            literal_start = None
+
+        if c in ' \t\r\n':
+            out.append(c)
+        elif c == '"':
+            string_is_key = bool(stack) and stack[-1].kind == '{' and stack[-1].state == 'key'
+            in_string = True
+            out.append(c)
+        elif c == ':':
+            if stack and stack[-1].state == 'colon':
+                stack[-1].state = 'value'
+                out.append(c)
+        elif c == ',':
+            if stack and stack[-1].state == 'after':
+                stack[-1].state = 'key' if stack[-1].kind == '{' else 'value'
+                out.append(c)
+        elif c in '}]':
+            if not stack:
+                break
+            _close_frame(out, stack.pop())
+            if not stack:
+                return ''.join(out)
+            _value_done(stack)
+        elif c in '{[':
+            stack.append(_Frame(c))
+            out.append(c)
+        else:
+            # Bare literal or number; commit to it as the current value
+            if stack and stack[-1].state == 'value':
+                literal_start = len(out)
+                stack[-1].state = 'after'
+            if literal_start is not None:
+                out.append(c)
+        i += 1
+
+    # Truncated output: close whatever is still open
+    if in_string:
+        if escape:
+            out.pop()
+        else:
+            joined = ''.join(out)
+            partial = _partial_unicode_escape.search(joined, max(len(joined) - 64, 0))
+            if partial:
+                out = [joined[:partial.start(1)]]
+        out.append('"')
+        if string_is_key:
+            stack[-1].state = 'colon'
+        else:
+            _value_done(stack)
+    elif literal_start is not None:
+        literal = ''.join(out[literal_start:])
+        try:
+            json.loads(literal)
+        except ValueError:
+            del out[literal_start:]
+            out.append('null')
+
+    while stack:
+        _close_frame(out, stack.pop())
+        _value_done(stack)
+    return ''.join(out)
+
+
+def _as_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value.strip()
+    return json.dumps(value)
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value.strip()] if value.strip() else []
+    if not isinstance(value, list):
+        value = [value]
+    return [_as_text(item) for item in value if item is not None and _as_text(item)]
+
+
+def _as_confidence(value):
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, str):
+        match = _number.search(value)
+        if not match:
+            return None
+        value = float(match.group())
+    if not isinstance(value, (int, float)) or not math.isfinite(value):
+        # json.loads accepts NaN and Infinity
+        return None
+    # Some answers give a 0-1 probability instead of a percentage
+    if isinstance(value, float) and 0 < value < 1:
+        value *= 100
+    return int(round(min(max(value, 0), 100)))
+
+
+def _as_verdict(value):
+    verdict = _as_text(value).upper()
+    if verdict in VERDICTS:
+        return verdict
+    for candidate in VERDICTS:
+        if verdict.startswith(candidate):
+            return candidate
+    return UNCERTAIN
+
+
+def validate_analysis(data):
+    """Coerce a decoded response into the analysis schema"""
+    if not isinstance(data, dict):
+        raise ValueError("Analysis must be a JSON object")
+
+    verdict = _as_verdict(data.get('verdict'))
+    confidence = _as_confidence(data.get('confidence'))
+    if confidence is None:
+        confidence = 0
+
+    result = {
+        'verdict': verdict,
+        'confidence': confidence,
+        'summary': _as_text(data.get('summary')),
+        'detailed_analysis': _as_text(data.get('detailed_analysis'))
+    }
+    for field in LIST_FIELDS:
+        result[field] = _as_list(data.get(field))
+    return result
+
+
+def fallback_analysis(text):
+    """Analysis for an answer that contains no usable JSON"""
+    match = _labelled_verdict.search(text)
+    return {
+        'verdict': match.group(1).upper() if match else UNCERTAIN,
+        'confidence': 0,
+        'summary': "AI analysis completed",
+        'detailed_analysis': text.strip(),
+        'red_flags': [],
+        'verification_suggestions': [],
+        'key_claims': []
+    }
+
+
+def _decode(text):
+    # Fast path: schema-constrained answers are already valid JSON, possibly fenced
+    start = text.find('{')
+    end = text.rfind('}')
+    if start != -1 and end > start:
+        try:
+            return json.loads(text[start:end + 1])
+        except ValueError:
+            pass
+    return json.loads(repair_json(text))
+
+
+def parse_analysis(text):
+    """Parse a Gemini answer; returns (analysis, parsed) where parsed is False for the fallback"""
+    try:
+        return validate_analysis(_decode(text)), True
+    except (ValueError, RecursionError):
+        return fallback_analysis(text), False
@@ -0,0 +1,247 @@
+"""
+Gemini admission control for NewsScope
+Every worker shares one requests-per-minute and tokens-per-minute budget.
+Admission is decided through the database so all gunicorn workers see the
+same quota window and the same waiting queue. That bookkeeping runs on its
+own connections, never on the caller's session, so admitting a request
+doesn't commit or hold open the request's transaction.
+
+Queue order is: priority (paid purchasers first), then the ticket's position
+within its own user's queue, then arrival time. Ordering by per-user position
+means a user with ten queued requests only gets their second one admitted
+after every other waiting user has had their first one admitted.
+"""
+
+import os
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+import metrics
+from models import db, CreditTransaction, GeminiQuotaWindow, GeminiQueueTicket
+
+GEMINI_RPM = int(os.getenv('GEMINI_RPM', 10))
+GEMINI_TPM = int(os.getenv('GEMINI_TPM', 250000))
+GEMINI_QUEUE_TIMEOUT = float(os.getenv('GEMINI_QUEUE_TIMEOUT', 30))
+GEMINI_QUEUE_POLL_INTERVAL = float(os.getenv('GEMINI_QUEUE_POLL_INTERVAL', 0.25))
+
+# Expected size of a model answer, used until the real usage is known
+ESTIMATED_OUTPUT_TOKENS = 1024
+
+PRIORITY_BACKGROUND = 0
+PRIORITY_STANDARD = 1
+PRIORITY_PAID = 2
+
+
+class QuotaWaitTimeout(Exception):
+    """Raised when a request could not be admitted within the queue timeout"""
+
+    def __init__(self, waited):
+        super().__init__(f"Gemini quota busy, gave up after {waited:.1f}s in queue")
+        self.waited = waited
+
+
+def estimate_tokens(prompt):
+    """Rough token estimate for a prompt plus the expected answer"""
+    return len(prompt) // 4 + ESTIMATED_OUTPUT_TOKENS
+
+
+def priority_for_user(user_id):
+    """Users who have bought credits are served ahead of free users"""
+    if not user_id:
+        return PRIORITY_STANDARD
+    purchase = CreditTransaction.query.filter_by(
+        user_id=user_id, transaction_type='purchase'
+    ).first()
+    return PRIORITY_PAID if purchase else PRIORITY_STANDARD
+
+
+class GeminiGovernor:
+    """Cross-worker admission controller for Gemini calls"""
+
+    def __init__(self, rpm=GEMINI_RPM, tpm=GEMINI_TPM, timeout=GEMINI_QUEUE_TIMEOUT,
+                 poll_interval=GEMINI_QUEUE_POLL_INTERVAL):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        # Tickets whose worker stopped polling (crash, restart) are ignored
+        self.stale_after = timedelta(seconds=max(5.0, poll_interval * 20))
+
+    def acquire(self, user_id, tokens, priority=PRIORITY_STANDARD):
+        """Wait for a quota slot; returns the time spent queued in seconds"""
+        started = time.monotonic()
+
+        # Fast path: nobody is waiting and the window has room
+        if self._queue_empty() and self._reserve(tokens):
+            metrics.increment('gemini.admitted')
+            metrics.observe('gemini.queue_wait', 0.0)
+            return 0.0
+
+        ticket = self._enqueue(user_id, priority)
+        try:
+            while True:
+                waited = time.monotonic() - started
+                if self._may_proceed(ticket) and self._reserve(tokens):
+                    metrics.increment('gemini.admitted')
+                    metrics.increment('gemini.queued')
+                    metrics.observe('gemini.queue_wait', waited)
+                    return waited
+
+                if waited >= self.timeout:
+                    metrics.increment('gemini.rejected')
+                    raise QuotaWaitTimeout(waited)
+
+                time.sleep(self.poll_interval)
+                self._heartbeat(ticket)
+        finally:
+            self._dequeue(ticket)
+
+    def record_usage(self, estimated_tokens, actual_tokens, admitted_at):
+        """Correct the window's token count once real usage is known"""
+        if actual_tokens is None:
+            return
+        delta = actual_tokens - estimated_tokens
+        if not delta:
+            return
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(
+                    update(GeminiQuotaWindow)
+                    .where(GeminiQuotaWindow.window_start == self._window_start(admitted_at))
+                    .values(token_count=GeminiQuotaWindow.token_count + delta)
+                )
+            metrics.increment('gemini.tokens', actual_tokens)
+        except Exception as e:
+            print(f"Error recording Gemini usage: {str(e)}")
+
+    def current_usage(self):
+        """Return (requests, tokens) consumed in the current window"""
+        with db.engine.connect() as conn:
+            return self._usage(conn)
+
+    def _usage(self, conn):
+        window = conn.execute(
+            select(GeminiQuotaWindow.request_count, GeminiQuotaWindow.token_count)
+            .where(GeminiQuotaWindow.window_start == self._window_start(datetime.utcnow()))
+        ).first()
+        if not window:
+            return 0, 0
+        return window.request_count, window.token_count
+
+    def _window_start(self, moment):
+        return moment.replace(second=0, microsecond=0)
+
+    def _reserve(self, tokens):
+        """Atomically take one request and `tokens` tokens from the window"""
+        window_start = self._window_start(datetime.utcnow())
+        try:
+            with db.engine.begin() as conn:
+                opened = conn.execute(
+                    select(GeminiQuotaWindow.window_start).where(GeminiQuotaWindow.window_start == window_start)
+                ).first()
+                if not opened:
+                    conn.execute(insert(GeminiQuotaWindow).values(
+                        window_start=window_start, request_count=0, token_count=0
+                    ))
+        except IntegrityError:
+            # Another worker opened the window first
+            pass
+
+        with db.engine.begin() as conn:
+            # The WHERE clause makes the check-and-increment a single atomic step
+            result = conn.execute(
+                update(GeminiQuotaWindow)
+                .where(
+                    GeminiQuotaWindow.window_start == window_start,
+                    GeminiQuotaWindow.request_count < self.rpm,
+                    GeminiQuotaWindow.token_count + tokens <= self.tpm
+                )
+                .values(
+                    request_count=GeminiQuotaWindow.request_count + 1,
+                    token_count=GeminiQuotaWindow.token_count + tokens
+                )
+            )
+            if result.rowcount == 1:
+                self._prune_windows(conn, window_start)
+                return True
+        return False
+
+    def _prune_windows(self, conn, window_start):
+        conn.execute(
+            delete(GeminiQuotaWindow)
+            .where(GeminiQuotaWindow.window_start < window_start - timedelta(hours=1))
+        )
+
+    def _live_tickets(self, conn, limit):
+        cutoff = datetime.utcnow() - self.stale_after
+        return conn.execute(
+            select(GeminiQueueTicket.id)
+            .where(GeminiQueueTicket.heartbeat_at >= cutoff)
+            .order_by(
+                GeminiQueueTicket.priority.desc(),
+                GeminiQueueTicket.user_seq,
+                GeminiQueueTicket.enqueued_at,
+                GeminiQueueTicket.id
+            )
+            .limit(limit)
+        ).scalars().all()
+
+    def _queue_empty(self):
+        with db.engine.connect() as conn:
+            return not self._live_tickets(conn, limit=1)
+
+    def _enqueue(self, user_id, priority):
+        cutoff = datetime.utcnow() - self.stale_after
+        with db.engine.begin() as conn:
+            user_seq = 0
+            if user_id:
+                user_seq = conn.execute(
+                    select(func.count()).select_from(GeminiQueueTicket).where(
+                        GeminiQueueTicket.user_id == user_id,
+                        GeminiQueueTicket.heartbeat_at >= cutoff
+                    )
+                ).scalar()
+
+            now = datetime.utcnow()
+            ticket_id = conn.execute(
+                insert(GeminiQueueTicket).values(
+                    user_id=user_id,
+                    priority=priority,
+                    user_seq=user_seq,
+                    enqueued_at=now,
+                    heartbeat_at=now
+                )
+            ).inserted_primary_key[0]
+
+            # Drop tickets left behind by workers that died while queued
+            conn.execute(delete(GeminiQueueTicket).where(GeminiQueueTicket.heartbeat_at < cutoff))
+        return ticket_id
+
+    def _may_proceed(self, ticket_id):
+        """A ticket may try to reserve once it is within the free slots of the window"""
+        with db.engine.connect() as conn:
+            requests_used, _ = self._usage(conn)
+            free_slots = max(self.rpm - requests_used, 0)
+            if free_slots == 0:
+                return False
+            return ticket_id in self._live_tickets(conn, limit=free_slots)
+
+    def _heartbeat(self, ticket_id):
+        with db.engine.begin() as conn:
+            conn.execute(
+                update(GeminiQueueTicket)
+                .where(GeminiQueueTicket.id == ticket_id)
+                .values(heartbeat_at=datetime.utcnow())
+            )
+
+    def _dequeue(self, ticket_id):
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(delete(GeminiQueueTicket).where(GeminiQueueTicket.id == ticket_id))
+        except Exception as e:
+            print(f"Error removing Gemini queue ticket: {str(e)}")
+
+
+governor = GeminiGovernor()
@@ -0,0 +1,194 @@
+"""
+Writing analysis results to AnalysisHistory
+Both the API and the batch ingest pipeline save analyses through
+save_analyses, so every write path stores the same columns and updates the
+dashboard rollups.
+
+Red flags, claims and checked sources live in child tables
+(analysis_red_flags, analysis_claims, analysis_sources -> sources). A batch of
+analyses is written with one bulk insert for the parents and one per child
+table.
+"""
+
+import threading
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+import response_cache
+import rollups
+from models import db, AnalysisHistory, AnalysisRedFlag, AnalysisClaim, AnalysisSource, Source
+
+MAX_KEY_LENGTH = 160
+
+# Source ids never change once assigned, so each worker remembers them
+_source_ids = {}
+_source_lock = threading.Lock()
+
+
+def history_values(user_id, news_text, headline, report):
+    """Column values for one AnalysisHistory row built from a report"""
+    return {
+        'user_id': user_id,
+        'headline': headline,
+        'news_text': news_text,
+        'verdict': report['verdict'],
+        'confidence': report['confidence'],
+        'summary': report['summary'],
+        'detailed_analysis': report['detailed_analysis'],
+        'red_flags': report['red_flags'],
+        'key_claims': report['key_claims'],
+        'sources_checked': report['sources_checked'],
+        'source_url': report.get('source_url')
+    }
+
+
+def text_key(text):
+    """Lookup key stored next to each red flag and claim"""
+    return ' '.join(str(text).lower().split())[:MAX_KEY_LENGTH]
+
+
+def source_ids(sources):
+    """Map source names to ids in the sources table, creating missing ones; caller commits"""
+    by_name = {source['name']: source for source in sources if source.get('name')}
+    with _source_lock:
+        ids = {name: _source_ids[name] for name in by_name if name in _source_ids}
+    missing = [name for name in by_name if name not in ids]
+    if not missing:
+        return ids
+
+    existing = dict(db.session.execute(
+        select(Source.name, Source.id).where(Source.name.in_(missing))
+    ).all())
+    with _source_lock:
+        # Only committed rows are remembered; new ones could still roll back
+        _source_ids.update(existing)
+    ids.update(existing)
+
+    for name in missing:
+        if name in existing:
+            continue
+        source = by_name[name]
+        try:
+            with db.session.begin_nested():
+                ids[name] = db.session.execute(insert(Source).values(
+                    name=name, url=source.get('url'), credibility=source.get('credibility'),
+                    type=source.get('type')
+                ).returning(Source.id)).scalar_one()
+        except IntegrityError:
+            # Another worker added it first
+            ids[name] = db.session.execute(select(Source.id).where(Source.name == name)).scalar_one()
+    return ids
+
+
+def detail_rows(analysis_id, red_flags, key_claims, sources_checked, ids_by_name):
+    """Child-table rows (flags, claims, sources) for one analysis"""
+    flags = [{'analysis_id': analysis_id, 'position': position, 'text': str(flag), 'text_key': text_key(flag)}
+             for position, flag in enumerate(red_flags or [])]
+    claims = [{'analysis_id': analysis_id, 'position': position, 'text': str(claim), 'text_key': text_key(claim)}
+              for position, claim in enumerate(key_claims or [])]
+    sources = []
+    seen = set()
+    for position, source in enumerate(sources_checked or []):
+        source_id = ids_by_name.get(source.get('name')) if isinstance(source, dict) else None
+        if source_id is None or source_id in seen:
+            continue
+        seen.add(source_id)
+        sources.append({'analysis_id': analysis_id, 'source_id': source_id, 'position': position,
+                        'checked': source.get('checked', True)})
+    return flags, claims, sources
+
+
+def save_details(flags, claims, sources):
+    """Bulk insert child-table rows; caller commits"""
+    if flags:
+        db.session.execute(insert(AnalysisRedFlag), flags)
+    if claims:
+        db.session.execute(insert(AnalysisClaim), claims)
+    if sources:
+        db.session.execute(insert(AnalysisSource), sources)
+
+
+def save_analyses(rows, commit=True):
+    """Insert analysis rows with their red flags, claims and sources in one transaction.
+
+    With commit=False the caller commits, e.g. together with its own progress record.
+    """
+    if not rows:
+        return
+    parents = []
+    for row in rows:
+        parent = dict(row)
+        # Stored in the child tables; key_claims also stays on the row for full-text search
+        parent.pop('red_flags', None)
+        parent.pop('sources_checked', None)
+        parents.append(parent)
+
+    ids = db.session.execute(
+        insert(AnalysisHistory).returning(AnalysisHistory.id, sort_by_parameter_order=True),
+        parents
+    ).scalars().all()
+
+    ids_by_name = source_ids([source for row in rows for source in row.get('sources_checked') or []
+                              if isinstance(source, dict)])
+    flags, claims, sources = [], [], []
+    for analysis_id, row in zip(ids, rows):
+        row_flags, row_claims, row_sources = detail_rows(
+            analysis_id, row.get('red_flags'), row.get('key_claims'), row.get('sources_checked'), ids_by_name
+        )
+        flags.extend(row_flags)
+        claims.extend(row_claims)
+        sources.extend(row_sources)
+    save_details(flags, claims, sources)
+
+    rollups.record_analyses(rows)
+    response_cache.bump(*{row['user_id'] for row in rows})
+    if commit:
+        db.session.commit()
+
+
+def load_details(rows):
+    """{id: {'red_flags', 'key_claims', 'sources_checked'}} for Core rows of analysis_history.
+
+    Three queries for the whole batch. Rows not yet moved to the child tables
+    fall back to their legacy JSON columns.
+    """
+    ids = [row.id for row in rows]
+    details = {analysis_id: {'red_flags': [], 'key_claims': [], 'sources_checked': []} for analysis_id in ids}
+    if not ids:
+        return details
+
+    for analysis_id, text in db.session.execute(
+        select(AnalysisRedFlag.analysis_id, AnalysisRedFlag.text)
+        .where(AnalysisRedFlag.analysis_id.in_(ids))
+        .order_by(AnalysisRedFlag.analysis_id, AnalysisRedFlag.position)
+    ):
+        details[analysis_id]['red_flags'].append(text)
+
+    for analysis_id, text in db.session.execute(
+        select(AnalysisClaim.analysis_id, AnalysisClaim.text)
+        .where(AnalysisClaim.analysis_id.in_(ids))
+        .order_by(AnalysisClaim.analysis_id, AnalysisClaim.position)
+    ):
+        details[analysis_id]['key_claims'].append(text)
+
+    for link in db.session.execute(
+        select(AnalysisSource.analysis_id, AnalysisSource.checked, Source.name, Source.url,
+               Source.credibility, Source.type)
+        .join(Source, Source.id == AnalysisSource.source_id)
+        .where(AnalysisSource.analysis_id.in_(ids))
+        .order_by(AnalysisSource.analysis_id, AnalysisSource.position)
+    ):
+        details[link.analysis_id]['sources_checked'].append({
+            'name': link.name,
+            'url': link.url,
+            'credibility': link.credibility,
+            'checked': link.checked,
+            'type': link.type
+        })
+
+    for row in rows:
+        entry = details[row.id]
+        for field in ('red_flags', 'key_claims', 'sources_checked'):
+            if not entry[field]:
+                entry[field] = getattr(row, field, None) or []
+    return details
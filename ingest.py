@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Offline bulk analysis of article archives
+Reads NDJSON or CSV from disk one record at a time, runs each article through
+NewsAnalyzer.generate_report on a bounded worker pool (Gemini calls still go
+through the shared quota governor, at background priority), and writes results
+into AnalysisHistory in executemany batches. Progress is checkpointed in the
+database with every batch, in the same transaction, so an interrupted run
+resumes where it stopped without writing any row twice.
+
+Ingested analyses do not consume credits.
+
+Usage:
+    python ingest.py articles.ndjson --user-id 1
+    python ingest.py articles.csv --user-id 1 --workers 8 --batch-size 200
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', 4))
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', 100))
+MIN_TEXT_LENGTH = 10
+
+
+def read_records(path, fmt):
+    """Yield (index, record) pairs from an NDJSON or CSV file without loading it"""
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            for index, record in enumerate(csv.DictReader(f)):
+                yield index, record
+        else:
+            index = 0
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    yield index, json.loads(line)
+                except ValueError:
+                    yield index, None
+                index += 1
+
+
+class Checkpoint:
+    """Records which input records are already saved, for crash-safe resume.
+
+    Everything below `watermark` is done; `done_ahead` holds finished records
+    past it, which appear because workers complete out of order. The state is
+    an ingest_checkpoints row, updated in the same transaction as the rows it
+    covers, so a resumed run never inserts a batch twice.
+    """
+
+    def __init__(self, name):
+        from models import db, IngestCheckpoint
+
+        self.name = name
+        self.watermark = 0
+        self.done_ahead = set()
+        self.written = 0
+        self.failed = 0
+        state = db.session.get(IngestCheckpoint, name)
+        if state is not None:
+            self.watermark = state.watermark
+            self.done_ahead = set(state.done_ahead or [])
+            self.written = state.written or 0
+            self.failed = state.failed or 0
+
+    def is_done(self, index):
+        return index < self.watermark or index in self.done_ahead
+
+    def mark_done(self, indexes):
+        self.done_ahead.update(indexes)
+        while self.watermark in self.done_ahead:
+            self.done_ahead.remove(self.watermark)
+            self.watermark += 1
+
+    def stage(self):
+        """Add the current state to the session; the caller's commit saves it"""
+        from models import db, IngestCheckpoint
+
+        db.session.merge(IngestCheckpoint(
+            name=self.name,
+            watermark=self.watermark,
+            done_ahead=sorted(self.done_ahead),
+            written=self.written,
+            failed=self.failed
+        ))
+
+
+def run(app, path, user_id, fmt, workers=INGEST_WORKERS, batch_size=INGEST_BATCH_SIZE,
+        checkpoint_name=None, errors_path=None, text_field='text', headline_field='headline'):
+    from NewsScope import analyzer
+    from governor import PRIORITY_BACKGROUND
+    from history import history_values, save_analyses
+    from models import db
+
+    with app.app_context():
+        checkpoint = Checkpoint(checkpoint_name or os.path.abspath(path))
+    errors = open(errors_path or path + '.errors.ndjson', 'a', encoding='utf-8')
+    errors_lock = threading.Lock()
+
+    if checkpoint.watermark or checkpoint.done_ahead:
+        print(f"↻ Resuming after record {checkpoint.watermark} ({checkpoint.written} already written)")
+
+    def log_error(index, message):
+        with errors_lock:
+            errors.write(json.dumps({'record': index, 'error': message}) + '\n')
+            errors.flush()
+
+    def analyze(index, record):
+        """Runs on a worker thread; returns (index, row or None)"""
+        if not isinstance(record, dict):
+            log_error(index, "Unreadable record")
+            return index, None
+        news_text = (record.get(text_field) or '').strip()
+        headline = (record.get(headline_field) or '').strip()
+        if len(news_text) < MIN_TEXT_LENGTH:
+            log_error(index, "News text must be at least 10 characters long")
+            return index, None
+        with app.app_context():
+            try:
+                report = analyzer.generate_report(news_text, headline, user_id, save=False,
+                                                  priority=PRIORITY_BACKGROUND)
+            except Exception as e:
+                log_error(index, str(e))
+                return index, None
+        return index, history_values(user_id, news_text, headline, report)
+
+    pending_rows = []
+    pending_indexes = []
+    processed = 0
+    started = time.monotonic()
+    last_report = started
+
+    def flush():
+        nonlocal pending_rows, pending_indexes
+        if not pending_indexes:
+            return
+        # Rows and checkpoint commit together: a crash leaves both or neither
+        save_analyses(pending_rows, commit=False)
+        checkpoint.written += len(pending_rows)
+        checkpoint.mark_done(pending_indexes)
+        checkpoint.stage()
+        db.session.commit()
+        pending_rows, pending_indexes = [], []
+
+    def collect(futures):
+        nonlocal processed
+        for future in futures:
+            index, row = future.result()
+            processed += 1
+            pending_indexes.append(index)
+            if row is None:
+                checkpoint.failed += 1
+            else:
+                pending_rows.append(row)
+        if len(pending_indexes) >= batch_size:
+            flush()
+
+    with app.app_context(), ThreadPoolExecutor(max_workers=workers) as pool:
+        in_flight = set()
+        try:
+            for index, record in read_records(path, fmt):
+                if checkpoint.is_done(index):
+                    continue
+                # Bound the number of queued records so memory stays flat on huge inputs
+                if len(in_flight) >= workers * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                in_flight.add(pool.submit(analyze, index, record))
+
+                now = time.monotonic()
+                if now - last_report >= 10:
+                    print(f"  {processed} processed, {checkpoint.written + len(pending_rows)} written, "
+                          f"{checkpoint.failed} failed ({processed / (now - started):.2f} articles/s)")
+                    last_report = now
+
+            done, _ = wait(in_flight)
+            collect(done)
+            flush()
+        except KeyboardInterrupt:
+            print("\n⚠️  Interrupted; saving progress")
+            for future in in_flight:
+                future.cancel()
+            collect([future for future in in_flight if future.done() and not future.cancelled()])
+            flush()
+            raise
+        finally:
+            errors.close()
+
+    elapsed = time.monotonic() - started
+    print("\n📊 Ingest Summary:")
+    print(f"   • Processed: {processed} articles in {elapsed:.1f}s "
+          f"({processed / elapsed if elapsed else 0:.2f} articles/s)")
+    print(f"   • Written: {checkpoint.written} analyses in total")
+    print(f"   • Failed: {checkpoint.failed} (see {errors.name})")
+    return processed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bulk-analyze articles from an NDJSON or CSV file")
+    parser.add_argument('path')
+    parser.add_argument('--user-id', type=int, required=True, help='Account that owns the analyses')
+    parser.add_argument('--format', choices=['ndjson', 'csv'], help='Defaults to the file extension')
+    parser.add_argument('--workers', type=int, default=INGEST_WORKERS)
+    parser.add_argument('--batch-size', type=int, default=INGEST_BATCH_SIZE, help='Rows per bulk insert')
+    parser.add_argument('--checkpoint', help='Checkpoint name (default: the absolute input path)')
+    parser.add_argument('--errors', help='Error log (default: <path>.errors.ndjson)')
+    parser.add_argument('--text-field', default='text')
+    parser.add_argument('--headline-field', default='headline')
+    args = parser.parse_args()
+
+    fmt = args.format or ('csv' if args.path.lower().endswith('.csv') else 'ndjson')
+
+    from NewsScope import app
+    from models import User
+
+    with app.app_context():
+        if not User.query.get(args.user_id):
+            print(f"❌ User {args.user_id} not found")
+            sys.exit(1)
+
+    run(app, args.path, args.user_id, fmt, args.workers, args.batch_size, args.checkpoint,
+        args.errors, args.text_field, args.headline_field)
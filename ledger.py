@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Append-only credit ledger
+credit_transactions is the ledger. Rows are only inserted, each with its
+amount and the balance before and after. Every credit change goes through
+post(), which moves users.credits with a single conditional
+UPDATE ... RETURNING and appends the entry in the caller's transaction. The
+users row is never read and rewritten, so concurrent deductions can't lose
+updates and the row lock is held only from that UPDATE to commit.
+
+users.credits is a cache of the ledger, used for the credit checks on the
+write path. The balance of record, served by /api/credits/balance, is the
+user's credit_snapshots row plus the entries after it (snapshot() moves the
+snapshots forward). check() verifies the before/after chains and the cache
+in bulk.
+
+Usage (e.g. from cron):
+    python ledger.py snapshot           Move every user's snapshot to their latest entry
+    python ledger.py check [--fix-cache]
+"""
+
+import argparse
+import os
+from datetime import datetime
+from sqlalchemy import and_, case, event, func, insert, select, update
+
+import response_cache
+import rollups
+from models import db, CreditSnapshot, CreditTransaction, User
+
+LEDGER_BATCH_SIZE = int(os.getenv('LEDGER_BATCH_SIZE', 1000))
+
+# Signed change to the balance for one entry
+DELTA = case(
+    (CreditTransaction.transaction_type == 'deduct', -CreditTransaction.credits_amount),
+    else_=CreditTransaction.credits_amount
+)
+
+
+@event.listens_for(CreditTransaction, 'before_update')
+def _append_only(mapper, connection, target):
+    raise ValueError("credit_transactions is append-only; post a correcting entry instead")
+
+
+def post(user_id, transaction_type, amount, description=None, **fields):
+    """Append a ledger entry and move the cached balance; caller commits.
+
+    Returns the balance after the entry, or None when the user doesn't exist
+    or a deduction exceeds the balance (the caller should roll back).
+    fields are extra CreditTransaction columns (payment_id, order_id, amount_paid).
+    """
+    now = datetime.utcnow()
+    delta = -amount if transaction_type == 'deduct' else amount
+
+    # Rollup row before users row, the same lock order as history.save_analyses
+    rollups.record_transaction(user_id, transaction_type, amount, now)
+
+    # The data_version bump rides on the same UPDATE, so the hot row is written once
+    values = {'credits': User.credits + delta, 'data_version': response_cache.next_version()}
+    conditions = [User.id == user_id]
+    if transaction_type == 'deduct':
+        values['credits_used'] = func.coalesce(User.credits_used, 0) + amount
+        conditions.append(User.credits >= amount)
+    credits_after = db.session.execute(
+        update(User).where(*conditions).values(**values).returning(User.credits)
+    ).scalar()
+    if credits_after is None:
+        return None
+
+    db.session.execute(insert(CreditTransaction).values(
+        user_id=user_id,
+        transaction_type=transaction_type,
+        credits_amount=amount,
+        credits_before=credits_after - delta,
+        credits_after=credits_after,
+        description=description,
+        created_at=now,
+        **fields
+    ))
+    response_cache.bumped(user_id)
+    return credits_after
+
+
+def derived_balances(user_ids):
+    """{user_id: (balance, last ledger id)} from snapshots plus later entries.
+
+    Users with no snapshot start from the credits_before of their first
+    entry. Users with neither have no ledger history and are left out.
+    """
+    if not user_ids:
+        return {}
+    snapshots = {row.user_id: (row.balance, row.ledger_id) for row in db.session.execute(
+        select(CreditSnapshot.user_id, CreditSnapshot.balance, CreditSnapshot.ledger_id)
+        .where(CreditSnapshot.user_id.in_(user_ids))
+    )}
+
+    tails = db.session.execute(
+        select(CreditTransaction.user_id, func.sum(DELTA).label('delta'),
+               func.min(CreditTransaction.id).label('first_id'), func.max(CreditTransaction.id).label('last_id'))
+        .outerjoin(CreditSnapshot, CreditSnapshot.user_id == CreditTransaction.user_id)
+        .where(CreditTransaction.user_id.in_(user_ids),
+               CreditTransaction.id > func.coalesce(CreditSnapshot.ledger_id, 0))
+        .group_by(CreditTransaction.user_id)
+    ).all()
+
+    first_ids = [tail.first_id for tail in tails if tail.user_id not in snapshots]
+    openings = dict(db.session.execute(
+        select(CreditTransaction.user_id, CreditTransaction.credits_before)
+        .where(CreditTransaction.id.in_(first_ids))
+    ).all()) if first_ids else {}
+
+    balances = {user_id: (balance, ledger_id) for user_id, (balance, ledger_id) in snapshots.items()}
+    for tail in tails:
+        base = snapshots[tail.user_id][0] if tail.user_id in snapshots else openings[tail.user_id]
+        balances[tail.user_id] = (base + int(tail.delta), tail.last_id)
+    return balances
+
+
+def balance(user_id):
+    """The user's balance of record, falling back to the cache for users with no ledger history
+
+    Starts from the user's snapshot and sums only the entries after it, a
+    range on (user_id, id), so the read stays short however long the ledger
+    grows. A user without a snapshot yet sums from their first entry.
+    """
+    snapshot_row = db.session.execute(
+        select(CreditSnapshot.balance, CreditSnapshot.ledger_id).where(CreditSnapshot.user_id == user_id)
+    ).first()
+    tail = db.session.execute(
+        select(func.sum(DELTA).label('delta'), func.min(CreditTransaction.id).label('first_id'))
+        .where(CreditTransaction.user_id == user_id,
+               CreditTransaction.id > (snapshot_row.ledger_id if snapshot_row else 0))
+    ).first()
+    if snapshot_row is not None:
+        return snapshot_row.balance + int(tail.delta or 0)
+    if tail.first_id is None:
+        return db.session.execute(select(User.credits).where(User.id == user_id)).scalar()
+    opening = db.session.execute(
+        select(CreditTransaction.credits_before).where(CreditTransaction.id == tail.first_id)
+    ).scalar()
+    return opening + int(tail.delta)
+
+
+def _user_batches(batch_size):
+    last_id = 0
+    while True:
+        ids = db.session.execute(
+            select(User.id).where(User.id > last_id).order_by(User.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def snapshot(batch_size=LEDGER_BATCH_SIZE):
+    """Move each user's snapshot up to their latest entry; returns snapshots written"""
+    written = 0
+    for ids in _user_batches(batch_size):
+        existing = dict(db.session.execute(
+            select(CreditSnapshot.user_id, CreditSnapshot.ledger_id).where(CreditSnapshot.user_id.in_(ids))
+        ).all())
+        changed, created = [], []
+        now = datetime.utcnow()
+        for user_id, (amount, ledger_id) in derived_balances(ids).items():
+            row = {'user_id': user_id, 'ledger_id': ledger_id, 'balance': amount, 'created_at': now}
+            if user_id not in existing:
+                created.append(row)
+            elif existing[user_id] != ledger_id:
+                changed.append(row)
+        if created:
+            db.session.execute(insert(CreditSnapshot), created)
+        if changed:
+            # Bulk UPDATE by primary key
+            db.session.execute(update(CreditSnapshot), changed)
+        db.session.commit()
+        written += len(created) + len(changed)
+    return written
+
+
+def check(batch_size=LEDGER_BATCH_SIZE, fix_cache=False, show=10):
+    """Verify before/after chains and the users.credits cache for every user.
+
+    A chain break is an entry whose credits_before isn't the previous entry's
+    credits_after, or whose credits_after isn't credits_before plus its
+    amount. Ledger problems are only reported; fix_cache resets users.credits
+    to the ledger balance.
+    """
+    previous_after = func.lag(CreditTransaction.credits_after).over(
+        partition_by=CreditTransaction.user_id, order_by=CreditTransaction.id
+    )
+    totals = {'users': 0, 'entries': 0, 'chain_breaks': 0, 'bad_amounts': 0, 'cache_mismatches': 0,
+              'cache_fixed': 0}
+
+    for ids in _user_batches(batch_size):
+        totals['users'] += len(ids)
+        chain = select(
+            CreditTransaction.id, CreditTransaction.user_id, CreditTransaction.credits_before,
+            CreditTransaction.credits_after, (CreditTransaction.credits_before + DELTA).label('expected_after'),
+            previous_after.label('previous_after')
+        ).where(CreditTransaction.user_id.in_(ids)).subquery()
+        totals['entries'] += db.session.execute(
+            select(func.count()).select_from(CreditTransaction).where(CreditTransaction.user_id.in_(ids))
+        ).scalar()
+
+        for entry in db.session.execute(
+            select(chain).where(
+                (and_(chain.c.previous_after.isnot(None), chain.c.credits_before != chain.c.previous_after))
+                | (chain.c.credits_after != chain.c.expected_after)
+            ).order_by(chain.c.id)
+        ):
+            problems = []
+            if entry.previous_after is not None and entry.credits_before != entry.previous_after:
+                totals['chain_breaks'] += 1
+                problems.append(f"credits_before {entry.credits_before}, previous entry ended at {entry.previous_after}")
+            if entry.credits_after != entry.expected_after:
+                totals['bad_amounts'] += 1
+                problems.append(f"credits_after {entry.credits_after}, expected {entry.expected_after}")
+            if totals['bad_amounts'] + totals['chain_breaks'] <= show:
+                print(f"  ✗ user {entry.user_id} entry {entry.id}: {'; '.join(problems)}")
+
+        cached = dict(db.session.execute(select(User.id, User.credits).where(User.id.in_(ids))).all())
+        for user_id, (amount, _) in derived_balances(ids).items():
+            if cached.get(user_id) == amount:
+                continue
+            totals['cache_mismatches'] += 1
+            if totals['cache_mismatches'] <= show:
+                print(f"  ✗ user {user_id}: users.credits {cached.get(user_id)}, ledger balance {amount}")
+            if fix_cache:
+                db.session.execute(update(User).where(User.id == user_id).values(credits=amount))
+                response_cache.bump(user_id)
+                totals['cache_fixed'] += 1
+        db.session.commit()
+    return totals
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Credit ledger maintenance")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    snapshot_parser = subparsers.add_parser('snapshot', help="Move every user's snapshot to their latest entry")
+    snapshot_parser.add_argument('--batch-size', type=int, default=LEDGER_BATCH_SIZE)
+    check_parser = subparsers.add_parser('check', help='Verify ledger chains and cached balances')
+    check_parser.add_argument('--fix-cache', action='store_true', help='Reset users.credits to the ledger balance')
+    check_parser.add_argument('--batch-size', type=int, default=LEDGER_BATCH_SIZE)
+    args = parser.parse_args()
+
+    import migrate
+    from NewsScope import app
+
+    with app.app_context():
+        migrate.require_current()
+        if args.command == 'snapshot':
+            print(f"✅ Wrote {snapshot(args.batch_size)} credit snapshots")
+        else:
+            totals = check(args.batch_size, args.fix_cache)
+            print("\n📊 Ledger Check Summary:")
+            print(f"   • Users checked: {totals['users']}")
+            print(f"   • Entries checked: {totals['entries']}")
+            print(f"   • Chain breaks: {totals['chain_breaks']}")
+            print(f"   • Wrong credits_after: {totals['bad_amounts']}")
+            print(f"   • Cache mismatches: {totals['cache_mismatches']}")
+            if args.fix_cache:
+                print(f"   • Cache entries fixed: {totals['cache_fixed']}")
+            if totals['chain_breaks'] or totals['bad_amounts'] or totals['cache_mismatches'] > totals['cache_fixed']:
+                raise SystemExit(1)
@@ -0,0 +1,46 @@
+"""
+Lightweight in-process metrics for NewsScope
+Each gunicorn worker keeps its own counters; /api/metrics reports the
+numbers for the worker that served the request, to admins only.
+"""
+
+import threading
+
+_lock = threading.Lock()
+_counters = {}
+_timings = {}
+
+
+def increment(name, value=1):
+    """Increase a counter by value"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name, seconds):
+    """Record a duration sample (in seconds) for a timing metric"""
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            timing = _timings[name] = {'count': 0, 'total': 0.0, 'max': 0.0}
+        timing['count'] += 1
+        timing['total'] += seconds
+        if seconds > timing['max']:
+            timing['max'] = seconds
+
+
+def snapshot():
+    """Return a copy of all counters and timing summaries"""
+    with _lock:
+        timings = {}
+        for name, timing in _timings.items():
+            timings[name] = {
+                'count': timing['count'],
+                'total_ms': round(timing['total'] * 1000, 2),
+                'avg_ms': round(timing['total'] * 1000 / timing['count'], 2) if timing['count'] else 0,
+                'max_ms': round(timing['max'] * 1000, 2)
+            }
+        return {
+            'counters': dict(_counters),
+            'timings': timings
+        }
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations
+Each file in migrations/ named NNNN_description.py defines upgrade(op). The
+files are applied once each, in version order, and recorded in
+schema_migrations. The operations on `op` are safe to run against a live
+database:
+
+    op.create_all       Create every model table that is missing
+    op.create_table     Create a table if it is missing
+    op.add_column       ALTER TABLE ... ADD COLUMN for a table's column, skipped if present
+
+Migrations after the baseline describe their tables and columns themselves
+(sqlalchemy Table or table()/column()) rather than importing models.py, so
+a later model change can't change what an old migration does.
+    op.create_index     CREATE INDEX CONCURRENTLY on Postgres, so writes aren't blocked;
+                        an invalid index left by an interrupted build is dropped and rebuilt
+    op.drop_index       DROP INDEX CONCURRENTLY on Postgres
+    op.execute          Raw DDL/SQL
+    op.backfill         Batched UPDATE in id order
+    op.run_batches      The same loop for custom batch functions
+
+Schema-changing statements run with a short lock_timeout on Postgres and are
+retried, so a migration waiting behind a long transaction fails fast instead
+of queueing every other query behind its lock. Batched work commits one short
+transaction per batch, sleeps between batches and stores its cursor in
+schema_migrations, so an interrupted run resumes where it stopped. A Postgres
+advisory lock keeps two deploys from migrating at the same time.
+
+Configuration:
+    MIGRATION_LOCK_TIMEOUT_MS   lock_timeout for DDL and batches (default 5000)
+    MIGRATION_LOCK_RETRIES      Attempts when a lock times out (default 5)
+    MIGRATION_BATCH_SIZE        Rows per batch (default 1000)
+    MIGRATION_PAUSE             Seconds to sleep between batches (default 0.05)
+
+Usage:
+    python migrate.py status                    Applied, running and pending migrations
+    python migrate.py plan                      What upgrade would do, without changing anything
+    python migrate.py upgrade [--to VERSION]    Apply pending migrations
+"""
+
+import argparse
+import glob
+import importlib.util
+import os
+import time
+from datetime import datetime
+from sqlalchemy import inspect, select, update
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+
+from models import db, SchemaMigration
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+MIGRATION_LOCK_TIMEOUT_MS = int(os.getenv('MIGRATION_LOCK_TIMEOUT_MS', 5000))
+MIGRATION_LOCK_RETRIES = int(os.getenv('MIGRATION_LOCK_RETRIES', 5))
+MIGRATION_BATCH_SIZE = int(os.getenv('MIGRATION_BATCH_SIZE', 1000))
+MIGRATION_PAUSE = float(os.getenv('MIGRATION_PAUSE', 0.05))
+
+# Key for pg_advisory_lock; any constant shared by all deploys works
+ADVISORY_LOCK_KEY = 482211
+
+
+class MigrationError(Exception):
+    """A migration could not be applied"""
+
+
+class Migration:
+    """One file in migrations/"""
+
+    def __init__(self, path):
+        filename = os.path.splitext(os.path.basename(path))[0]
+        self.version, _, self.name = filename.partition('_')
+        spec = importlib.util.spec_from_file_location(f'migrations.m{filename}', path)
+        self.module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self.module)
+        self.description = (self.module.__doc__ or self.name).strip().splitlines()[0]
+
+    def upgrade(self, op):
+        self.module.upgrade(op)
+
+
+def load_migrations():
+    """Migrations in version order"""
+    migrations = [Migration(path) for path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, '[0-9]*.py')))]
+    versions = [migration.version for migration in migrations]
+    if len(set(versions)) != len(versions):
+        raise MigrationError(f"Duplicate migration versions in {MIGRATIONS_DIR}")
+    return migrations
+
+
+def _is_lock_timeout(error):
+    # 55P03 lock_not_available
+    return getattr(getattr(error, 'orig', None), 'pgcode', None) == '55P03'
+
+
+class Operations:
+    """The `op` passed to upgrade(); in plan mode it only prints what it would do"""
+
+    def __init__(self, record, plan=False, batch_size=MIGRATION_BATCH_SIZE, pause=MIGRATION_PAUSE):
+        self.record = record
+        self.plan = plan
+        self.batch_size = batch_size
+        self.pause = pause
+        self.dialect = db.engine.dialect.name
+
+    def _say(self, message):
+        print(f"    {'would ' if self.plan else ''}{message}")
+
+    def has_table(self, table):
+        return inspect(db.engine).has_table(table)
+
+    def has_column(self, table, column):
+        return self.has_table(table) and column in {c['name'] for c in inspect(db.engine).get_columns(table)}
+
+    def has_index(self, table, name):
+        return self.has_table(table) and name in {index['name'] for index in inspect(db.engine).get_indexes(table)}
+
+    def _ddl(self, statement):
+        """Run one statement in its own transaction under lock_timeout, retrying on timeouts"""
+        for attempt in range(1, MIGRATION_LOCK_RETRIES + 1):
+            try:
+                with db.engine.begin() as conn:
+                    if self.dialect == 'postgresql':
+                        conn.exec_driver_sql(f"SET LOCAL lock_timeout = '{MIGRATION_LOCK_TIMEOUT_MS}ms'")
+                    conn.exec_driver_sql(statement)
+                return
+            except OperationalError as e:
+                if not _is_lock_timeout(e) or attempt == MIGRATION_LOCK_RETRIES:
+                    raise
+                print(f"    lock timeout, retrying ({attempt}/{MIGRATION_LOCK_RETRIES})")
+                time.sleep(min(2 ** attempt, 30))
+
+    def execute(self, statement):
+        self._say(f"run: {' '.join(statement.split())[:120]}")
+        if not self.plan:
+            self._ddl(statement)
+
+    def create_all(self):
+        """Create every model table that doesn't exist yet (with its model indexes)"""
+        for table in db.metadata.sorted_tables:
+            if not self.has_table(table.name):
+                self._say(f"create table {table.name}")
+                if not self.plan:
+                    table.create(db.engine, checkfirst=True)
+
+    def create_table(self, table):
+        """Create a Table (or a model's table) if it doesn't exist yet"""
+        table = getattr(table, '__table__', table)
+        if self.has_table(table.name):
+            return
+        self._say(f"create table {table.name}")
+        if not self.plan:
+            table.create(db.engine, checkfirst=True)
+
+    def add_column(self, table, column_name, server_default=None):
+        """Add a table's column as nullable (or NOT NULL with a constant server_default)"""
+        table = getattr(table, '__table__', table)
+        if not self.has_table(table.name) or self.has_column(table.name, column_name):
+            # A missing table is created with all its columns
+            return
+        column = table.c[column_name]
+        definition = f"{column.name} {column.type.compile(dialect=db.engine.dialect)}"
+        if server_default is not None:
+            # A constant default doesn't rewrite the table on Postgres 11+
+            definition += f" NOT NULL DEFAULT {server_default}"
+        self.execute(f"ALTER TABLE {table.name} ADD COLUMN {definition}")
+
+    def create_index(self, name, table, columns, unique=False, using=None, where=None):
+        """Create an index without blocking writes.
+
+        columns is the SQL column list or expression (e.g. "user_id, created_at DESC"),
+        where an optional predicate for a partial index.
+        """
+        suffix = f" WHERE {where}" if where else ""
+        if self.dialect == 'postgresql':
+            self._create_index_concurrently(name, table, columns, unique, using, suffix)
+            return
+        if self.has_index(table, name):
+            return
+        self.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON {table} ({columns}){suffix}")
+
+    def drop_index(self, name, table):
+        if self.dialect == 'postgresql':
+            self._concurrently(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        elif self.has_index(table, name):
+            self.execute(f"DROP INDEX IF EXISTS {name}")
+
+    def _create_index_concurrently(self, name, table, columns, unique, using, suffix):
+        with db.engine.connect() as conn:
+            state = conn.exec_driver_sql(
+                "SELECT i.indisvalid FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid WHERE c.relname = %s",
+                (name,)
+            ).scalar()
+        if state is True:
+            return
+        if state is False:
+            # Left behind by an interrupted CONCURRENTLY build
+            self._concurrently(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        self._concurrently(
+            f"CREATE {'UNIQUE ' if unique else ''}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table}"
+            f"{f' USING {using}' if using else ''} ({columns}){suffix}"
+        )
+
+    def _concurrently(self, statement):
+        self._say(f"run: {statement[:120]}")
+        if self.plan:
+            return
+        # CONCURRENTLY can't run inside a transaction block
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.exec_driver_sql(f"SET lock_timeout = '{MIGRATION_LOCK_TIMEOUT_MS}ms'")
+            try:
+                conn.exec_driver_sql(statement)
+            finally:
+                conn.exec_driver_sql("RESET lock_timeout")
+
+    def backfill(self, key, model, values, *criteria):
+        """UPDATE model SET values WHERE criteria, in id-ordered batches"""
+        def batch(after_id, batch_size):
+            ids = db.session.execute(
+                select(model.id).where(model.id > after_id, *criteria).order_by(model.id).limit(batch_size)
+            ).scalars().all()
+            if ids:
+                db.session.execute(update(model).where(model.id.in_(ids)).values(**values))
+            return ids[-1] if ids else None
+
+        def remaining(after_id):
+            return db.session.execute(
+                select(db.func.count()).select_from(model).where(model.id > after_id, *criteria)
+            ).scalar()
+
+        self.run_batches(key, batch, remaining)
+
+    def run_batches(self, key, batch, remaining=None):
+        """Call batch(after_id, batch_size) until it returns None.
+
+        batch does one batch of work in db.session without committing and
+        returns the last id it handled. The cursor is saved in the same
+        transaction, so a rerun continues after the last committed batch.
+        """
+        progress = dict(self.record.progress or {}) if self.record else {}
+        cursor = progress.get(key, 0)
+        if self.plan:
+            count = None
+            if remaining:
+                try:
+                    count = remaining(cursor)
+                except SQLAlchemyError:
+                    # The table is created by an earlier pending migration
+                    db.session.rollback()
+            self._say(f"backfill {key} in batches of {self.batch_size}"
+                      f"{f' ({count} rows left)' if count is not None else ''}")
+            db.session.rollback()
+            return
+
+        done = 0
+        started = time.monotonic()
+        while True:
+            if self.dialect == 'postgresql':
+                db.session.execute(db.text(f"SET LOCAL lock_timeout = '{MIGRATION_LOCK_TIMEOUT_MS}ms'"))
+            last_id = batch(cursor, self.batch_size)
+            if last_id is None:
+                db.session.commit()
+                break
+            cursor = progress[key] = last_id
+            db.session.execute(
+                update(SchemaMigration).where(SchemaMigration.version == self.record.version)
+                .values(progress=dict(progress))
+            )
+            db.session.commit()
+            done += 1
+            if done % 10 == 0:
+                print(f"    {key}: {done} batches, at id {cursor} ({time.monotonic() - started:.0f}s)")
+            if self.pause:
+                time.sleep(self.pause)
+        self.record.progress = progress
+        print(f"    {key}: done ({done} batches)")
+
+
+def _applied():
+    if not inspect(db.engine).has_table(SchemaMigration.__tablename__):
+        return {}
+    return {row.version: row for row in db.session.execute(select(SchemaMigration)).scalars()}
+
+
+def status():
+    """[(migration, record or None)] in version order"""
+    applied = _applied()
+    return [(migration, applied.get(migration.version)) for migration in load_migrations()]
+
+
+def pending():
+    """Versions of migrations not yet applied"""
+    return [migration.version for migration, record in status() if record is None or record.status != 'applied']
+
+
+def require_current():
+    """Exit unless every migration is applied; for maintenance CLIs, which never create tables"""
+    waiting = pending()
+    if waiting:
+        print(f"❌ Database schema is not up to date ({len(waiting)} pending migrations, from {waiting[0]})")
+        print("   Run `flask init-db` or `python migrate.py upgrade` first")
+        raise SystemExit(1)
+
+
+def _advisory_lock():
+    if db.engine.dialect.name != 'postgresql':
+        return None
+    conn = db.engine.connect()
+    conn.exec_driver_sql(f"SELECT pg_advisory_lock({ADVISORY_LOCK_KEY})")
+    return conn
+
+
+def upgrade(target=None, plan=False, batch_size=MIGRATION_BATCH_SIZE, pause=MIGRATION_PAUSE):
+    """Apply (or, with plan, describe) pending migrations up to target; returns versions handled"""
+    lock = None if plan else _advisory_lock()
+    try:
+        if not plan:
+            SchemaMigration.__table__.create(db.engine, checkfirst=True)
+        handled = []
+        for migration, record in status():
+            if target and migration.version > target:
+                break
+            if record is not None and record.status == 'applied':
+                continue
+
+            print(f"  {migration.version} {migration.description}"
+                  f"{' (resuming)' if record is not None else ''}")
+            if not plan and record is None:
+                record = SchemaMigration(version=migration.version, name=migration.name, status='running',
+                                         progress={}, started_at=datetime.utcnow())
+                db.session.add(record)
+                db.session.commit()
+
+            migration.upgrade(Operations(record, plan, batch_size, pause))
+
+            if not plan:
+                db.session.execute(
+                    update(SchemaMigration).where(SchemaMigration.version == migration.version)
+                    .values(status='applied', applied_at=datetime.utcnow())
+                )
+                db.session.commit()
+            handled.append(migration.version)
+        return handled
+    finally:
+        if lock is not None:
+            lock.exec_driver_sql(f"SELECT pg_advisory_unlock({ADVISORY_LOCK_KEY})")
+            lock.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Versioned schema migrations")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('status', help='List applied, running and pending migrations')
+    subparsers.add_parser('plan', help='Show what upgrade would do')
+    upgrade_parser = subparsers.add_parser('upgrade', help='Apply pending migrations')
+    upgrade_parser.add_argument('--to', dest='target', help='Stop after this version')
+    upgrade_parser.add_argument('--batch-size', type=int, default=MIGRATION_BATCH_SIZE)
+    upgrade_parser.add_argument('--pause', type=float, default=MIGRATION_PAUSE,
+                                help='Seconds to sleep between batches')
+    args = parser.parse_args()
+
+    from NewsScope import app
+
+    with app.app_context():
+        if args.command == 'status':
+            for migration, record in status():
+                if record is None:
+                    state = 'pending'
+                elif record.status == 'applied':
+                    state = f"applied {record.applied_at:%Y-%m-%d %H:%M}"
+                else:
+                    state = f"running since {record.started_at:%Y-%m-%d %H:%M}, progress {record.progress or {}}"
+                print(f"  {migration.version}  {migration.description:<55} {state}")
+        elif args.command == 'plan':
+            print("📋 Pending migrations:")
+            if not upgrade(plan=True):
+                print("  (none)")
+        else:
+            print("🔄 Applying migrations...")
+            handled = upgrade(args.target, batch_size=args.batch_size, pause=args.pause)
+            print(f"✅ Applied {len(handled)} migrations")
@@ -0,0 +1,10 @@
+"""Baseline: create any missing tables
+
+On a new database this creates the whole schema. On a database set up by
+db.create_all() it only creates tables added since, and the migrations after
+it fill in columns and indexes create_all never added.
+"""
+
+
+def upgrade(op):
+    op.create_all()
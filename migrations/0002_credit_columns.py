@@ -0,0 +1,15 @@
+"""Add credits and credits_used to users
+
+Replaces migrate_credits.py. Its "give users with 0 credits 5 more" UPDATE is
+not carried over: 0 is a real balance once people spend credits, and running
+it again would hand out free credits.
+"""
+
+from sqlalchemy import Integer, column, table
+
+users = table('users', column('credits', Integer), column('credits_used', Integer))
+
+
+def upgrade(op):
+    op.add_column(users, 'credits', server_default=5)
+    op.add_column(users, 'credits_used', server_default=0)
@@ -0,0 +1,22 @@
+"""Add source URL, archive and data_version columns
+
+These were added at boot by add_missing_columns(), which never created the
+source_url and archived_at indexes on existing tables.
+"""
+
+from sqlalchemy import DateTime, Integer, LargeBinary, String, column, table
+
+analysis_history = table(
+    'analysis_history',
+    column('source_url', String(500)), column('archived_at', DateTime), column('archive_blob', LargeBinary),
+    column('archive_dictionary_id', Integer)
+)
+users = table('users', column('data_version', Integer))
+
+
+def upgrade(op):
+    for name in ('source_url', 'archived_at', 'archive_blob', 'archive_dictionary_id'):
+        op.add_column(analysis_history, name)
+    op.add_column(users, 'data_version')
+    op.create_index('ix_analysis_history_source_url', 'analysis_history', 'source_url')
+    op.create_index('ix_analysis_history_archived_at', 'analysis_history', 'archived_at')
@@ -0,0 +1,48 @@
+"""Full-text search index on analysis_history
+
+GIN expression index on Postgres, an external-content FTS5 table kept in sync
+by triggers on SQLite.
+
+The DDL is copied here rather than imported from search.py, so this migration
+stays the same when the search code changes. A later change to the index
+needs its own migration.
+"""
+
+# As of this migration; search_history queries with the same expression
+PG_DOCUMENT = (
+    "to_tsvector('english', coalesce(headline, '') || ' ' || coalesce(summary, '') || ' ' || "
+    "coalesce(key_claims::text, '') || ' ' || coalesce(news_text, ''))"
+)
+
+SQLITE_FTS_SETUP = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS analysis_history_fts USING fts5(
+        headline, summary, key_claims, news_text,
+        content='analysis_history', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS analysis_history_fts_ai AFTER INSERT ON analysis_history BEGIN
+        INSERT INTO analysis_history_fts(rowid, headline, summary, key_claims, news_text)
+        VALUES (new.id, new.headline, new.summary, new.key_claims, new.news_text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS analysis_history_fts_ad AFTER DELETE ON analysis_history BEGIN
+        INSERT INTO analysis_history_fts(analysis_history_fts, rowid, headline, summary, key_claims, news_text)
+        VALUES ('delete', old.id, old.headline, old.summary, old.key_claims, old.news_text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS analysis_history_fts_au AFTER UPDATE ON analysis_history BEGIN
+        INSERT INTO analysis_history_fts(analysis_history_fts, rowid, headline, summary, key_claims, news_text)
+        VALUES ('delete', old.id, old.headline, old.summary, old.key_claims, old.news_text);
+        INSERT INTO analysis_history_fts(rowid, headline, summary, key_claims, news_text)
+        VALUES (new.id, new.headline, new.summary, new.key_claims, new.news_text);
+    END"""
+]
+
+
+def upgrade(op):
+    if op.dialect == 'postgresql':
+        op.create_index('ix_analysis_history_search', 'analysis_history', PG_DOCUMENT, using='GIN')
+    elif op.dialect == 'sqlite':
+        exists = op.has_table('analysis_history_fts')
+        for statement in SQLITE_FTS_SETUP:
+            op.execute(statement)
+        if not exists:
+            # Index rows written before the FTS table existed
+            op.execute("INSERT INTO analysis_history_fts(analysis_history_fts) VALUES ('rebuild')")
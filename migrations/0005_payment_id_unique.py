@@ -0,0 +1,5 @@
+"""A payment can settle at most one order"""
+
+
+def upgrade(op):
+    op.create_index('ix_payment_orders_payment_id', 'payment_orders', 'payment_id', unique=True)
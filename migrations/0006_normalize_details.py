@@ -0,0 +1,133 @@
+"""Move red_flags and sources_checked into the normalized detail tables
+
+Replaces migrate_details.py. A migrated row has sources_checked and red_flags
+set to SQL NULL (not JSON null). key_claims stays on the row because the
+full-text search index is built from it.
+
+The tables and the row-building logic are defined here as of this migration,
+not imported from models.py or history.py, so it runs the same way on every
+new database however that code changes later.
+"""
+
+from sqlalchemy import JSON, Boolean, Integer, String, Text, column, func, insert, null, select, table, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db
+
+MAX_KEY_LENGTH = 160
+
+analysis_history = table(
+    'analysis_history',
+    column('id', Integer), column('red_flags', JSON), column('key_claims', JSON), column('sources_checked', JSON)
+)
+sources_table = table(
+    'sources',
+    column('id', Integer), column('name', String), column('url', String), column('credibility', String),
+    column('type', String)
+)
+red_flags_table = table(
+    'analysis_red_flags',
+    column('analysis_id', Integer), column('position', Integer), column('text', Text), column('text_key', String)
+)
+claims_table = table(
+    'analysis_claims',
+    column('analysis_id', Integer), column('position', Integer), column('text', Text), column('text_key', String)
+)
+analysis_sources_table = table(
+    'analysis_sources',
+    column('analysis_id', Integer), column('source_id', Integer), column('position', Integer),
+    column('checked', Boolean)
+)
+
+
+def _text_key(text):
+    return ' '.join(str(text).lower().split())[:MAX_KEY_LENGTH]
+
+
+def _source_ids(sources):
+    """Map source names to ids, creating missing sources"""
+    by_name = {source['name']: source for source in sources if source.get('name')}
+    if not by_name:
+        return {}
+    ids = dict(db.session.execute(
+        select(sources_table.c.name, sources_table.c.id).where(sources_table.c.name.in_(list(by_name)))
+    ).all())
+    for name, source in by_name.items():
+        if name in ids:
+            continue
+        try:
+            with db.session.begin_nested():
+                ids[name] = db.session.execute(insert(sources_table).values(
+                    name=name, url=source.get('url'), credibility=source.get('credibility'),
+                    type=source.get('type')
+                ).returning(sources_table.c.id)).scalar_one()
+        except IntegrityError:
+            # The running app added it first
+            ids[name] = db.session.execute(
+                select(sources_table.c.id).where(sources_table.c.name == name)
+            ).scalar_one()
+    return ids
+
+
+def _detail_rows(analysis_id, red_flags, key_claims, sources_checked, ids_by_name):
+    flags = [{'analysis_id': analysis_id, 'position': position, 'text': str(flag), 'text_key': _text_key(flag)}
+             for position, flag in enumerate(red_flags or [])]
+    claims = [{'analysis_id': analysis_id, 'position': position, 'text': str(claim), 'text_key': _text_key(claim)}
+              for position, claim in enumerate(key_claims or [])]
+    linked = []
+    seen = set()
+    for position, source in enumerate(sources_checked or []):
+        source_id = ids_by_name.get(source.get('name')) if isinstance(source, dict) else None
+        if source_id is None or source_id in seen:
+            continue
+        seen.add(source_id)
+        linked.append({'analysis_id': analysis_id, 'source_id': source_id, 'position': position,
+                       'checked': source.get('checked', True)})
+    return flags, claims, linked
+
+
+def _legacy(after_id):
+    return (analysis_history.c.id > after_id, analysis_history.c.sources_checked.isnot(None))
+
+
+def migrate_batch(after_id, batch_size):
+    rows = db.session.execute(
+        select(analysis_history.c.id, analysis_history.c.red_flags, analysis_history.c.key_claims,
+               analysis_history.c.sources_checked)
+        .where(*_legacy(after_id))
+        .order_by(analysis_history.c.id)
+        .limit(batch_size)
+    ).all()
+    if not rows:
+        return None
+
+    ids_by_name = _source_ids([source for row in rows for source in row.sources_checked or []
+                               if isinstance(source, dict)])
+    flags, claims, linked = [], [], []
+    for row in rows:
+        row_flags, row_claims, row_sources = _detail_rows(
+            row.id, row.red_flags, row.key_claims, row.sources_checked, ids_by_name
+        )
+        flags.extend(row_flags)
+        claims.extend(row_claims)
+        linked.extend(row_sources)
+    for target, values in ((red_flags_table, flags), (claims_table, claims), (analysis_sources_table, linked)):
+        if values:
+            db.session.execute(insert(target), values)
+
+    db.session.execute(
+        update(analysis_history)
+        .where(analysis_history.c.id.in_([row.id for row in rows]))
+        .values(red_flags=null(), sources_checked=null())
+    )
+    return rows[-1].id
+
+
+def remaining(after_id):
+    return db.session.execute(
+        select(func.count()).select_from(analysis_history).where(*_legacy(after_id))
+    ).scalar()
+
+
+def upgrade(op):
+    op.run_batches('analysis_details', migrate_batch, remaining)
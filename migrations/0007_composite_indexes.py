@@ -0,0 +1,18 @@
+"""Composite indexes for per-user history, transactions and orders
+
+Each list endpoint filters by user_id and orders by time, so the index on
+(user_id, time) returns a page without sorting the user's rows. The
+single-column user_id indexes they replace are dropped once the composites
+exist. Pending payment orders get a partial index for reconciliation.
+"""
+
+
+def upgrade(op):
+    op.create_index('ix_analysis_history_user_timestamp', 'analysis_history', 'user_id, timestamp DESC, id DESC')
+    op.create_index('ix_credit_transactions_user_created', 'credit_transactions', 'user_id, created_at DESC')
+    op.create_index('ix_payment_orders_user_created', 'payment_orders', 'user_id, created_at DESC')
+    op.create_index('ix_payment_orders_pending', 'payment_orders', 'id, created_at', where="status = 'created'")
+
+    op.drop_index('ix_analysis_history_user_id', 'analysis_history')
+    op.drop_index('ix_credit_transactions_user_id', 'credit_transactions')
+    op.drop_index('ix_payment_orders_user_id', 'payment_orders')
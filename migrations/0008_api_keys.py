@@ -0,0 +1,26 @@
+"""API keys for machine clients
+
+Hashed keys per user, looked up by key_hash on a cache miss.
+"""
+
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, MetaData, String, Table
+
+metadata = MetaData()
+# Only here so the foreign key resolves; never created
+Table('users', metadata, Column('id', Integer, primary_key=True))
+api_keys = Table(
+    'api_keys', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('users.id'), nullable=False, index=True),
+    Column('name', String(100), nullable=False),
+    Column('prefix', String(12), nullable=False),
+    Column('key_hash', String(64), unique=True, nullable=False),
+    Column('created_at', DateTime),
+    Column('last_used_at', DateTime),
+    Column('request_count', Integer, nullable=False),
+    Column('revoked_at', DateTime)
+)
+
+
+def upgrade(op):
+    op.create_table(api_keys)
@@ -0,0 +1,22 @@
+"""Ingest checkpoints in the database
+
+ingest.py saves where each input stopped in a row updated in the same
+transaction as the batch it covers, so a crash can't re-insert a batch on
+resume.
+"""
+
+from sqlalchemy import JSON, Column, DateTime, Integer, MetaData, String, Table
+
+ingest_checkpoints = Table(
+    'ingest_checkpoints', MetaData(),
+    Column('name', String(255), primary_key=True),
+    Column('watermark', Integer, nullable=False),
+    Column('done_ahead', JSON, nullable=False),
+    Column('written', Integer, nullable=False),
+    Column('failed', Integer, nullable=False),
+    Column('updated_at', DateTime)
+)
+
+
+def upgrade(op):
+    op.create_table(ingest_checkpoints)
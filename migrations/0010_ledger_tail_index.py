@@ -0,0 +1,10 @@
+"""Index credit_transactions on (user_id, id)
+
+ledger.balance() sums a user's entries after their credit snapshot; this
+index makes that a short range scan instead of a pass over every entry the
+user has.
+"""
+
+
+def upgrade(op):
+    op.create_index('ix_credit_transactions_user_id_id', 'credit_transactions', 'user_id, id')
@@ -1,9 +1,12 @@
 from datetime import datetime, timedelta
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
 import secrets
 
-db = SQLAlchemy()
+from passwords import hash_password, verify_password
+from replicas import RoutingSession
+
+# Reads in @read_replica requests may go to a replica, see replicas.py
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -17,6 +20,8 @@ class User(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     reset_token = db.Column(db.String(100), unique=True)
     reset_token_expiry = db.Column(db.DateTime)
+    # Bumped whenever the user's analyses or credits change; keys cached responses
+    data_version = db.Column(db.Integer, default=0)
     
     # Credit system fields
     credits = db.Column(db.Integer, default=5, nullable=False)  # Default 5 free credits
@@ -29,24 +34,19 @@ class User(db.Model):
     credit_transactions = db.relationship('CreditTransaction', backref='user', lazy='dynamic', cascade='all, delete-orphan')
     
     def set_password(self, password):
-        """Hash and set the user's password"""
-        self.password_hash = generate_password_hash(password)
+        """Hash and set the user's password (in the hashing pool; may raise passwords.HashingBusy)"""
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
-        """Check if provided password matches the hash"""
-        if not self.password_hash:
-            return False
+        """Check if provided password matches the hash.
 
-        try:
-            return check_password_hash(self.password_hash, password)
-        except (ValueError, TypeError):
-            # Backward compatibility for legacy records that may store
-            # plaintext passwords or malformed hashes.
-            if self.password_hash == password:
-                # Upgrade to a proper hash; caller commit will persist this.
-                self.password_hash = generate_password_hash(password)
-                return True
-            return False
+        A match on a hash with an outdated method or cost (or a legacy
+        plaintext value) replaces it; the caller's commit persists that.
+        """
+        matches, new_hash = verify_password(self.password_hash, password)
+        if new_hash:
+            self.password_hash = new_hash
+        return matches
     
     def generate_reset_token(self):
         """Generate a password reset token"""
@@ -84,7 +84,7 @@ class CreditTransaction(db.Model):
     __tablename__ = 'credit_transactions'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     transaction_type = db.Column(db.String(20), nullable=False)  # 'purchase', 'deduct', 'refund'
     credits_amount = db.Column(db.Integer, nullable=False)
     credits_before = db.Column(db.Integer, nullable=False)
@@ -95,6 +95,13 @@ class CreditTransaction(db.Model):
     amount_paid = db.Column(db.Float)  # Amount in rupees
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
+    # A user's transactions newest first; also serves lookups by user_id alone.
+    # (user_id, id) finds the entries after a user's credit snapshot
+    __table_args__ = (
+        db.Index('ix_credit_transactions_user_created', user_id, created_at.desc()),
+        db.Index('ix_credit_transactions_user_id_id', user_id, id),
+    )
+    
     def to_dict(self):
         """Convert transaction to dictionary"""
         return {
@@ -111,11 +118,21 @@ class CreditTransaction(db.Model):
         }
 
 
+class CreditSnapshot(db.Model):
+    __tablename__ = 'credit_snapshots'
+
+    # A user's balance after ledger entry ledger_id; later entries are added on top
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    ledger_id = db.Column(db.Integer, nullable=False)
+    balance = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
 class PaymentOrder(db.Model):
     __tablename__ = 'payment_orders'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     order_id = db.Column(db.String(100), unique=True, nullable=False)
     amount = db.Column(db.Float, nullable=False)  # Amount in rupees
     currency = db.Column(db.String(10), default='INR')
@@ -126,6 +143,13 @@ class PaymentOrder(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_payment_orders_user_created', user_id, created_at.desc()),
+        # Only unsettled orders, for reconciliation; small however large the table gets
+        db.Index('ix_payment_orders_pending', id, created_at,
+                 postgresql_where=status == 'created', sqlite_where=status == 'created'),
+    )
+    
     def to_dict(self):
         """Convert order to dictionary"""
         return {
@@ -141,11 +165,37 @@ class PaymentOrder(db.Model):
         }
 
 
+class ApiKey(db.Model):
+    __tablename__ = 'api_keys'
+
+    # Only the SHA-256 of the key is stored; prefix is its first characters, for display
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    name = db.Column(db.String(100), nullable=False)
+    prefix = db.Column(db.String(12), nullable=False)
+    key_hash = db.Column(db.String(64), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime)  # Updated in batches, see apikeys.py
+    request_count = db.Column(db.Integer, default=0, nullable=False)
+    revoked_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        """Convert key to dictionary (never includes the key itself)"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'prefix': self.prefix,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'last_used_at': self.last_used_at.isoformat() if self.last_used_at else None,
+            'request_count': self.request_count
+        }
+
+
 class AnalysisHistory(db.Model):
     __tablename__ = 'analysis_history'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     headline = db.Column(db.Text)
     news_text = db.Column(db.Text, nullable=False)
@@ -153,9 +203,31 @@ class AnalysisHistory(db.Model):
     confidence = db.Column(db.Integer, nullable=False)
     summary = db.Column(db.Text)
     detailed_analysis = db.Column(db.Text)
+    # Legacy JSON copies: red_flags and sources_checked are only set on rows not yet
+    # moved into the child tables; key_claims is still written for the search index
     red_flags = db.Column(db.JSON)
     key_claims = db.Column(db.JSON)
     sources_checked = db.Column(db.JSON)
+    source_url = db.Column(db.String(500), index=True)  # canonical URL for URL submissions
+    
+    # Cold storage: once archived, news_text keeps only the list preview and
+    # detailed_analysis is cleared; the full text lives compressed in archive_blob
+    archived_at = db.Column(db.DateTime, index=True)
+    archive_blob = db.deferred(db.Column(db.LargeBinary))
+    archive_dictionary_id = db.Column(db.Integer, db.ForeignKey('compression_dictionaries.id'))
+    
+    # History pages newest first, ties broken by id; also serves lookups by user_id alone
+    __table_args__ = (
+        db.Index('ix_analysis_history_user_timestamp', user_id, timestamp.desc(), id.desc()),
+    )
+    
+    # Loaded with one extra query per relationship for a whole page of analyses
+    red_flag_rows = db.relationship('AnalysisRedFlag', lazy='selectin', cascade='all, delete-orphan',
+                                    order_by='AnalysisRedFlag.position')
+    claim_rows = db.relationship('AnalysisClaim', lazy='selectin', cascade='all, delete-orphan',
+                                 order_by='AnalysisClaim.position')
+    source_rows = db.relationship('AnalysisSource', lazy='selectin', cascade='all, delete-orphan',
+                                  order_by='AnalysisSource.position')
     
     def to_dict(self):
         """Convert analysis to dictionary"""
@@ -168,7 +240,246 @@ class AnalysisHistory(db.Model):
             'confidence': self.confidence,
             'summary': self.summary,
             'detailed_analysis': self.detailed_analysis,
-            'red_flags': self.red_flags,
-            'key_claims': self.key_claims,
-            'sources_checked': self.sources_checked
-        }
\ No newline at end of file
+            'red_flags': [row.text for row in self.red_flag_rows] or self.red_flags or [],
+            'key_claims': [row.text for row in self.claim_rows] or self.key_claims or [],
+            'sources_checked': [row.to_dict() for row in self.source_rows] or self.sources_checked or [],
+            'source_url': self.source_url,
+            'archived': self.archived_at is not None
+        }
+
+
+
+class Source(db.Model):
+    __tablename__ = 'sources'
+    
+    # Each news source is stored once and referenced by id from analysis_sources
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+    url = db.Column(db.String(255))
+    credibility = db.Column(db.String(20))
+    type = db.Column(db.String(30), index=True)
+
+
+class AnalysisRedFlag(db.Model):
+    __tablename__ = 'analysis_red_flags'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    analysis_id = db.Column(db.Integer, db.ForeignKey('analysis_history.id', ondelete='CASCADE'),
+                            nullable=False, index=True)
+    position = db.Column(db.SmallInteger, nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    # Lowercased, length-capped copy for "which analyses flagged X" lookups
+    text_key = db.Column(db.String(160), nullable=False, index=True)
+
+
+class AnalysisClaim(db.Model):
+    __tablename__ = 'analysis_claims'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    analysis_id = db.Column(db.Integer, db.ForeignKey('analysis_history.id', ondelete='CASCADE'),
+                            nullable=False, index=True)
+    position = db.Column(db.SmallInteger, nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    text_key = db.Column(db.String(160), nullable=False, index=True)
+
+
+class AnalysisSource(db.Model):
+    __tablename__ = 'analysis_sources'
+    
+    analysis_id = db.Column(db.Integer, db.ForeignKey('analysis_history.id', ondelete='CASCADE'),
+                            primary_key=True)
+    source_id = db.Column(db.Integer, db.ForeignKey('sources.id'), primary_key=True, index=True)
+    position = db.Column(db.SmallInteger, nullable=False)
+    checked = db.Column(db.Boolean, default=True)
+    
+    source = db.relationship('Source', lazy='joined')
+    
+    def to_dict(self):
+        """Convert to the sources_checked entry shape"""
+        return {
+            'name': self.source.name,
+            'url': self.source.url,
+            'credibility': self.source.credibility,
+            'checked': self.checked,
+            'type': self.source.type
+        }
+
+class CompressionDictionary(db.Model):
+    __tablename__ = 'compression_dictionaries'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    codec = db.Column(db.String(10), nullable=False)  # zstd, zlib
+    data = db.Column(db.LargeBinary, nullable=False)
+    sample_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class GeminiQuotaWindow(db.Model):
+    __tablename__ = 'gemini_quota_windows'
+    
+    # One row per minute; shared by every worker to enforce RPM/TPM
+    window_start = db.Column(db.DateTime, primary_key=True)
+    request_count = db.Column(db.Integer, default=0, nullable=False)
+    token_count = db.Column(db.Integer, default=0, nullable=False)
+
+
+class GeminiQueueTicket(db.Model):
+    __tablename__ = 'gemini_queue_tickets'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, index=True)
+    priority = db.Column(db.Integer, default=0, nullable=False)
+    user_seq = db.Column(db.Integer, default=0, nullable=False)  # Position within the user's own queue
+    enqueued_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    heartbeat_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+class AnalysisLease(db.Model):
+    __tablename__ = 'analysis_leases'
+    
+    # Normalized article hash; one in-flight Gemini analysis per key across workers
+    key = db.Column(db.String(64), primary_key=True)
+    owner = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(10), default='running', nullable=False)  # running, done, failed
+    result = db.Column(db.JSON)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+
+class PurgeJob(db.Model):
+    __tablename__ = 'purge_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, running, done, failed
+    total = db.Column(db.Integer)
+    deleted = db.Column(db.Integer, default=0, nullable=False)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        """Convert purge job to dictionary"""
+        return {
+            'id': self.id,
+            'status': self.status,
+            'total': self.total,
+            'deleted': self.deleted,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() + 'Z' if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() + 'Z' if self.finished_at else None
+        }
+
+
+class AnalysisCache(db.Model):
+    __tablename__ = 'analysis_cache'
+    
+    # article_hash() of the text, or url_key() of the normalized URL
+    key = db.Column(db.String(255), primary_key=True)
+    result = db.Column(db.JSON, nullable=False)
+    source = db.Column(db.String(20), default='user')  # user, feed
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class FeedSource(db.Model):
+    __tablename__ = 'feed_sources'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(500), unique=True, nullable=False)
+    etag = db.Column(db.String(255))
+    last_modified = db.Column(db.String(100))
+    last_polled_at = db.Column(db.DateTime)
+    last_status = db.Column(db.String(50))
+
+
+class FeedEntry(db.Model):
+    __tablename__ = 'feed_entries'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    feed_id = db.Column(db.Integer, db.ForeignKey('feed_sources.id'), nullable=False, index=True)
+    normalized_url = db.Column(db.String(500), unique=True)
+    content_hash = db.Column(db.String(64), unique=True, nullable=False)
+    title = db.Column(db.Text)
+    news_text = db.Column(db.Text)
+    published_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    analyzed_at = db.Column(db.DateTime, index=True)
+
+
+class DailyRollup(db.Model):
+    __tablename__ = 'daily_rollups'
+    
+    # One row per user per UTC day, maintained as analyses and transactions are written
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    analyses = db.Column(db.Integer, nullable=False, default=0)
+    real_count = db.Column(db.Integer, nullable=False, default=0)
+    fake_count = db.Column(db.Integer, nullable=False, default=0)
+    misleading_count = db.Column(db.Integer, nullable=False, default=0)
+    uncertain_count = db.Column(db.Integer, nullable=False, default=0)
+    confidence_sum = db.Column(db.BigInteger, nullable=False, default=0)
+    credits_spent = db.Column(db.Integer, nullable=False, default=0)
+    credits_added = db.Column(db.Integer, nullable=False, default=0)
+    
+    def to_dict(self):
+        """Convert rollup to dictionary"""
+        return {
+            'date': self.day.isoformat(),
+            'total': self.analyses,
+            'verdicts': {
+                'REAL': self.real_count,
+                'FAKE': self.fake_count,
+                'MISLEADING': self.misleading_count,
+                'UNCERTAIN': self.uncertain_count
+            },
+            'mean_confidence': round(self.confidence_sum / self.analyses, 1) if self.analyses else None,
+            'credits_spent': self.credits_spent,
+            'credits_added': self.credits_added
+        }
+
+
+class TrendBucket(db.Model):
+    __tablename__ = 'trend_buckets'
+    
+    # Space-Saving summary of one dimension (red_flags, claims, categories) for one hour
+    hour = db.Column(db.DateTime, primary_key=True)
+    dimension = db.Column(db.String(20), primary_key=True)
+    counters = db.Column(db.JSON, nullable=False)  # {item: [count, error]}
+    total = db.Column(db.Integer, nullable=False, default=0)
+    analyses = db.Column(db.Integer, nullable=False, default=0)
+
+
+class TrendState(db.Model):
+    __tablename__ = 'trend_state'
+    
+    # Single row: the last analysis_history id folded into the trend buckets
+    id = db.Column(db.Integer, primary_key=True)
+    last_analysis_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class IngestCheckpoint(db.Model):
+    __tablename__ = 'ingest_checkpoints'
+
+    # Progress of one ingest.py input, saved in the same transaction as its rows
+    name = db.Column(db.String(255), primary_key=True)
+    watermark = db.Column(db.Integer, nullable=False, default=0)
+    done_ahead = db.Column(db.JSON, nullable=False, default=list)
+    written = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migrations'
+
+    # One row per migration in migrations/; progress holds backfill cursors while running
+    version = db.Column(db.String(10), primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='running')  # running, applied
+    progress = db.Column(db.JSON)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    applied_at = db.Column(db.DateTime)
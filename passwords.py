@@ -0,0 +1,194 @@
+"""
+Password hashing service
+Hashing is deliberately slow (scrypt takes ~100 ms of CPU and 32 MB), so a
+credential-stuffing burst could otherwise tie up every gunicorn worker and
+starve /api/analyze. Hashes run in a small process pool per worker, behind
+a host-wide admission limit:
+
+- At most PASSWORD_HASH_CONCURRENCY hashes run at once across all workers on
+  the host (slot files held with flock, released even if a worker dies).
+- Up to PASSWORD_HASH_QUEUE_LIMIT more requests wait, for at most
+  PASSWORD_HASH_WAIT seconds, for a slot.
+- Beyond that, hash_password/verify_password raise HashingBusy straight
+  away and the auth routes answer 503 with Retry-After. Logins slow down and
+  shed load while everything else keeps its workers.
+
+verify_password also reports when a stored hash is not in the configured
+PASSWORD_HASH_METHOD (an old algorithm, a lower cost, or a legacy plaintext
+value). The caller then saves the new hash it returns, so users move to the
+current settings as they log in.
+
+Without fcntl (Windows) the limit applies per process instead of per host.
+
+Configuration:
+    PASSWORD_HASH_METHOD        werkzeug method string (default scrypt:32768:8:1)
+    PASSWORD_HASH_CONCURRENCY   Hashes running at once per host (default half the CPUs, at least 1)
+    PASSWORD_HASH_QUEUE_LIMIT   Requests allowed to wait for a slot (default 8)
+    PASSWORD_HASH_WAIT          Seconds a request waits before giving up (default 2)
+    PASSWORD_HASH_PROCESSES     Hashing processes per worker (default 1)
+    PASSWORD_HASH_OFFLOAD       Set to false to hash inline without limits (default true)
+"""
+
+import hmac
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+PASSWORD_HASH_CONCURRENCY = int(os.getenv('PASSWORD_HASH_CONCURRENCY', max(1, (os.cpu_count() or 2) // 2)))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv('PASSWORD_HASH_QUEUE_LIMIT', 8))
+PASSWORD_HASH_WAIT = float(os.getenv('PASSWORD_HASH_WAIT', 2))
+PASSWORD_HASH_PROCESSES = int(os.getenv('PASSWORD_HASH_PROCESSES', 1))
+PASSWORD_HASH_OFFLOAD = os.getenv('PASSWORD_HASH_OFFLOAD', 'true').lower() == 'true'
+PASSWORD_HASH_SLOT_DIR = os.getenv('PASSWORD_HASH_SLOT_DIR',
+                                   os.path.join(tempfile.gettempdir(), 'newsscope-password-slots'))
+
+
+class HashingBusy(Exception):
+    """Too many password hashes in progress; retry after retry_after seconds"""
+
+    def __init__(self, retry_after=1):
+        super().__init__("Password hashing is busy")
+        self.retry_after = retry_after
+
+
+def _full_method(method):
+    """The method string werkzeug writes into hashes, defaults filled in"""
+    if method == 'scrypt':
+        return 'scrypt:32768:8:1'
+    if method in ('pbkdf2', 'pbkdf2:sha256'):
+        return f'pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}'
+    return method
+
+
+TARGET_METHOD = _full_method(PASSWORD_HASH_METHOD)
+
+
+def _hash(password, method):
+    return generate_password_hash(password, method)
+
+
+def _verify(stored_hash, password, method):
+    """(matches, replacement hash or None); runs in a hashing process"""
+    if '$' not in stored_hash:
+        # Legacy records that stored the plaintext password
+        matches = hmac.compare_digest(stored_hash.encode('utf-8'), password.encode('utf-8'))
+        return matches, generate_password_hash(password, method) if matches else None
+    matches = check_password_hash(stored_hash, password)
+    if matches and stored_hash.split('$', 1)[0] != method:
+        return True, generate_password_hash(password, method)
+    return matches, None
+
+
+class _Slots:
+    """N slot files on this host; holding an flock on one is holding a slot"""
+
+    def __init__(self, name, count):
+        self.paths = [os.path.join(PASSWORD_HASH_SLOT_DIR, f'{name}-{index}') for index in range(count)]
+        self.fallback = threading.BoundedSemaphore(count) if fcntl is None else None
+
+    def acquire(self):
+        """A handle for a free slot, or None"""
+        if self.fallback is not None:
+            return True if self.fallback.acquire(blocking=False) else None
+        os.makedirs(PASSWORD_HASH_SLOT_DIR, exist_ok=True)
+        for path in self.paths:
+            fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    def release(self, handle):
+        if self.fallback is not None:
+            self.fallback.release()
+            return
+        fcntl.flock(handle, fcntl.LOCK_UN)
+        os.close(handle)
+
+
+_running = _Slots('hash', PASSWORD_HASH_CONCURRENCY)
+_waiting = _Slots('wait', PASSWORD_HASH_QUEUE_LIMIT)
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    # Created on first use, so each gunicorn worker starts its own after forking
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_PROCESSES)
+        return _executor
+
+
+def _admit():
+    """Wait for a hashing slot, or raise HashingBusy when the queue is full or the wait runs out"""
+    slot = _running.acquire()
+    if slot is not None:
+        return slot
+    place = _waiting.acquire()
+    if place is None:
+        metrics.increment('passwords.rejected')
+        raise HashingBusy()
+    try:
+        started = time.monotonic()
+        while time.monotonic() - started < PASSWORD_HASH_WAIT:
+            time.sleep(0.01)
+            slot = _running.acquire()
+            if slot is not None:
+                metrics.observe('passwords.wait', time.monotonic() - started)
+                return slot
+    finally:
+        _waiting.release(place)
+    metrics.increment('passwords.timed_out')
+    raise HashingBusy()
+
+
+def _run(fn, *args):
+    global _executor
+    if not PASSWORD_HASH_OFFLOAD:
+        return fn(*args)
+    slot = _admit()
+    try:
+        started = time.perf_counter()
+        try:
+            result = _pool().submit(fn, *args).result()
+        except BrokenProcessPool:
+            # A hashing process died (e.g. killed for memory); start a fresh pool next time
+            with _executor_lock:
+                _executor = None
+            raise
+        metrics.observe('passwords.hash', time.perf_counter() - started)
+        return result
+    finally:
+        _running.release(slot)
+
+
+def hash_password(password):
+    """Hash with the configured method; may raise HashingBusy"""
+    return _run(_hash, password, TARGET_METHOD)
+
+
+def verify_password(stored_hash, password):
+    """(matches, new hash to store or None); may raise HashingBusy"""
+    if not stored_hash:
+        return False, None
+    matches, new_hash = _run(_verify, stored_hash, password, TARGET_METHOD)
+    if new_hash:
+        metrics.increment('passwords.rehashed')
+    return matches, new_hash
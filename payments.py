@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Payment settlement for Razorpay orders
+settle_order marks an order paid and posts its credits to the ledger
+(ledger.post) in a single transaction. The order moves to 'paid' with a
+conditional UPDATE ... WHERE status IN ('created', 'failed'), so when the
+client verify call, the webhook and the reconciliation job race, exactly
+one of them settles and the others see the order already paid.
+Repeating a settlement with the same payment_id succeeds without adding
+credits again.
+
+Configuration:
+    RAZORPAY_WEBHOOK_SECRET           Secret for X-Razorpay-Signature on webhooks
+    PAYMENT_RECONCILE_AFTER_MINUTES   Age before a 'created' order is checked (default 10)
+    PAYMENT_ORDER_EXPIRY_HOURS        Age after which an unpaid order is failed (default 24)
+    PAYMENT_RECONCILE_BATCH_SIZE      Orders checked per batch (default 100)
+
+Usage (e.g. from cron):
+    python payments.py reconcile      Settle or fail orders stuck in 'created'
+"""
+
+import argparse
+import hashlib
+import hmac
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+
+import ledger
+import metrics
+from models import db, PaymentOrder, User
+
+RAZORPAY_WEBHOOK_SECRET = os.getenv('RAZORPAY_WEBHOOK_SECRET')
+PAYMENT_RECONCILE_AFTER_MINUTES = int(os.getenv('PAYMENT_RECONCILE_AFTER_MINUTES', 10))
+PAYMENT_ORDER_EXPIRY_HOURS = int(os.getenv('PAYMENT_ORDER_EXPIRY_HOURS', 24))
+PAYMENT_RECONCILE_BATCH_SIZE = int(os.getenv('PAYMENT_RECONCILE_BATCH_SIZE', 100))
+
+SETTLEABLE_STATUSES = ('created', 'failed')
+
+
+class PaymentError(Exception):
+    """The payment can't be applied to the order"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def settle_order(order_id, payment_id, signature=None, user_id=None, source='client'):
+    """Mark the order paid and credit the user in one transaction.
+
+    Returns {'order_id', 'credits_added', 'total_credits', 'already_settled'}.
+    The payment must already be verified by the caller. With user_id set,
+    only that user's order can be settled.
+    """
+    now = datetime.utcnow()
+    conditions = [PaymentOrder.order_id == order_id, PaymentOrder.status.in_(SETTLEABLE_STATUSES)]
+    if user_id is not None:
+        conditions.append(PaymentOrder.user_id == user_id)
+
+    try:
+        order = db.session.execute(
+            update(PaymentOrder)
+            .where(*conditions)
+            .values(status='paid', payment_id=payment_id, payment_signature=signature, updated_at=now)
+            .returning(PaymentOrder.user_id, PaymentOrder.credits_amount, PaymentOrder.amount)
+        ).first()
+
+        if order is None:
+            db.session.rollback()
+            return _settled_result(order_id, payment_id, user_id)
+
+        credits_after = ledger.post(
+            order.user_id, 'purchase', order.credits_amount, f"Purchased {order.credits_amount} credits",
+            payment_id=payment_id, order_id=order_id, amount_paid=float(order.amount)
+        )
+        if credits_after is None:
+            raise PaymentError('User not found.', 404)
+        db.session.commit()
+    except IntegrityError:
+        # ix_payment_orders_payment_id: the payment already settled another order
+        db.session.rollback()
+        raise PaymentError('Payment already used for another order.', 409)
+    except Exception:
+        db.session.rollback()
+        raise
+
+    metrics.increment(f'payments.settled.{source}')
+    print(f"[Payments] Settled {order_id} ({payment_id}) via {source}: +{order.credits_amount} credits")
+    return {
+        'order_id': order_id,
+        'credits_added': order.credits_amount,
+        'total_credits': credits_after,
+        'already_settled': False
+    }
+
+
+def _settled_result(order_id, payment_id, user_id):
+    """Result for an order the conditional update didn't match"""
+    query = PaymentOrder.query.filter_by(order_id=order_id)
+    if user_id is not None:
+        query = query.filter_by(user_id=user_id)
+    order = query.first()
+    if order is None:
+        raise PaymentError('Order not found.', 404)
+    if order.status != 'paid' or order.payment_id != payment_id:
+        raise PaymentError('Order already processed with a different payment.', 409)
+
+    # Same payment settled before: succeed again without adding credits
+    metrics.increment('payments.duplicate')
+    user = db.session.get(User, order.user_id)
+    return {
+        'order_id': order_id,
+        'credits_added': order.credits_amount,
+        'total_credits': user.credits if user else None,
+        'already_settled': True
+    }
+
+
+def verify_webhook(body, signature, secret=None):
+    """Check X-Razorpay-Signature (HMAC-SHA256 of the raw body)"""
+    secret = secret or RAZORPAY_WEBHOOK_SECRET
+    if not secret or not signature:
+        return False
+    expected = hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def webhook_payment(event):
+    """(order_id, payment_id) for events that mean an order is paid, else None"""
+    if event.get('event') not in ('payment.captured', 'order.paid'):
+        return None
+    payload = event.get('payload') or {}
+    payment = (payload.get('payment') or {}).get('entity') or {}
+    order = (payload.get('order') or {}).get('entity') or {}
+    order_id = payment.get('order_id') or order.get('id')
+    if not order_id or not payment.get('id'):
+        return None
+    return order_id, payment['id']
+
+
+def _captured_payment(client, order_id):
+    """Id of a captured payment for the order according to Razorpay, if any"""
+    for payment in client.order.payments(order_id).get('items', []):
+        if payment.get('status') == 'captured':
+            return payment['id']
+    return None
+
+
+def reconcile(client, batch_size=PAYMENT_RECONCILE_BATCH_SIZE):
+    """Settle 'created' orders that Razorpay reports paid and fail expired ones.
+
+    Returns (checked, settled, failed).
+    """
+    now = datetime.utcnow()
+    settle_before = now - timedelta(minutes=PAYMENT_RECONCILE_AFTER_MINUTES)
+    expire_before = now - timedelta(hours=PAYMENT_ORDER_EXPIRY_HOURS)
+    checked = settled = failed = 0
+    last_id = 0
+
+    while True:
+        orders = db.session.execute(
+            select(PaymentOrder.id, PaymentOrder.order_id, PaymentOrder.created_at)
+            .where(PaymentOrder.status == 'created', PaymentOrder.created_at < settle_before,
+                   PaymentOrder.id > last_id)
+            .order_by(PaymentOrder.id)
+            .limit(batch_size)
+        ).all()
+        db.session.rollback()
+        if not orders:
+            break
+        last_id = orders[-1].id
+
+        for order in orders:
+            checked += 1
+            try:
+                payment_id = _captured_payment(client, order.order_id)
+            except Exception as e:
+                print(f"[Payments] Could not check {order.order_id}: {e}")
+                continue
+
+            if payment_id:
+                try:
+                    if not settle_order(order.order_id, payment_id, source='reconcile')['already_settled']:
+                        settled += 1
+                except PaymentError as e:
+                    print(f"[Payments] {order.order_id}: {e}")
+            elif order.created_at < expire_before:
+                result = db.session.execute(
+                    update(PaymentOrder)
+                    .where(PaymentOrder.id == order.id, PaymentOrder.status == 'created')
+                    .values(status='failed', updated_at=datetime.utcnow())
+                )
+                db.session.commit()
+                failed += result.rowcount
+
+    metrics.increment('payments.reconciled', settled)
+    return checked, settled, failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Payment settlement maintenance")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    reconcile_parser = subparsers.add_parser('reconcile', help="Settle or fail orders stuck in 'created'")
+    reconcile_parser.add_argument('--batch-size', type=int, default=PAYMENT_RECONCILE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    from NewsScope import app, get_razorpay_client
+
+    razorpay_client = get_razorpay_client()
+    if not razorpay_client:
+        parser.exit(1, "Razorpay is not configured (RAZORPAY_KEY_ID / RAZORPAY_KEY_SECRET)\n")
+
+    with app.app_context():
+        checked, settled, failed = reconcile(razorpay_client, args.batch_size)
+        print("\n📊 Reconciliation Summary:")
+        print(f"   • Orders checked: {checked}")
+        print(f"   • Settled: {settled}")
+        print(f"   • Failed (expired): {failed}")
@@ -0,0 +1,161 @@
+"""
+Database connection pool settings
+Every gunicorn worker has its own pool per database, so the pool sizes are
+derived from a connection budget for the whole service rather than set per
+process. Each worker gets DB_CONNECTION_BUDGET / WEB_CONCURRENCY
+connections: half are kept open (pool_size) and the rest are overflow
+opened under load. With all workers busy the service stays within the
+budget. DB_POOL_SIZE and DB_MAX_OVERFLOW still override the derived numbers.
+
+Connections are not pinged on checkout. A connection that turns out to be
+dead raises once, and SQLAlchemy then invalidates it and every older pooled
+connection, so the next checkout reconnects. Connections are also recycled
+after DB_POOL_RECYCLE seconds, which should be below the server's (or a
+proxy's) idle timeout.
+
+With DB_PGBOUNCER=true (transaction pooling through PgBouncer or a similar
+proxy) the app keeps no pool of its own (NullPool) and server-side prepared
+statements are disabled, since consecutive transactions may run on
+different server connections. Session state does not survive between
+transactions in that mode. Run migrate.py (advisory lock, SET lock_timeout)
+against a direct or session-pooled URL.
+
+Time spent waiting for a connection is recorded as db.pool_wait.<name>, and
+checkouts that time out as db.pool_timeout.<name>.
+
+Configuration:
+    DB_CONNECTION_BUDGET        Connections the whole service may open to the primary (default 20)
+    DB_REPLICA_CONNECTION_BUDGET Same, per replica (default DB_CONNECTION_BUDGET)
+    WEB_CONCURRENCY             Gunicorn workers, read by gunicorn itself as well (default 1)
+    DB_POOL_SIZE / DB_MAX_OVERFLOW                  Explicit primary pool sizes
+    DB_REPLICA_POOL_SIZE / DB_REPLICA_MAX_OVERFLOW  Explicit pool sizes per replica
+    DB_POOL_TIMEOUT             Seconds to wait for a free connection (default 30)
+    DB_POOL_RECYCLE             Seconds before a connection is replaced (default 1800)
+    DB_POOL_PRE_PING            Ping on every checkout instead (default false)
+    DB_PGBOUNCER                Transaction-pooling mode (default false)
+    DB_SSLMODE                  libpq sslmode for Postgres connections (default require)
+"""
+
+import os
+import time
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import NullPool, QueuePool
+
+import metrics
+
+WEB_CONCURRENCY = max(1, int(os.getenv('WEB_CONCURRENCY', 1)))
+DB_CONNECTION_BUDGET = int(os.getenv('DB_CONNECTION_BUDGET', 20))
+DB_REPLICA_CONNECTION_BUDGET = int(os.getenv('DB_REPLICA_CONNECTION_BUDGET', DB_CONNECTION_BUDGET))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'false').lower() == 'true'
+DB_PGBOUNCER = os.getenv('DB_PGBOUNCER', 'false').lower() == 'true'
+# Managed Postgres needs TLS; a throwaway local server for tests usually has none
+DB_SSLMODE = os.getenv('DB_SSLMODE', 'require')
+
+
+def _env_int(name):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+class _TimedCheckout:
+    """Records how long each checkout waited for a connection (including connecting)"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeout:
+            metrics.increment(f'db.pool_timeout.{self.logging_name}')
+            raise
+        finally:
+            metrics.observe(f'db.pool_wait.{self.logging_name}', time.perf_counter() - started)
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class TimedNullPool(_TimedCheckout, NullPool):
+    pass
+
+
+def pool_sizes(budget, workers=WEB_CONCURRENCY, pool_size=None, max_overflow=None):
+    """(pool_size, max_overflow) per worker for a service-wide connection budget"""
+    per_worker = max(budget // workers, 1)
+    derived_size = max(per_worker // 2, 1)
+    return (
+        pool_size if pool_size is not None else derived_size,
+        max_overflow if max_overflow is not None else per_worker - derived_size
+    )
+
+
+def engine_options(url, name='primary'):
+    """SQLALCHEMY_ENGINE_OPTIONS for the primary or a replica (name is replica_N)"""
+    if (url or '').startswith('sqlite'):
+        # Local development and benchmarks: the Postgres-only options don't apply
+        return {}
+
+    options = {
+        'connect_args': {
+            'connect_timeout': 10,
+            'sslmode': DB_SSLMODE,
+        },
+        'pool_logging_name': name,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+    }
+    if DB_PGBOUNCER:
+        options['poolclass'] = TimedNullPool
+        if make_url(url).get_driver_name() == 'psycopg':
+            # psycopg 3 prepares repeated statements server-side; psycopg2 never does
+            options['connect_args']['prepare_threshold'] = None
+        return options
+
+    if name == 'primary':
+        budget, prefix = DB_CONNECTION_BUDGET, 'DB'
+    else:
+        budget, prefix = DB_REPLICA_CONNECTION_BUDGET, 'DB_REPLICA'
+    pool_size, max_overflow = pool_sizes(
+        budget, pool_size=_env_int(f'{prefix}_POOL_SIZE'), max_overflow=_env_int(f'{prefix}_MAX_OVERFLOW')
+    )
+    options.update({
+        'poolclass': TimedQueuePool,
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+    })
+    return options
+
+
+def describe(options):
+    """One line for the startup log"""
+    if not options:
+        return "default SQLite pool"
+    if options['poolclass'] is TimedNullPool:
+        return "no local pool (DB_PGBOUNCER)"
+    workers = WEB_CONCURRENCY
+    per_worker = options['pool_size'] + options['max_overflow']
+    line = (f"{options['pool_size']} + {options['max_overflow']} overflow per worker, "
+            f"{per_worker * workers} max across {workers} workers")
+    if per_worker * workers > DB_CONNECTION_BUDGET:
+        line += f" (over DB_CONNECTION_BUDGET={DB_CONNECTION_BUDGET})"
+    return line
+
+
+def status(engines):
+    """{name: pool counters} for each engine with a queue pool"""
+    pools = {}
+    for key, engine in engines.items():
+        pool = engine.pool
+        if isinstance(pool, QueuePool):
+            pools[key or 'primary'] = {
+                'size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'idle': pool.checkedin(),
+                'overflow': max(pool.overflow(), 0)
+            }
+    return pools
@@ -0,0 +1,191 @@
+"""
+Read-replica routing
+Routes decorated with @read_replica send their SELECTs to a replica from
+DATABASE_REPLICA_URLS. Everything else uses the primary:
+- INSERT/UPDATE/DELETE, flushes, SELECT ... FOR UPDATE and raw SQL
+- any read in a request after that request has written, so it sees its own writes
+- a user's requests for REPLICA_MAX_LAG_SECONDS after they wrote, whether
+  they sign in with a session or an API key, so a reload after an analysis
+  or a payment isn't stale. Session users carry this in their session, so
+  it holds on every worker; API key clients carry no session, so each
+  worker remembers its own recent writers (at most REPLICA_STICKY_USERS).
+
+Replicas are health-checked at most every REPLICA_CHECK_INTERVAL seconds,
+on the request that needs one. A replica that is unreachable or lags the
+primary by more than REPLICA_MAX_LAG_SECONDS is skipped until its next
+check. When no replica qualifies, reads fall back to the primary. Lag is
+measured on Postgres; other databases (e.g. two SQLite files standing in for
+primary and replica locally) only get the connectivity check.
+
+Configuration:
+    DATABASE_REPLICA_URLS       Comma-separated replica URLs (default: none, everything on the primary)
+    REPLICA_MAX_LAG_SECONDS     Replicas further behind are skipped (default 5)
+    REPLICA_CHECK_INTERVAL      Seconds between health checks of a replica (default 10)
+"""
+
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import g, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql import Select
+
+import metrics
+import pools
+
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', 5))
+REPLICA_CHECK_INTERVAL = float(os.getenv('REPLICA_CHECK_INTERVAL', 10))
+REPLICA_STICKY_USERS = 10000
+
+# Zero when caught up: an idle primary makes the last replay timestamp look old
+_PG_LAG = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def binds(urls=DATABASE_REPLICA_URLS):
+    """SQLALCHEMY_BINDS entries for the replicas (pool sizes from pools.py)"""
+    return {
+        f'replica_{index}': {'url': url, **pools.engine_options(url, f'replica_{index}')}
+        for index, url in enumerate(urls)
+    }
+
+
+class _Replica:
+    __slots__ = ('key', 'healthy', 'lag', 'checked_at', 'lock')
+
+    def __init__(self, key):
+        self.key = key
+        self.healthy = True
+        self.lag = None
+        self.checked_at = None
+        self.lock = threading.Lock()
+
+
+_replicas = []
+_next = itertools.count()
+_primary_until = OrderedDict()  # user_id -> time until which their reads use the primary
+_primary_until_lock = threading.Lock()
+
+
+def _principal():
+    # The API key's owner (set by login_required) or the session user
+    return g.get('user_id') or session.get('user_id')
+
+
+def _recently_wrote():
+    until = session.get('db_primary_until') or 0
+    user_id = _principal()
+    if user_id:
+        until = max(until, _primary_until.get(user_id, 0))
+    return until >= time.time()
+
+
+def _check(replica, engine):
+    problem = None
+    try:
+        with engine.connect() as conn:
+            if engine.dialect.name == 'postgresql':
+                replica.lag = float(conn.exec_driver_sql(_PG_LAG).scalar() or 0)
+            else:
+                conn.exec_driver_sql('SELECT 1')
+                replica.lag = 0.0
+        if replica.lag > REPLICA_MAX_LAG_SECONDS:
+            problem = f"{replica.lag:.1f}s behind"
+    except Exception as e:
+        problem = f"unavailable: {e}"
+    replica.checked_at = time.monotonic()
+    # Log and count transitions only, not every check of a replica that stays down
+    if (problem is None) != replica.healthy:
+        replica.healthy = problem is None
+        metrics.increment('db.replica_up' if replica.healthy else 'db.replica_down')
+        print(f"[Replicas] {replica.key} {'back' if replica.healthy else problem + ', reading from the primary'}")
+
+
+def _pick(engines):
+    """A healthy replica engine, or None"""
+    start = next(_next)
+    for offset in range(len(_replicas)):
+        replica = _replicas[(start + offset) % len(_replicas)]
+        due = replica.checked_at is None or time.monotonic() - replica.checked_at >= REPLICA_CHECK_INTERVAL
+        # One request per worker runs a due check; the rest use the last result
+        if due and replica.lock.acquire(blocking=False):
+            try:
+                _check(replica, engines[replica.key])
+            finally:
+                replica.lock.release()
+        if replica.healthy:
+            return engines[replica.key]
+    return None
+
+
+def status():
+    """[{'replica', 'healthy', 'lag_seconds'}] as of each replica's last check"""
+    return [{'replica': replica.key, 'healthy': replica.healthy, 'lag_seconds': replica.lag}
+            for replica in _replicas]
+
+
+class RoutingSession(Session):
+    """Session that sends plain SELECTs in @read_replica requests to a replica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and _replicas and has_request_context():
+            if self._flushing or not isinstance(clause, Select) or clause._for_update_arg is not None:
+                g.db_wrote = True
+            elif g.get('db_read_replica') and not g.get('db_wrote') and not _recently_wrote():
+                if 'db_replica' not in g:
+                    g.db_replica = _pick(self._db.engines)
+                    metrics.increment('db.replica_reads' if g.db_replica is not None else 'db.replica_fallback')
+                if g.db_replica is not None:
+                    return g.db_replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_replica(f):
+    """Let the view's reads go to a replica (see module docstring for when they don't)"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        # Whether the user wrote recently is checked at the first read, once
+        # login_required has identified an API key's owner
+        g.db_read_replica = True
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def init_app(app, db):
+    """Register the replicas from SQLALCHEMY_BINDS; call after db.init_app"""
+    _replicas[:] = [_Replica(key) for key in app.config.get('SQLALCHEMY_BINDS', {}) if key.startswith('replica_')]
+    if not _replicas:
+        return
+
+    with app.app_context():
+        for replica in _replicas:
+            @event.listens_for(db.engines[replica.key], 'handle_error')
+            def _disconnected(context, replica=replica):
+                # Stop routing to a replica that dropped a connection until it checks healthy again
+                if context.is_disconnect:
+                    replica.healthy = False
+                    replica.checked_at = time.monotonic()
+
+    @app.after_request
+    def _stick_to_primary(response):
+        user_id = _principal()
+        if g.get('db_wrote') and user_id:
+            until = time.time() + REPLICA_MAX_LAG_SECONDS
+            with _primary_until_lock:
+                _primary_until[user_id] = until
+                _primary_until.move_to_end(user_id)
+                while len(_primary_until) > REPLICA_STICKY_USERS:
+                    _primary_until.popitem(last=False)
+            if 'user_id' in session:
+                session['db_primary_until'] = until
+        return response
@@ -0,0 +1,81 @@
+"""
+Request body size limits
+Every route accepts bodies up to MAX_CONTENT_LENGTH; views decorated with
+@max_body(n) get their own limit instead. The limit is enforced before the
+view runs, so an oversized body never reaches request.get_json():
+- a Content-Length over the limit is answered 413 without reading the body
+- a chunked body (no Content-Length) is read up to the limit and answered
+  413 as soon as it goes past it
+
+Configuration:
+    MAX_CONTENT_LENGTH          Default limit in bytes (default 1 MB)
+    ANALYZE_MAX_CONTENT_LENGTH  Limit for /api/analyze (default 256 KB)
+    AUTH_MAX_CONTENT_LENGTH     Limit for the sign-in and account routes (default 16 KB)
+"""
+
+import io
+import os
+
+from flask import current_app, has_app_context, request
+from flask.wrappers import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+import metrics
+
+MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 1024 * 1024))
+ANALYZE_MAX_CONTENT_LENGTH = int(os.getenv('ANALYZE_MAX_CONTENT_LENGTH', 256 * 1024))
+AUTH_MAX_CONTENT_LENGTH = int(os.getenv('AUTH_MAX_CONTENT_LENGTH', 16 * 1024))
+
+
+def max_body(limit):
+    """Decorator setting the largest request body a view accepts, in bytes"""
+    def decorator(f):
+        # functools.wraps copies this onto the decorators stacked above
+        f.max_content_length = limit
+        return f
+    return decorator
+
+
+class LimitedRequest(Request):
+    """Request whose max_content_length comes from the matched view, if it sets one"""
+
+    @property
+    def max_content_length(self):
+        if has_app_context() and self.endpoint:
+            view = current_app.view_functions.get(self.endpoint)
+            limit = getattr(view, 'max_content_length', None)
+            if limit is not None:
+                return limit
+        return super().max_content_length
+
+
+def _enforce_limit():
+    limit = request.max_content_length
+    if limit is None or request.method in ('GET', 'HEAD', 'OPTIONS'):
+        return
+    if request.content_length is not None:
+        too_large = request.content_length > limit
+    elif 'wsgi.input_terminated' in request.environ:
+        # Chunked: read at most one byte past the limit (werkzeug's own limit
+        # would silently truncate), then hand the view the buffered body
+        stream = request.environ['wsgi.input']
+        chunks, size = [], 0
+        while size <= limit:
+            chunk = stream.read(min(64 * 1024, limit + 1 - size))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+        too_large = size > limit
+        request.environ['wsgi.input'] = io.BytesIO(b''.join(chunks))
+    else:
+        return
+    if too_large:
+        metrics.increment('requests.too_large')
+        raise RequestEntityTooLarge()
+
+
+def init_app(app):
+    app.request_class = LimitedRequest
+    app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+    app.before_request(_enforce_limit)
@@ -0,0 +1,232 @@
+"""
+Pre-serialized response cache for read-mostly GET endpoints
+Responses are stored as encoded bytes with a strong ETag, keyed by
+(route and query, user, user's data version). A request whose If-None-Match
+matches is answered 304 before the view runs.
+
+Per-user data versions live in users.data_version. Writes that change what a
+user sees call bump(), which increments the column in the writer's
+transaction. Once that commits, the local copy of the version is bumped too,
+so this worker stops serving the old entries at once. Other workers reread
+the version after RESPONSE_CACHE_VERSION_TTL seconds. Until then a worker
+answers from memory without any database access. Views that show a balance
+use fresh_version=True instead: they read the version on every request (one
+primary-key lookup), so a purchase or deduction handled by another worker
+shows up at once.
+
+Per-user ETags are derived from the cache key, so any worker can answer 304
+without having rendered the response itself.
+
+Entries also keep their compressed bodies (see compression.py), made the
+first time a client asks for that encoding.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from functools import wraps
+
+from flask import Response, make_response, request
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session as SASession
+
+import compression
+import metrics
+from auth import current_user_id
+from models import db, User
+
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+RESPONSE_CACHE_VERSION_TTL = float(os.getenv('RESPONSE_CACHE_VERSION_TTL', 5))
+
+
+class _LRU:
+    """Byte-bounded LRU of key -> (etag, body, mimetype, {encoding: compressed body})"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _size(entry):
+        return len(entry[1]) + sum(len(data) for data in entry[3].values())
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= self._size(old)
+            self.entries[key] = entry
+            self.size += self._size(entry)
+            self._evict()
+
+    def add_encoding(self, key, encoding, data):
+        """Keep a compressed copy of a cached body"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and encoding not in entry[3]:
+                entry[3][encoding] = data
+                self.size += len(data)
+                self._evict()
+
+    def _evict(self):
+        while self.size > self.max_bytes and self.entries:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= self._size(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+_responses = _LRU(RESPONSE_CACHE_MAX_BYTES)
+_versions = {}  # user_id -> (version, read_at)
+_versions_lock = threading.Lock()
+
+
+def user_version(user_id, fresh=False):
+    """The user's data version, reread from the database at most every VERSION_TTL seconds (or now, if fresh)"""
+    now = time.monotonic()
+    with _versions_lock:
+        cached = _versions.get(user_id)
+    if not fresh and cached is not None and now - cached[1] < RESPONSE_CACHE_VERSION_TTL:
+        return cached[0]
+    version = db.session.execute(select(User.data_version).where(User.id == user_id)).scalar() or 0
+    with _versions_lock:
+        _versions[user_id] = (version, now)
+    return version
+
+
+def next_version():
+    """users.data_version value for a caller that already UPDATEs the user's row (then call bumped())"""
+    return db.func.coalesce(User.data_version, 0) + 1
+
+
+def bumped(*user_ids):
+    """Forget the users' local versions once the current transaction commits"""
+    db.session.info.setdefault('response_cache_bumped', set()).update(user_ids)
+
+
+def bump(*user_ids):
+    """Invalidate the users' cached responses once the current transaction commits"""
+    user_ids = [user_id for user_id in set(user_ids) if user_id]
+    if not user_ids:
+        return
+    db.session.execute(update(User).where(User.id.in_(user_ids)).values(data_version=next_version()))
+    bumped(*user_ids)
+
+
+def bump_all():
+    """Invalidate every user's cached responses (bulk maintenance jobs)"""
+    db.session.execute(update(User).values(data_version=db.func.coalesce(User.data_version, 0) + 1))
+    db.session.info['response_cache_bump_all'] = True
+
+
+@event.listens_for(SASession, 'after_commit')
+def _apply_bumps(db_session):
+    # Forget local versions only after commit, so a concurrent request can't
+    # cache pre-commit data under the new version
+    bumped = db_session.info.pop('response_cache_bumped', None)
+    bump_all_pending = db_session.info.pop('response_cache_bump_all', False)
+    with _versions_lock:
+        if bump_all_pending:
+            _versions.clear()
+        elif bumped:
+            for user_id in bumped:
+                _versions.pop(user_id, None)
+
+
+@event.listens_for(SASession, 'after_rollback')
+def _discard_bumps(db_session):
+    db_session.info.pop('response_cache_bumped', None)
+    db_session.info.pop('response_cache_bump_all', None)
+
+
+def _etag(*parts):
+    return hashlib.sha256('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:32]
+
+
+def cached_response(per_user=False, daily=False, fresh_version=False):
+    """Serve a GET view from pre-encoded bytes with ETag/304 support.
+
+    per_user views are keyed by the signed-in user and their data version;
+    with fresh_version that version is read on every request rather than
+    trusted for VERSION_TTL. daily views also roll over at UTC midnight.
+    Only 200 responses are cached.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not RESPONSE_CACHE_ENABLED or request.method != 'GET':
+                return f(*args, **kwargs)
+
+            user_id = current_user_id() if per_user else None
+            if per_user and user_id is None:
+                return f(*args, **kwargs)
+
+            parts = [request.full_path]
+            if per_user:
+                parts += [user_id, user_version(user_id, fresh=fresh_version)]
+            if daily:
+                parts.append(datetime.utcnow().date().isoformat())
+            key = _etag(*parts)
+
+            entry = _responses.get(key)
+            # Per-user ETags follow from the key; shared views hash their content
+            etag = key if per_user else (entry[0] if entry else None)
+            if etag and request.if_none_match.contains_weak(etag):
+                metrics.increment('response_cache.not_modified')
+                response = Response(status=304)
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'private, no-cache' if per_user else 'no-cache'
+                return response
+
+            if entry is not None:
+                metrics.increment('response_cache.hit')
+                response = Response(entry[1], mimetype=entry[2])
+            else:
+                metrics.increment('response_cache.miss')
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200 or response.direct_passthrough:
+                    return response
+                body = response.get_data()
+                entry = (etag or hashlib.sha256(body).hexdigest()[:32], body, response.mimetype, {})
+                _responses.put(key, entry)
+
+            if compression.compressible(entry[2]) and len(entry[1]) >= compression.COMPRESS_MIN_SIZE:
+                response.vary.add('Accept-Encoding')
+                encoding = compression.negotiate(request.accept_encodings)
+                if encoding:
+                    # Compressed once per entry and encoding, then served as stored
+                    encoded = entry[3].get(encoding)
+                    if encoded is None:
+                        encoded = compression.compress(entry[1], encoding, cached=True)
+                        _responses.add_encoding(key, encoding, encoded)
+                    response.set_data(encoded)
+                    response.headers['Content-Encoding'] = encoding
+
+            response.set_etag(entry[0], weak='Content-Encoding' in response.headers)
+            response.headers['Cache-Control'] = 'private, no-cache' if per_user else 'no-cache'
+            return response
+        return decorated_function
+    return decorator
+
+
+def clear():
+    """Drop all cached responses and versions in this worker"""
+    _responses.clear()
+    with _versions_lock:
+        _versions.clear()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Retention and bulk purge for NewsScope
+Deletes go through delete_in_batches, which removes rows in bounded chunks,
+commits after every chunk and can pause between chunks. Each transaction
+stays short and holds few locks, even for users with a very large history.
+
+Retention policies are set per table with environment variables giving the
+number of days to keep (0 keeps rows forever):
+    RETENTION_ANALYSIS_DAYS        analysis_history (by timestamp)
+    RETENTION_TRANSACTIONS_DAYS    credit_transactions (by created_at)
+    RETENTION_PURGE_JOB_DAYS       finished purge_jobs (by finished_at, default 7)
+    RETENTION_FEED_DAYS            feed_entries (by created_at, default 30)
+
+Usage (e.g. from cron):
+    python retention.py run [--dry-run]   Apply the retention policies
+    python retention.py jobs              Resume interrupted "delete all" jobs
+"""
+
+import argparse
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select, update
+
+import ledger
+import response_cache
+import rollups
+from models import (db, AnalysisHistory, AnalysisRedFlag, AnalysisClaim, AnalysisSource, CreditTransaction,
+                    PurgeJob, FeedEntry)
+
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', 1000))
+RETENTION_PAUSE = float(os.getenv('RETENTION_PAUSE', 0.05))
+
+RETENTION_POLICIES = {
+    'analysis_history': {
+        'model': AnalysisHistory,
+        'column': AnalysisHistory.timestamp,
+        'days': int(os.getenv('RETENTION_ANALYSIS_DAYS', 0))
+    },
+    'credit_transactions': {
+        'model': CreditTransaction,
+        'column': CreditTransaction.created_at,
+        'days': int(os.getenv('RETENTION_TRANSACTIONS_DAYS', 0)),
+        # Balances are derived from snapshots plus later entries, so snapshot first
+        'prepare': ledger.snapshot
+    },
+    'purge_jobs': {
+        'model': PurgeJob,
+        'column': PurgeJob.finished_at,
+        'days': int(os.getenv('RETENTION_PURGE_JOB_DAYS', 7))
+    },
+    'feed_entries': {
+        'model': FeedEntry,
+        'column': FeedEntry.created_at,
+        'days': int(os.getenv('RETENTION_FEED_DAYS', 30))
+    }
+}
+
+# Child rows removed with their parents (SQLite doesn't enforce ON DELETE CASCADE)
+DEPENDENTS = {
+    AnalysisHistory: [
+        (AnalysisRedFlag, AnalysisRedFlag.analysis_id),
+        (AnalysisClaim, AnalysisClaim.analysis_id),
+        (AnalysisSource, AnalysisSource.analysis_id)
+    ]
+}
+
+# Running jobs that haven't reported progress for this long are considered dead
+STALE_JOB_AFTER = timedelta(minutes=5)
+
+
+def delete_in_batches(model, *criteria, batch_size=RETENTION_BATCH_SIZE, pause=RETENTION_PAUSE,
+                      on_progress=None):
+    """Delete rows matching criteria in chunks of batch_size; returns rows deleted"""
+    deleted = 0
+    while True:
+        ids = db.session.execute(
+            select(model.id).where(*criteria).order_by(model.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+
+        for dependent, column in DEPENDENTS.get(model, ()):
+            db.session.execute(delete(dependent).where(column.in_(ids)))
+        db.session.execute(delete(model).where(model.id.in_(ids)))
+        db.session.commit()
+        deleted += len(ids)
+
+        if on_progress:
+            on_progress(deleted)
+        if len(ids) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return deleted
+
+
+def apply_policies(dry_run=False, batch_size=RETENTION_BATCH_SIZE, pause=RETENTION_PAUSE):
+    """Delete rows older than each table's retention period"""
+    results = {}
+    for name, policy in RETENTION_POLICIES.items():
+        if policy['days'] <= 0:
+            continue
+
+        cutoff = datetime.utcnow() - timedelta(days=policy['days'])
+        criterion = policy['column'] < cutoff
+        if dry_run:
+            results[name] = policy['model'].query.filter(criterion).count()
+        else:
+            if policy.get('prepare'):
+                policy['prepare']()
+            results[name] = delete_in_batches(policy['model'], criterion, batch_size=batch_size, pause=pause)
+        if results[name] and not dry_run:
+            response_cache.bump_all()
+            db.session.commit()
+        print(f"  {name}: {results[name]} rows older than {policy['days']} days"
+              f"{' would be' if dry_run else ''} deleted")
+    return results
+
+
+def _update_job(job_id, **values):
+    values['updated_at'] = datetime.utcnow()
+    db.session.execute(update(PurgeJob).where(PurgeJob.id == job_id).values(**values))
+    db.session.commit()
+
+
+def run_purge_job(job_id):
+    """Delete all analyses for a purge job's user, recording progress on the job"""
+    job = db.session.get(PurgeJob, job_id)
+    if job is None or job.status == 'done':
+        return
+
+    user_id = job.user_id
+    try:
+        total = AnalysisHistory.query.filter_by(user_id=user_id).count()
+        # A resumed job keeps counting from what it deleted before
+        already_deleted = job.deleted or 0
+        _update_job(job_id, status='running', total=total + already_deleted)
+
+        delete_in_batches(
+            AnalysisHistory,
+            AnalysisHistory.user_id == user_id,
+            on_progress=lambda deleted: _update_job(job_id, deleted=already_deleted + deleted)
+        )
+        response_cache.bump(user_id)
+        rollups.rebuild(user_id)
+        _update_job(job_id, status='done', finished_at=datetime.utcnow())
+    except Exception as e:
+        print(f"Purge job {job_id} failed: {str(e)}")
+        db.session.rollback()
+        _update_job(job_id, status='failed', error=str(e), finished_at=datetime.utcnow())
+
+
+def start_user_purge(app, user_id):
+    """Queue deletion of a user's whole history and run it in the background"""
+    active = PurgeJob.query.filter(
+        PurgeJob.user_id == user_id,
+        PurgeJob.status.in_(['pending', 'running']),
+        PurgeJob.updated_at >= datetime.utcnow() - STALE_JOB_AFTER
+    ).first()
+    if active:
+        return active
+
+    job = PurgeJob(user_id=user_id, status='pending')
+    db.session.add(job)
+    db.session.commit()
+
+    def worker(job_id):
+        with app.app_context():
+            run_purge_job(job_id)
+
+    threading.Thread(target=worker, args=(job.id,), daemon=True).start()
+    return job
+
+
+def resume_jobs():
+    """Run jobs left pending or interrupted mid-way by a worker restart"""
+    stale_before = datetime.utcnow() - STALE_JOB_AFTER
+    jobs = PurgeJob.query.filter(
+        PurgeJob.status.in_(['pending', 'running']),
+        PurgeJob.updated_at < stale_before
+    ).order_by(PurgeJob.id).all()
+    for job in jobs:
+        print(f"  resuming purge job {job.id} for user {job.user_id}")
+        run_purge_job(job.id)
+    return len(jobs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="NewsScope retention and purge")
+    parser.add_argument('command', choices=['run', 'jobs'])
+    parser.add_argument('--dry-run', action='store_true', help='Only count rows that would be deleted')
+    parser.add_argument('--batch-size', type=int, default=RETENTION_BATCH_SIZE)
+    parser.add_argument('--pause', type=float, default=RETENTION_PAUSE, help='Seconds to sleep between batches')
+    args = parser.parse_args()
+
+    from NewsScope import app
+
+    with app.app_context():
+        if args.command == 'run':
+            print("🔄 Applying retention policies...")
+            apply_policies(args.dry_run, args.batch_size, args.pause)
+        else:
+            print(f"✅ Resumed {resume_jobs()} purge jobs")
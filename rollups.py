@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Per-user daily rollups for dashboard charts
+Every analysis and credit transaction adds its counts to the user's
+daily_rollups row for that UTC day through a single upsert, inside the same
+transaction as the write itself. Time-series reads then touch one row per day
+instead of scanning the user's history.
+
+Usage:
+    python rollups.py rebuild [--user-id N]   Recompute rollups from history (backfill)
+"""
+
+import argparse
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from sqlalchemy import case, delete, func, select, update
+
+import response_cache
+from models import db, AnalysisHistory, CreditTransaction, DailyRollup
+
+MAX_RANGE_DAYS = 365
+UPSERT_BATCH_SIZE = 1000
+
+_VERDICT_COLUMNS = {
+    'REAL': 'real_count',
+    'FAKE': 'fake_count',
+    'MISLEADING': 'misleading_count',
+    'UNCERTAIN': 'uncertain_count'
+}
+COUNTER_COLUMNS = ('analyses', 'real_count', 'fake_count', 'misleading_count', 'uncertain_count',
+                   'confidence_sum', 'credits_spent', 'credits_added')
+
+
+def _as_date(value):
+    # func.date() returns a date on Postgres and an ISO string on SQLite
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def _upsert(increments):
+    """Add {(user_id, day): {column: delta}} to the rollup table; caller commits"""
+    if not increments:
+        return
+    rows = []
+    for (user_id, day), deltas in increments.items():
+        row = dict.fromkeys(COUNTER_COLUMNS, 0)
+        row.update(deltas)
+        row.update(user_id=user_id, day=day)
+        rows.append(row)
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        insert = None
+
+    if insert is None:
+        # Portable fallback: update, then insert the days that had no row yet
+        for row in rows:
+            result = db.session.execute(
+                update(DailyRollup)
+                .where(DailyRollup.user_id == row['user_id'], DailyRollup.day == row['day'])
+                .values({column: getattr(DailyRollup, column) + row[column] for column in COUNTER_COLUMNS})
+            )
+            if result.rowcount == 0:
+                db.session.add(DailyRollup(**row))
+        return
+
+    # Chunked to stay under the bind-parameter limit during a full rebuild
+    for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+        stmt = insert(DailyRollup).values(rows[start:start + UPSERT_BATCH_SIZE])
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['user_id', 'day'],
+            set_={column: getattr(DailyRollup, column) + stmt.excluded[column] for column in COUNTER_COLUMNS}
+        ))
+
+
+def _analysis_deltas(row, sign=1):
+    verdict = (row.get('verdict') or 'UNCERTAIN').upper()
+    return {
+        'analyses': sign,
+        _VERDICT_COLUMNS.get(verdict, 'uncertain_count'): sign,
+        'confidence_sum': sign * (row.get('confidence') or 0)
+    }
+
+
+def record_analyses(rows, sign=1):
+    """Count AnalysisHistory row values into their day's rollup; caller commits"""
+    increments = defaultdict(lambda: defaultdict(int))
+    for row in rows:
+        day = (row.get('timestamp') or datetime.utcnow()).date()
+        for column, delta in _analysis_deltas(row, sign).items():
+            increments[(row['user_id'], day)][column] += delta
+    _upsert(increments)
+
+
+def remove_analysis(analysis):
+    """Take a deleted analysis back out of its day's rollup; caller commits"""
+    record_analyses([{
+        'user_id': analysis.user_id,
+        'timestamp': analysis.timestamp,
+        'verdict': analysis.verdict,
+        'confidence': analysis.confidence
+    }], sign=-1)
+
+
+def _credit_deltas(transaction_type, amount):
+    if transaction_type == 'deduct':
+        return {'credits_spent': amount}
+    if transaction_type == 'refund':
+        return {'credits_spent': -amount}
+    return {'credits_added': amount}
+
+
+def record_transaction(user_id, transaction_type, amount, when=None):
+    """Count a credit transaction into its day's rollup; caller commits"""
+    day = (when or datetime.utcnow()).date()
+    _upsert({(user_id, day): _credit_deltas(transaction_type, amount)})
+
+
+def timeseries(user_id, days):
+    """Daily points for the last `days` UTC days, oldest first, zero-filled"""
+    today = datetime.utcnow().date()
+    start = today - timedelta(days=days - 1)
+    rollups = {
+        rollup.day: rollup for rollup in DailyRollup.query.filter(
+            DailyRollup.user_id == user_id,
+            DailyRollup.day >= start
+        )
+    }
+    series = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        rollup = rollups.get(day) or DailyRollup(user_id=user_id, day=day,
+                                                 **dict.fromkeys(COUNTER_COLUMNS, 0))
+        series.append(rollup.to_dict())
+    return series
+
+
+def rebuild(user_id=None):
+    """Recompute rollups from analysis_history and credit_transactions in one transaction"""
+    scope = [DailyRollup.user_id == user_id] if user_id else []
+    db.session.execute(delete(DailyRollup).where(*scope))
+
+    verdict = func.upper(AnalysisHistory.verdict)
+    day = func.date(AnalysisHistory.timestamp)
+    query = select(
+        AnalysisHistory.user_id, day.label('day'),
+        func.count().label('analyses'),
+        *[func.sum(case((verdict == name, 1), else_=0)).label(column)
+          for name, column in _VERDICT_COLUMNS.items() if name != 'UNCERTAIN'],
+        func.sum(case((verdict.in_(['REAL', 'FAKE', 'MISLEADING']), 0), else_=1)).label('uncertain_count'),
+        func.coalesce(func.sum(AnalysisHistory.confidence), 0).label('confidence_sum')
+    ).group_by(AnalysisHistory.user_id, day)
+    if user_id:
+        query = query.where(AnalysisHistory.user_id == user_id)
+
+    increments = defaultdict(lambda: defaultdict(int))
+    for row in db.session.execute(query).mappings():
+        key = (row['user_id'], _as_date(row['day']))
+        for column in ('analyses', 'real_count', 'fake_count', 'misleading_count', 'uncertain_count',
+                       'confidence_sum'):
+            increments[key][column] += int(row[column] or 0)
+
+    tx_day = func.date(CreditTransaction.created_at)
+    query = select(
+        CreditTransaction.user_id, tx_day.label('day'), CreditTransaction.transaction_type,
+        func.sum(CreditTransaction.credits_amount).label('amount')
+    ).group_by(CreditTransaction.user_id, tx_day, CreditTransaction.transaction_type)
+    if user_id:
+        query = query.where(CreditTransaction.user_id == user_id)
+
+    for row in db.session.execute(query).mappings():
+        key = (row['user_id'], _as_date(row['day']))
+        for column, delta in _credit_deltas(row['transaction_type'], int(row['amount'] or 0)).items():
+            increments[key][column] += delta
+
+    _upsert(increments)
+    if user_id:
+        response_cache.bump(user_id)
+    else:
+        response_cache.bump_all()
+    db.session.commit()
+    return len(increments)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Maintain per-user daily dashboard rollups")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    rebuild_parser = subparsers.add_parser('rebuild', help='Recompute rollups from history')
+    rebuild_parser.add_argument('--user-id', type=int, help='Only this user (default: everyone)')
+    args = parser.parse_args()
+
+    import migrate
+    from NewsScope import app
+
+    with app.app_context():
+        migrate.require_current()
+        print("🔄 Rebuilding daily rollups...")
+        days = rebuild(args.user_id)
+        print("\n📊 Rollup Summary:")
+        print(f"   • User-days written: {days}")
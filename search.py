@@ -0,0 +1,146 @@
+"""
+Full-text search over a user's analysis history
+Postgres uses a GIN index on a tsvector expression over headline, summary,
+key_claims and news_text. SQLite (local development) uses an external-content
+FTS5 table kept in sync by triggers. Results are ranked and paginated with an
+opaque keyset cursor of (score, id), so deep pages cost the same as the first.
+The index, FTS table and triggers are created by migrations/0004_search_index.py.
+"""
+
+import base64
+import json
+import re
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import text
+
+from models import db, AnalysisHistory
+
+MAX_PER_PAGE = 50
+
+# Must match the indexed expression exactly for Postgres to use the GIN index
+_PG_DOCUMENT = (
+    "to_tsvector('english', coalesce(headline, '') || ' ' || coalesce(summary, '') || ' ' || "
+    "coalesce(key_claims::text, '') || ' ' || coalesce(news_text, ''))"
+)
+
+
+class SearchError(ValueError):
+    """Invalid search parameters"""
+
+
+def encode_cursor(score, analysis_id):
+    raw = json.dumps([score, analysis_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        score, analysis_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return float(score), int(analysis_id)
+    except (ValueError, TypeError):
+        raise SearchError("Invalid cursor")
+
+
+def _parse_date(value, name):
+    """(naive UTC datetime, whether the value was a date without a time)"""
+    value = value.strip()
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise SearchError(f"Invalid {name} date, expected ISO format (YYYY-MM-DD)")
+    if parsed.tzinfo is not None:
+        # timestamp is stored as naive UTC
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed, 'T' not in value and ' ' not in value
+
+
+def _filters(params, user_id):
+    """SQL conditions and bind values shared by both search backends"""
+    conditions = ["h.user_id = :user_id"]
+    values = {'user_id': user_id}
+
+    verdicts = [v.strip().upper() for v in (params.get('verdict') or '').split(',') if v.strip()]
+    if verdicts:
+        names = [f'verdict_{i}' for i in range(len(verdicts))]
+        conditions.append(f"h.verdict IN ({', '.join(':' + name for name in names)})")
+        values.update(zip(names, verdicts))
+
+    for param, op in (('min_confidence', '>='), ('max_confidence', '<=')):
+        if params.get(param) not in (None, ''):
+            try:
+                values[param] = int(params[param])
+            except ValueError:
+                raise SearchError(f"{param} must be an integer")
+            conditions.append(f"h.confidence {op} :{param}")
+
+    if params.get('from'):
+        values['from_date'], _ = _parse_date(params['from'], 'from')
+        conditions.append("h.timestamp >= :from_date")
+    if params.get('to'):
+        values['to_date'], date_only = _parse_date(params['to'], 'to')
+        if date_only:
+            # to=YYYY-MM-DD includes the whole of that day
+            values['to_date'] += timedelta(days=1)
+            conditions.append("h.timestamp < :to_date")
+        else:
+            conditions.append("h.timestamp <= :to_date")
+
+    return conditions, values
+
+
+def search_history(user_id, params):
+    """Return (analyses with scores, next cursor) for a user's search"""
+    query = (params.get('q') or '').strip()
+    if not query:
+        raise SearchError("Search query 'q' is required")
+
+    try:
+        limit = min(max(int(params.get('per_page', 20)), 1), MAX_PER_PAGE)
+    except ValueError:
+        raise SearchError("per_page must be an integer")
+
+    conditions, values = _filters(params, user_id)
+    values['limit'] = limit + 1
+
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        values['query'] = query
+        inner = f"""
+            SELECT h.id, ts_rank({_PG_DOCUMENT}, q)::float8 AS score
+            FROM analysis_history h, websearch_to_tsquery('english', :query) q
+            WHERE {_PG_DOCUMENT} @@ q AND {' AND '.join(conditions)}
+        """
+    elif dialect == 'sqlite':
+        # Quote every term so user input can't use FTS5 query syntax
+        terms = re.findall(r'\w+', query)
+        if not terms:
+            raise SearchError("Search query must contain a word")
+        values['query'] = ' '.join(f'"{term}"' for term in terms)
+        inner = f"""
+            SELECT h.id, -bm25(analysis_history_fts) AS score
+            FROM analysis_history_fts JOIN analysis_history h ON h.id = analysis_history_fts.rowid
+            WHERE analysis_history_fts MATCH :query AND {' AND '.join(conditions)}
+        """
+    else:
+        raise SearchError(f"Full-text search is not available for {dialect}")
+
+    keyset = ""
+    if params.get('cursor'):
+        values['cursor_score'], values['cursor_id'] = decode_cursor(params['cursor'])
+        keyset = "WHERE score < :cursor_score OR (score = :cursor_score AND id < :cursor_id)"
+
+    rows = db.session.execute(text(f"""
+        SELECT id, score FROM ({inner}) ranked
+        {keyset}
+        ORDER BY score DESC, id DESC
+        LIMIT :limit
+    """), values).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].score, rows[-1].id)
+
+    by_id = {a.id: a for a in AnalysisHistory.query.filter(AnalysisHistory.id.in_([r.id for r in rows])).all()}
+    results = [(by_id[r.id], r.score) for r in rows if r.id in by_id]
+    return results, next_cursor
@@ -0,0 +1,145 @@
+"""
+Fast JSON encoding for API responses
+JSONProvider is installed as app.json. It encodes with orjson when the
+package is installed and falls back to the stdlib json module otherwise.
+Datetimes are written as ISO 8601 by both, so views can pass them through
+instead of calling isoformat() per field.
+
+The row serializers build the list-view dicts for AnalysisHistory,
+CreditTransaction and PaymentOrder straight from Core result rows, skipping
+ORM object construction and attribute instrumentation. Their output matches
+the models' to_dict().
+"""
+
+import json
+from datetime import date, datetime
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import func, select
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from archive import PREVIEW_LENGTH
+from history import load_details
+from models import AnalysisHistory, CreditTransaction, PaymentOrder
+
+
+def _default(obj):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    return DefaultJSONProvider.default(obj)
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask JSON provider using orjson when available; keys stay sorted like the default provider"""
+
+    default = staticmethod(_default)
+
+    def _orjson_dumps(self, obj, indent=False):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs.keys() - {'indent', 'separators'}:
+            try:
+                return self._orjson_dumps(obj, kwargs.get('indent')).decode('utf-8')
+            except orjson.JSONEncodeError:
+                # e.g. integers wider than 64 bits; json handles them
+                pass
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            try:
+                return orjson.loads(s)
+            except orjson.JSONDecodeError:
+                # Let json decide, so edge cases and error messages stay the same
+                pass
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        try:
+            body = self._orjson_dumps(obj, indent)
+        except orjson.JSONEncodeError:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+
+class RowSerializer:
+    """Turns Core rows selected with select() into API dicts"""
+
+    __slots__ = ('columns', 'fields')
+
+    def __init__(self, *columns):
+        self.columns = columns
+        self.fields = tuple(column.key for column in columns)
+
+    def select(self):
+        return select(*self.columns)
+
+    def __call__(self, rows):
+        fields = self.fields
+        return [dict(zip(fields, row)) for row in rows]
+
+
+class AnalysisSerializer(RowSerializer):
+    """List-view dicts for analysis_history rows, with their red flags, claims and sources"""
+
+    __slots__ = ()
+
+    def __call__(self, rows):
+        details = load_details(rows)
+        items = []
+        for row in rows:
+            news_text = row.news_text or ''
+            entry = details[row.id]
+            items.append({
+                'id': row.id,
+                'timestamp': row.timestamp.isoformat() + 'Z' if row.timestamp else None,
+                'headline': row.headline,
+                'news_text': news_text[:PREVIEW_LENGTH] + '...' if len(news_text) > PREVIEW_LENGTH else news_text,
+                'verdict': row.verdict,
+                'confidence': row.confidence,
+                'summary': row.summary,
+                'detailed_analysis': row.detailed_analysis,
+                'red_flags': entry['red_flags'],
+                'key_claims': entry['key_claims'],
+                'sources_checked': entry['sources_checked'],
+                'source_url': row.source_url,
+                'archived': row.archived_at is not None
+            })
+        return items
+
+
+analysis_rows = AnalysisSerializer(
+    AnalysisHistory.id, AnalysisHistory.timestamp, AnalysisHistory.headline,
+    # One character past the preview is enough to know whether to add '...'
+    func.substr(AnalysisHistory.news_text, 1, PREVIEW_LENGTH + 1).label('news_text'),
+    AnalysisHistory.verdict, AnalysisHistory.confidence, AnalysisHistory.summary,
+    AnalysisHistory.detailed_analysis, AnalysisHistory.red_flags, AnalysisHistory.key_claims,
+    AnalysisHistory.sources_checked, AnalysisHistory.source_url, AnalysisHistory.archived_at
+)
+
+transaction_rows = RowSerializer(
+    CreditTransaction.id, CreditTransaction.transaction_type, CreditTransaction.credits_amount,
+    CreditTransaction.credits_before, CreditTransaction.credits_after, CreditTransaction.description,
+    CreditTransaction.payment_id, CreditTransaction.order_id, CreditTransaction.amount_paid,
+    CreditTransaction.created_at
+)
+
+order_rows = RowSerializer(
+    PaymentOrder.id, PaymentOrder.order_id, PaymentOrder.amount, PaymentOrder.currency,
+    PaymentOrder.credits_amount, PaymentOrder.status, PaymentOrder.payment_id,
+    PaymentOrder.created_at, PaymentOrder.updated_at
+)
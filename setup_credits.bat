@@ -20,7 +20,7 @@ echo.
 
 REM Step 2: Run database migration
 echo [Step 2] Running database migration...
-python migrate_credits.py
+python migrate.py upgrade
 if %ERRORLEVEL% EQU 0 (
     echo [SUCCESS] Migration completed successfully
 ) else (
@@ -21,7 +21,7 @@ echo ""
 
 # Step 2: Run database migration
 echo "🗄️  Step 2: Running database migration..."
-python migrate_credits.py
+python migrate.py upgrade
 if [ $? -eq 0 ]; then
     echo "✅ Migration completed successfully"
 else
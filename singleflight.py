@@ -0,0 +1,191 @@
+"""
+Request coalescing for identical analyses
+When many users submit the same article at once, only the first request
+calls Gemini; concurrent duplicates wait for its result. Threads in the same
+worker share a result through an in-memory call table, and workers coordinate
+through a lease row in the analysis_leases table, read and written on its
+own connection rather than the caller's session.
+"""
+
+import copy
+import hashlib
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+import metrics
+from models import db, AnalysisLease
+
+# How long a leader may hold a lease before others assume it died
+LEASE_TTL = int(os.getenv('SINGLEFLIGHT_LEASE_TTL', 120))
+# How long a finished result stays available to late duplicates
+RESULT_TTL = int(os.getenv('SINGLEFLIGHT_RESULT_TTL', 30))
+# How long a duplicate waits for the leader before analyzing on its own
+WAIT_TIMEOUT = float(os.getenv('SINGLEFLIGHT_WAIT_TIMEOUT', 90))
+POLL_INTERVAL = float(os.getenv('SINGLEFLIGHT_POLL_INTERVAL', 0.5))
+
+_whitespace = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    """Lowercase and collapse whitespace so trivially different pastes match"""
+    return _whitespace.sub(' ', (text or '').lower()).strip()
+
+
+def article_hash(news_text, headline=""):
+    """Stable key for an article's normalized headline and body"""
+    normalized = f"{normalize_text(headline)}\n{normalize_text(news_text)}"
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def url_key(normalized_url):
+    """Key for a canonical article URL; hashed so it fits the 64-character lease key"""
+    return "url:" + hashlib.sha256(normalized_url.encode('utf-8')).hexdigest()[:60]
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run a function once per key, sharing its result with concurrent callers"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Return (result, shared); shared is True when another request did the work"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            metrics.increment('singleflight.coalesced_local')
+            if not call.event.wait(WAIT_TIMEOUT):
+                return fn(), False
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result), True
+
+        try:
+            call.result, shared = self._do_across_workers(key, fn)
+            return copy.deepcopy(call.result), shared
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            call.event.set()
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def _do_across_workers(self, key, fn):
+        owner = f"{os.getpid()}:{uuid.uuid4().hex[:16]}"
+        deadline = time.monotonic() + WAIT_TIMEOUT
+
+        while True:
+            with db.engine.connect() as conn:
+                lease = conn.execute(
+                    select(AnalysisLease.owner, AnalysisLease.status, AnalysisLease.result,
+                           AnalysisLease.expires_at)
+                    .where(AnalysisLease.key == key)
+                ).first()
+            now = datetime.utcnow()
+
+            if lease is None:
+                if self._create_lease(key, owner, now):
+                    break
+                continue
+
+            if lease.status == 'done' and lease.expires_at > now:
+                metrics.increment('singleflight.coalesced_remote')
+                return lease.result, True
+
+            if lease.expires_at <= now:
+                # Finished result went stale, leader failed, or leader died: take over
+                if self._take_over(key, lease.owner, owner, now):
+                    break
+                continue
+
+            if time.monotonic() >= deadline:
+                metrics.increment('singleflight.wait_timeout')
+                return fn(), False
+
+            time.sleep(POLL_INTERVAL)
+
+        return self._lead(key, owner, fn), False
+
+    def _create_lease(self, key, owner, now):
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(insert(AnalysisLease).values(
+                    key=key,
+                    owner=owner,
+                    status='running',
+                    created_at=now,
+                    expires_at=now + timedelta(seconds=LEASE_TTL)
+                ))
+        except IntegrityError:
+            return False
+
+        # Opportunistically clear out leases nobody will read again
+        with db.engine.begin() as conn:
+            conn.execute(delete(AnalysisLease).where(AnalysisLease.expires_at < now - timedelta(hours=1)))
+        return True
+
+    def _take_over(self, key, previous_owner, owner, now):
+        with db.engine.begin() as conn:
+            result = conn.execute(
+                update(AnalysisLease)
+                .where(
+                    AnalysisLease.key == key,
+                    AnalysisLease.owner == previous_owner,
+                    AnalysisLease.expires_at <= now
+                )
+                .values(
+                    owner=owner,
+                    status='running',
+                    result=None,
+                    created_at=now,
+                    expires_at=now + timedelta(seconds=LEASE_TTL)
+                )
+            )
+        return result.rowcount == 1
+
+    def _lead(self, key, owner, fn):
+        try:
+            result = fn()
+        except BaseException:
+            # Also release on KeyboardInterrupt so a resumed batch run doesn't wait out the lease
+            self._finish(key, owner, status='failed', result=None, ttl=0)
+            raise
+        self._finish(key, owner, status='done', result=result, ttl=RESULT_TTL)
+        return result
+
+    def _finish(self, key, owner, status, result, ttl):
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(
+                    update(AnalysisLease)
+                    .where(AnalysisLease.key == key, AnalysisLease.owner == owner)
+                    .values(
+                        status=status,
+                        result=result,
+                        expires_at=datetime.utcnow() + timedelta(seconds=ttl)
+                    )
+                )
+        except Exception as e:
+            print(f"Error releasing analysis lease: {str(e)}")
+
+
+singleflight = SingleFlight()
@@ -78,7 +78,9 @@ export const authApi = {
 
 // News Analysis API
 export interface AnalyzeRequest {
-  text: string;
+  text?: string;
+  headline?: string;
+  url?: string;
 }
 
 export interface AnalyzeResponse {
@@ -102,6 +104,7 @@ export interface AnalyzeResponse {
     }>;
     total_sources_checked: number;
     ai_model: string;
+    source_url?: string | null;
   };
   error?: string;
   message?: string;
@@ -137,6 +140,10 @@ export const dashboardApi = {
     return apiCall('/api/dashboard');
   },
 
+  async getTimeseries(range: string = '30d') {
+    return apiCall(`/api/dashboard/timeseries?range=${encodeURIComponent(range)}`);
+  },
+
   async getHistory(page: number = 1, perPage: number = 10) {
     return apiCall(`/api/history?page=${page}&per_page=${perPage}`);
   },
@@ -148,9 +155,20 @@ export const dashboardApi = {
   },
 
   async deleteAllAnalyses() {
-    return apiCall('/api/history', {
+    const result = await apiCall('/api/history', {
       method: 'DELETE',
     });
+
+    // Deletion runs as a background job; wait for it so the dashboard refreshes empty
+    let job = result.job;
+    while (job && (job.status === 'pending' || job.status === 'running')) {
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+      job = (await apiCall(`/api/history/purge/${job.id}`)).job;
+    }
+    if (job && job.status === 'failed') {
+      throw new Error(job.error || 'Failed to delete analyses');
+    }
+    return result;
   },
 };
 
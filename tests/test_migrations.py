@@ -0,0 +1,209 @@
+"""
+Tests for migrate.py and the migrations in migrations/
+Each test starts from an empty database. They run against a temporary
+SQLite file by default; set TEST_DATABASE_URL to run them against Postgres
+instead. The database is wiped (DROP SCHEMA public CASCADE), so point it at
+a scratch database:
+
+    python -m pytest -q tests
+    DB_SSLMODE=disable TEST_DATABASE_URL=postgresql+psycopg2://postgres@localhost/newsscope_test \
+        python -m pytest -q tests
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SQLITE_PATH = os.path.join(tempfile.mkdtemp(), 'test_migrations.db')
+DATABASE_URL = os.getenv('TEST_DATABASE_URL') or f'sqlite:///{SQLITE_PATH}'
+os.environ['DATABASE_URL'] = DATABASE_URL
+
+from sqlalchemy import (  # noqa: E402
+    JSON, Boolean, Column, DateTime, ForeignKey, Integer, MetaData, String, Table, Text, inspect
+)
+
+import NewsScope  # noqa: E402
+import analysis_cache  # noqa: E402
+import migrate  # noqa: E402
+from models import db, AnalysisHistory, AnalysisLease, AnalysisRedFlag, SchemaMigration, User  # noqa: E402
+from search import search_history  # noqa: E402
+from singleflight import singleflight, url_key  # noqa: E402
+
+# The two tables as db.create_all() made them before any migration existed
+legacy = MetaData()
+legacy_users = Table(
+    'users', legacy,
+    Column('id', Integer, primary_key=True),
+    Column('email', String(120), unique=True, nullable=False),
+    Column('name', String(100), nullable=False),
+    Column('password_hash', String(255), nullable=False),
+    Column('created_at', DateTime),
+    Column('last_login', DateTime),
+    Column('is_active', Boolean),
+    Column('reset_token', String(100)),
+    Column('reset_token_expiry', DateTime)
+)
+legacy_history = Table(
+    'analysis_history', legacy,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, ForeignKey('users.id'), nullable=False),
+    Column('timestamp', DateTime),
+    Column('headline', Text),
+    Column('news_text', Text, nullable=False),
+    Column('verdict', String(20), nullable=False),
+    Column('confidence', Integer, nullable=False),
+    Column('summary', Text),
+    Column('detailed_analysis', Text),
+    Column('red_flags', JSON),
+    Column('key_claims', JSON),
+    Column('sources_checked', JSON)
+)
+
+LEGACY_ROWS = 12
+
+
+def _wipe():
+    db.session.remove()
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql("DROP SCHEMA public CASCADE")
+            conn.exec_driver_sql("CREATE SCHEMA public")
+    else:
+        db.engine.dispose()
+        if os.path.exists(SQLITE_PATH):
+            os.remove(SQLITE_PATH)
+    db.engine.dispose()
+
+
+@pytest.fixture
+def app_context():
+    with NewsScope.app.app_context():
+        _wipe()
+        yield
+        _wipe()
+
+
+def _seed_legacy():
+    legacy.create_all(db.engine)
+    with db.engine.begin() as conn:
+        conn.execute(legacy_users.insert().values(id=1, email='legacy@newsscope.test', name='Legacy',
+                                                  password_hash='x'))
+        conn.execute(legacy_history.insert(), [{
+            'user_id': 1,
+            'headline': f"Climate report {i}",
+            'news_text': "Officials confirmed the report on Tuesday.",
+            'verdict': 'REAL',
+            'confidence': 80,
+            'red_flags': [f"flag {i}"],
+            'key_claims': [f"claim {i}"],
+            'sources_checked': [{'name': 'Reuters', 'url': 'https://reuters.com', 'credibility': 'high'}]
+        } for i in range(LEGACY_ROWS)])
+
+
+def _upgrade(**kwargs):
+    kwargs.setdefault('pause', 0)
+    return migrate.upgrade(**kwargs)
+
+
+def test_upgrade_creates_schema_on_empty_database(app_context):
+    versions = [migration.version for migration in migrate.load_migrations()]
+    assert migrate.pending() == versions
+
+    assert _upgrade() == versions
+    assert migrate.pending() == []
+    tables = set(inspect(db.engine).get_table_names())
+    assert {table.name for table in db.metadata.sorted_tables} <= tables
+
+    # A second run has nothing to do
+    assert _upgrade() == []
+
+
+def test_plan_changes_nothing(app_context):
+    _seed_legacy()
+    planned = _upgrade(plan=True)
+
+    assert planned == [migration.version for migration in migrate.load_migrations()]
+    assert not inspect(db.engine).has_table(SchemaMigration.__tablename__)
+    assert 'credits' not in {column['name'] for column in inspect(db.engine).get_columns('users')}
+
+
+def test_require_current(app_context):
+    with pytest.raises(SystemExit):
+        migrate.require_current()
+    _upgrade()
+    migrate.require_current()
+
+
+def test_upgrade_legacy_database(app_context):
+    _seed_legacy()
+    _upgrade(batch_size=5)
+
+    user = db.session.get(User, 1)
+    assert (user.credits, user.credits_used) == (5, 0)
+
+    # 0006 moved red flags and sources into the detail tables
+    assert AnalysisRedFlag.query.count() == LEGACY_ROWS
+    assert AnalysisHistory.query.filter(AnalysisHistory.sources_checked.isnot(None)).count() == 0
+    assert db.session.get(SchemaMigration, '0006').progress['analysis_details'] > 0
+
+    indexes = {index['name'] for index in inspect(db.engine).get_indexes('analysis_history')}
+    assert {'ix_analysis_history_source_url', 'ix_analysis_history_archived_at',
+            'ix_analysis_history_user_timestamp'} <= indexes
+    assert 'ix_analysis_history_user_id' not in indexes
+
+    # 0004 indexed the rows written before it ran
+    results, _ = search_history(1, {'q': 'climate', 'per_page': 50})
+    assert len(results) == LEGACY_ROWS
+
+
+def test_interrupted_backfill_resumes(app_context, monkeypatch):
+    _seed_legacy()
+    load_migrations = migrate.load_migrations
+    calls = []
+
+    def interrupted():
+        migrations = load_migrations()
+        for migration in migrations:
+            if migration.version == '0006':
+                real = migration.module.migrate_batch
+
+                def migrate_batch(after_id, batch_size):
+                    calls.append(after_id)
+                    if len(calls) == 2:
+                        raise RuntimeError("killed")
+                    return real(after_id, batch_size)
+
+                migration.module.migrate_batch = migrate_batch
+        return migrations
+
+    monkeypatch.setattr(migrate, 'load_migrations', interrupted)
+    with pytest.raises(RuntimeError):
+        _upgrade(batch_size=5)
+    db.session.rollback()
+
+    record = db.session.get(SchemaMigration, '0006')
+    assert record.status == 'running'
+    assert AnalysisRedFlag.query.count() == 5
+
+    monkeypatch.setattr(migrate, 'load_migrations', load_migrations)
+    _upgrade(batch_size=5)
+    db.session.expire_all()
+    assert db.session.get(SchemaMigration, '0006').status == 'applied'
+    assert AnalysisRedFlag.query.count() == LEGACY_ROWS
+
+
+def test_url_keys_fit_migrated_columns(app_context):
+    _upgrade()
+    key = url_key('https://example.com/' + '/'.join(['a-long-article-slug'] * 20))
+
+    result, shared = singleflight.do(key, lambda: {'verdict': 'REAL'})
+    assert (result, shared) == ({'verdict': 'REAL'}, False)
+    assert db.session.get(AnalysisLease, key).status == 'done'
+
+    analysis_cache.put([key], {'verdict': 'REAL'})
+    assert analysis_cache.get(key) == {'verdict': 'REAL'}
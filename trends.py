@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Platform-wide trends in red flags, claims and source categories
+New analysis_history rows are folded, in id order, into one Space-Saving
+summary per hour and dimension. Each summary keeps at most TRENDS_CAPACITY
+counters however many analyses arrive, and buckets older than
+TRENDS_RETENTION_HOURS are dropped, so storage stays bounded. A watermark row
+records the last analysis folded in. It advances in the same transaction as
+the buckets, so every analysis is counted exactly once even with several
+runners.
+
+Configuration:
+    TRENDS_CAPACITY            Counters kept per hour and dimension (default 500)
+    TRENDS_BATCH_SIZE          Analyses folded per transaction (default 1000)
+    TRENDS_RETENTION_HOURS     Hours of buckets kept (default 720)
+    TRENDS_CATCHUP_ROWS        Most analyses a trends read folds in (default 200)
+
+Usage (e.g. from cron):
+    python trends.py run        Fold every new analysis into the buckets
+    python trends.py top [--hours 24] [--dimension red_flags]
+"""
+
+import argparse
+import os
+import re
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+
+from history import load_details
+from models import db, AnalysisHistory, TrendBucket, TrendState
+
+TRENDS_CAPACITY = int(os.getenv('TRENDS_CAPACITY', 500))
+TRENDS_BATCH_SIZE = int(os.getenv('TRENDS_BATCH_SIZE', 1000))
+TRENDS_RETENTION_HOURS = int(os.getenv('TRENDS_RETENTION_HOURS', 720))
+# Rows the admin endpoint may fold in before answering when cron has fallen behind
+TRENDS_CATCHUP_ROWS = int(os.getenv('TRENDS_CATCHUP_ROWS', 200))
+TRENDS_SETTLE_SECONDS = 60
+MAX_ITEM_LENGTH = 160
+
+DIMENSIONS = ('red_flags', 'claims', 'categories')
+
+_punctuation = re.compile(r'[^\w\s%$.-]+')
+_whitespace = re.compile(r'\s+')
+
+
+class SpaceSaving:
+    """Space-Saving heavy-hitter summary (Metwally et al.)
+
+    Tracks at most `capacity` items. A new item arriving when the summary is
+    full replaces the smallest counter and inherits its count as error, so
+    counts are upper bounds and count - error is a lower bound.
+    """
+
+    def __init__(self, capacity=TRENDS_CAPACITY, counters=None):
+        self.capacity = capacity
+        self.counters = {item: list(value) for item, value in (counters or {}).items()}
+
+    def add(self, item, weight=1):
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += weight
+        elif len(self.counters) < self.capacity:
+            self.counters[item] = [weight, 0]
+        else:
+            smallest = min(self.counters, key=lambda key: self.counters[key][0])
+            floor = self.counters.pop(smallest)[0]
+            self.counters[item] = [floor + weight, floor]
+
+    def _floor(self):
+        # Untracked items may have occurred up to this many times
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(count for count, _ in self.counters.values())
+
+    def merge(self, other):
+        """Fold another summary into this one, keeping the bounds valid"""
+        own_floor, other_floor = self._floor(), other._floor()
+        merged = {}
+        for item in set(self.counters) | set(other.counters):
+            count, error = self.counters.get(item, [own_floor, own_floor])
+            other_count, other_error = other.counters.get(item, [other_floor, other_floor])
+            merged[item] = [count + other_count, error + other_error]
+        largest = sorted(merged.items(), key=lambda entry: entry[1][0], reverse=True)[:self.capacity]
+        self.counters = dict(largest)
+
+    def top(self, k):
+        """[(item, count, error)] for the k largest counters"""
+        ranked = sorted(self.counters.items(), key=lambda entry: entry[1][0], reverse=True)[:k]
+        return [(item, count, error) for item, (count, error) in ranked]
+
+
+def normalize_item(text):
+    """Lowercase, drop most punctuation and collapse whitespace so rephrasings share a key"""
+    text = _punctuation.sub(' ', str(text or '').lower())
+    return _whitespace.sub(' ', text).strip(' .-')[:MAX_ITEM_LENGTH]
+
+
+def _items(details):
+    """Normalized items per dimension for one analysis, each counted once"""
+    red_flags = {normalize_item(flag) for flag in details['red_flags']}
+    claims = {normalize_item(claim) for claim in details['key_claims']}
+    categories = {normalize_item(source.get('type')) for source in details['sources_checked']
+                  if isinstance(source, dict) and source.get('type')}
+    return {
+        'red_flags': red_flags - {''},
+        'claims': claims - {''},
+        'categories': categories - {''}
+    }
+
+
+def _state():
+    state = db.session.get(TrendState, 1)
+    if state is None:
+        try:
+            db.session.add(TrendState(id=1, last_analysis_id=0))
+            db.session.commit()
+        except IntegrityError:
+            # Another runner created it first
+            db.session.rollback()
+        state = db.session.get(TrendState, 1)
+    return state
+
+
+def fold_batch(batch_size=TRENDS_BATCH_SIZE):
+    """Fold the next batch of analyses into the hourly buckets; returns rows folded"""
+    state = _state()
+    db.session.refresh(state)
+    last_id = state.last_analysis_id
+
+    rows = db.session.execute(
+        select(
+            AnalysisHistory.id, AnalysisHistory.timestamp, AnalysisHistory.red_flags,
+            AnalysisHistory.key_claims, AnalysisHistory.sources_checked
+        )
+        .where(AnalysisHistory.id > last_id)
+        .order_by(AnalysisHistory.id)
+        .limit(batch_size)
+    ).all()
+    # Ids can commit out of order; stop before very recent rows so an id still
+    # in flight isn't skipped when the watermark moves past it
+    settled = datetime.utcnow() - timedelta(seconds=TRENDS_SETTLE_SECONDS)
+    for index, row in enumerate(rows):
+        if row.timestamp and row.timestamp > settled:
+            rows = rows[:index]
+            break
+    if not rows:
+        db.session.rollback()
+        return 0
+
+    # Summarize the batch in memory first, then merge once per touched bucket
+    details = load_details(rows)
+    batch = defaultdict(lambda: SpaceSaving())
+    analyses = defaultdict(int)
+    totals = defaultdict(int)
+    for row in rows:
+        hour = (row.timestamp or datetime.utcnow()).replace(minute=0, second=0, microsecond=0)
+        for dimension, items in _items(details[row.id]).items():
+            analyses[(hour, dimension)] += 1
+            for item in items:
+                batch[(hour, dimension)].add(item)
+                totals[(hour, dimension)] += 1
+
+    for (hour, dimension), count in analyses.items():
+        bucket = db.session.get(TrendBucket, (hour, dimension))
+        summary = batch.get((hour, dimension)) or SpaceSaving()
+        if bucket is None:
+            db.session.add(TrendBucket(hour=hour, dimension=dimension, counters=summary.counters,
+                                       total=totals[(hour, dimension)], analyses=count))
+            continue
+        stored = SpaceSaving(counters=bucket.counters)
+        stored.merge(summary)
+        bucket.counters = stored.counters
+        bucket.total += totals[(hour, dimension)]
+        bucket.analyses += count
+
+    # Advancing the watermark conditionally makes a concurrent runner's batch roll back
+    result = db.session.execute(
+        update(TrendState)
+        .where(TrendState.id == 1, TrendState.last_analysis_id == last_id)
+        .values(last_analysis_id=rows[-1].id, updated_at=datetime.utcnow())
+    )
+    if result.rowcount != 1:
+        db.session.rollback()
+        return 0
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        return 0
+    return len(rows)
+
+
+def run(max_rows=None, batch_size=TRENDS_BATCH_SIZE):
+    """Fold new analyses until caught up (or max_rows); returns rows folded"""
+    folded = 0
+    while max_rows is None or folded < max_rows:
+        count = fold_batch(batch_size if max_rows is None else min(batch_size, max_rows - folded))
+        if not count:
+            break
+        folded += count
+
+    cutoff = datetime.utcnow() - timedelta(hours=TRENDS_RETENTION_HOURS)
+    TrendBucket.query.filter(TrendBucket.hour < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return folded
+
+
+def catch_up(max_rows=TRENDS_CATCHUP_ROWS):
+    """Fold at most max_rows for a reader, unless a fold ran within the settle window
+
+    Folding is the cron job's work; this only keeps a read fresh when cron has
+    fallen behind. The watermark row's updated_at is shared by every worker,
+    so once any runner has folded, readers skip until the window passes.
+    """
+    recent = datetime.utcnow() - timedelta(seconds=TRENDS_SETTLE_SECONDS)
+    state = db.session.get(TrendState, 1)
+    if state is not None and state.updated_at and state.updated_at > recent:
+        return 0
+
+    folded = 0
+    while folded < max_rows:
+        count = fold_batch(min(TRENDS_BATCH_SIZE, max_rows - folded))
+        if not count:
+            break
+        folded += count
+    return folded
+
+
+def _summarize(buckets, dimension):
+    summary = SpaceSaving()
+    analyses = 0
+    for bucket in buckets:
+        if bucket.dimension != dimension:
+            continue
+        summary.merge(SpaceSaving(counters=bucket.counters))
+        analyses += bucket.analyses
+    return summary, analyses
+
+
+def top_trends(hours=24, limit=20, dimensions=DIMENSIONS):
+    """Top items per dimension over the last `hours`, with growth against the hours before"""
+    now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    start = now - timedelta(hours=hours - 1)
+    previous_start = start - timedelta(hours=hours)
+    buckets = TrendBucket.query.filter(
+        TrendBucket.hour >= previous_start,
+        TrendBucket.dimension.in_(dimensions)
+    ).all()
+    current = [bucket for bucket in buckets if bucket.hour >= start]
+    previous = [bucket for bucket in buckets if bucket.hour < start]
+
+    results = {}
+    for dimension in dimensions:
+        summary, analyses = _summarize(current, dimension)
+        previous_summary, previous_analyses = _summarize(previous, dimension)
+        items = []
+        for item, count, error in summary.top(limit):
+            before = previous_summary.counters.get(item, [0, 0])[0]
+            items.append({
+                'item': item,
+                'count': count,
+                'min_count': count - error,
+                'share': round(count / analyses, 4) if analyses else 0,
+                'previous_count': before,
+                # Smoothed ratio so items that were absent before don't divide by zero
+                'growth': round((count + 1) / (before + 1), 2)
+            })
+        results[dimension] = {
+            'analyses': analyses,
+            'previous_analyses': previous_analyses,
+            'top': items
+        }
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Aggregate platform-wide trends")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('run', help='Fold new analyses into the hourly buckets')
+    top_parser = subparsers.add_parser('top', help='Print the current top items')
+    top_parser.add_argument('--hours', type=int, default=24)
+    top_parser.add_argument('--limit', type=int, default=10)
+    top_parser.add_argument('--dimension', choices=DIMENSIONS)
+    args = parser.parse_args()
+
+    import migrate
+    from NewsScope import app
+
+    with app.app_context():
+        migrate.require_current()
+        if args.command == 'run':
+            folded = run()
+            print("\n📊 Trends Summary:")
+            print(f"   • Analyses folded: {folded}")
+            print(f"   • Watermark: analysis {_state().last_analysis_id}")
+        else:
+            dimensions = [args.dimension] if args.dimension else DIMENSIONS
+            for dimension, result in top_trends(args.hours, args.limit, dimensions).items():
+                print(f"\n📈 {dimension} ({result['analyses']} analyses, last {args.hours}h):")
+                for entry in result['top']:
+                    print(f"   • {entry['count']:>6}  x{entry['growth']:<6} {entry['item']}")